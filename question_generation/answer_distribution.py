@@ -0,0 +1,40 @@
+# keeps the answer counts of a template for the rejection sampling of do_dfs
+
+from bisect import bisect_right
+from typing import Dict, Hashable, Iterable, List
+
+"""
+do_dfs (in generation mode) rejects a final state if its answer is already much more frequent than
+the others, which needs the median and the second largest of the answer counts. Instead of sorting
+the counts for every final state, the counts are kept sorted: incrementing the last occurrence of a
+count in the sorted list keeps it sorted, so an increment costs one binary search and the order
+statistics are plain lookups.
+"""
+
+
+class AnswerDistribution:
+    def __init__(self, answers: Iterable[Hashable]) -> None:
+        self.counts: Dict[Hashable, int] = {a: 0 for a in answers}
+        self._sorted: List[int] = [0] * len(self.counts)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __getitem__(self, answer: Hashable) -> int:
+        return self.counts[answer]
+
+    def add(self, answer: Hashable) -> None:
+        count = self.counts[answer]
+        self.counts[answer] = count + 1
+        self._sorted[bisect_right(self._sorted, count) - 1] = count + 1
+
+    def median(self) -> int:
+        return self._sorted[len(self._sorted) // 2]
+
+    def second_largest(self) -> int:
+        return self._sorted[-2]
+
+    def reset(self) -> None:
+        for answer in self.counts:
+            self.counts[answer] = 0
+        self._sorted = [0] * len(self.counts)
@@ -0,0 +1,345 @@
+# benchmark for the explanation generation, which runs fully offline on synthetic scenes
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+from treelib.exceptions import DuplicatedNodeIdError
+
+from custom_types import Metadata, Scene_Struct, Synonyms, Template
+from explanations import use_instantiated_template
+from explanation_engine import TEMPLATE_ORDER
+from synthesize import empty_answer_counts, instantiate_template, synthesize
+from synthetic_scenes import generate_scene
+
+"""
+Benchmarks use_instantiated_template for each of the template families in TEMPLATE_ORDER.
+
+No CLEVR download is needed: for every family, synthetic scenes (c.f. synthetic_scenes.py)
+with a controllable number of objects are created and questions are instantiated on them with the question generation DFS
+(do_dfs in dfs mode) and the question text templates. The resulting questions and programs
+have the same layout as the ones in CLEVR_*_questions.json and are then explained, while
+the time of the whole call and of each of its stages is recorded.
+
+With --synthesis, the throughput of synthesize.py (question generation and explanation, in
+questions per second and core) is measured on the synthetic scenes instead and compared against
+--target_questions_per_second.
+
+Example:
+    python benchmark.py --num_scenes 20 --num_objects 10 --output_json bench.json
+    python benchmark.py --synthesis --num_scenes 200 --num_workers 4
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--metadata_file", default="metadata.json")
+parser.add_argument("--synonyms_json", default="synonyms.json")
+parser.add_argument("--template_dir", default="CLEVR_1.0_templates")
+parser.add_argument(
+    "--families",
+    default=None,
+    nargs="+",
+    help="Template families (e.g. zero_hop.json) to benchmark. Defaults to all of TEMPLATE_ORDER.",
+)
+parser.add_argument(
+    "--num_scenes",
+    default=10,
+    type=int,
+    help="Number of synthetic scenes per family. Each template of the family is instantiated once per scene.",
+)
+parser.add_argument(
+    "--num_objects", default=10, type=int, help="Number of objects per synthetic scene"
+)
+parser.add_argument("--seed", default=43, type=int)
+parser.add_argument(
+    "--skip_memory",
+    action="store_true",
+    help="Skip the (slow) second pass that measures the peak memory with tracemalloc",
+)
+parser.add_argument(
+    "--synthesis",
+    action="store_true",
+    help="Benchmark the synthesis of new questions (c.f. synthesize.py) instead",
+)
+parser.add_argument(
+    "--num_workers",
+    default=1,
+    type=int,
+    help="Number of processes for --synthesis",
+)
+parser.add_argument(
+    "--target_questions_per_second",
+    default=None,
+    type=float,
+    help="Throughput target of --synthesis in questions per second and core. The exit code is 1 if it is missed.",
+)
+parser.add_argument(
+    "--output_json",
+    default=None,
+    help="Optionally write the results to this file, e.g. to compare runs",
+)
+
+
+def load_resources(
+    metadata_file: str, synonyms_json: str, template_dir: str
+) -> Tuple[Metadata, Synonyms, Dict[Tuple[str, int], Template]]:
+    """loads metadata, synonyms and the templates (keyed by (filename, index)) just like generate_explanations.main"""
+    with open(metadata_file, "r") as f:
+        metadata = json.load(f)
+    metadata["_functions_by_name"] = {f["name"]: f for f in metadata["functions"]}
+
+    with open(synonyms_json, "r") as f:
+        synonyms = json.load(f)
+
+    templates = {}
+    for fn in TEMPLATE_ORDER:
+        with open(os.path.join(template_dir, fn), "r") as f:
+            for i, template in enumerate(json.load(f)):
+                templates[(fn, i)] = template
+    return metadata, synonyms, templates
+
+
+def synthesize_question(
+    scene_struct: Scene_Struct,
+    template: Template,
+    template_info: Tuple[str, int],
+    question_family_index: int,
+    metadata: Metadata,
+    synonyms: Synonyms,
+) -> Optional[Dict]:
+    """instantiates the template on the scene and returns it in the layout of CLEVR_*_questions.json (or None)"""
+    questions = instantiate_template(
+        scene_struct,
+        template,
+        template_info,
+        question_family_index,
+        metadata,
+        synonyms,
+        empty_answer_counts(template, metadata, len(scene_struct["objects"])),
+    )
+    return questions[0] if len(questions) > 0 else None
+
+
+def build_workload(
+    family: str,
+    metadata: Metadata,
+    synonyms: Synonyms,
+    templates: Dict[Tuple[str, int], Template],
+    num_scenes: int,
+    num_objects: int,
+) -> List[Tuple[Scene_Struct, Tuple[str, int], Dict]]:
+    """creates (scene, template_info, question) triples for all templates of a family"""
+    workload = []
+    for scene_idx in range(num_scenes):
+        scene_struct = generate_scene(metadata, num_objects, scene_idx, "benchmark")
+        for family_index, (key, template) in enumerate(templates.items()):
+            if key[0] != family:
+                continue
+            question = synthesize_question(
+                scene_struct, template, key, family_index, metadata, synonyms
+            )
+            if question is not None:
+                workload.append((scene_struct, key, question))
+    return workload
+
+
+def run_workload(workload, metadata, synonyms, templates, timings=None) -> int:
+    """explains all questions of the workload and returns the number of explained questions"""
+    explained = 0
+    for scene_struct, key, question in workload:
+        template = templates[key]
+        try:
+            use_instantiated_template(
+                scene_struct,
+                template,
+                question,
+                metadata,
+                empty_answer_counts(template, metadata, len(scene_struct["objects"])),
+                synonyms,
+                key,
+                max_instances=1,
+                timings=timings,
+            )
+            explained += 1
+        except DuplicatedNodeIdError:
+            pass
+    return explained
+
+
+def benchmark_family(
+    family: str,
+    metadata: Metadata,
+    synonyms: Synonyms,
+    templates: Dict[Tuple[str, int], Template],
+    num_scenes: int,
+    num_objects: int,
+    measure_memory: bool = True,
+) -> Dict:
+    workload = build_workload(
+        family, metadata, synonyms, templates, num_scenes, num_objects
+    )
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    explained = run_workload(workload, metadata, synonyms, templates, timings)
+    total = time.perf_counter() - start
+
+    result = {
+        "family": family,
+        "questions": explained,
+        "seconds": total,
+        "questions_per_second": explained / total if total > 0 else 0.0,
+        "stage_ms_per_question": {
+            stage: 1000 * seconds / max(explained, 1)
+            for stage, seconds in timings.items()
+        },
+    }
+
+    if measure_memory:
+        # a separate pass, as tracing the allocations distorts the timings
+        tracemalloc.start()
+        run_workload(workload, metadata, synonyms, templates)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_memory_mib"] = peak / 2**20
+
+    return result
+
+
+def benchmark_synthesis(
+    metadata: Metadata,
+    families: Optional[List[str]],
+    num_scenes: int,
+    num_objects: int,
+    num_workers: int,
+    seed: int,
+    metadata_file: str,
+    synonyms_json: str,
+    template_dir: str,
+) -> Dict:
+    scenes = [
+        generate_scene(metadata, num_objects, scene_idx, "benchmark")
+        for scene_idx in range(num_scenes)
+    ]
+    start = time.perf_counter()
+    samples = synthesize(
+        scenes,
+        metadata_file,
+        synonyms_json,
+        template_dir,
+        families=families,
+        num_workers=num_workers,
+        seed=seed,
+    )
+    total = time.perf_counter() - start
+    return {
+        "scenes": num_scenes,
+        "questions": len(samples),
+        "workers": num_workers,
+        "seconds": total,
+        "questions_per_second_per_core": len(samples) / total / num_workers,
+    }
+
+
+def print_results(results: List[Dict]) -> None:
+    # keep the stages in the order in which they are run
+    stages = list(dict.fromkeys(s for r in results for s in r["stage_ms_per_question"]))
+    header = ["family", "questions", "q/s", "peak MiB"] + [f"{s} ms" for s in stages]
+    rows = [header]
+    for r in results:
+        rows.append(
+            [
+                r["family"],
+                str(r["questions"]),
+                f"{r['questions_per_second']:.1f}",
+                f"{r['peak_memory_mib']:.1f}" if "peak_memory_mib" in r else "-",
+            ]
+            + [f"{r['stage_ms_per_question'].get(s, 0.0):.2f}" for s in stages]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main(args):
+    random.seed(args.seed)
+    metadata, synonyms, templates = load_resources(
+        args.metadata_file, args.synonyms_json, args.template_dir
+    )
+
+    if args.synthesis:
+        result = benchmark_synthesis(
+            metadata,
+            args.families,
+            args.num_scenes,
+            args.num_objects,
+            args.num_workers,
+            args.seed,
+            args.metadata_file,
+            args.synonyms_json,
+            args.template_dir,
+        )
+        print(
+            "%d questions on %d scenes in %.1fs: %.1f questions/s/core"
+            % (
+                result["questions"],
+                result["scenes"],
+                result["seconds"],
+                result["questions_per_second_per_core"],
+            )
+        )
+        target = args.target_questions_per_second
+        if target is not None:
+            result["target_questions_per_second"] = target
+            result["meets_target"] = result["questions_per_second_per_core"] >= target
+            if not result["meets_target"]:
+                print("below the target of %.1f questions/s/core" % target)
+        if args.output_json is not None:
+            with open(args.output_json, "w") as f:
+                json.dump(
+                    {"num_objects": args.num_objects, "seed": args.seed, **result},
+                    f,
+                    indent=2,
+                )
+        return [result]
+
+    families = args.families if args.families is not None else TEMPLATE_ORDER
+    results = []
+    for family in families:
+        results.append(
+            benchmark_family(
+                family,
+                metadata,
+                synonyms,
+                templates,
+                args.num_scenes,
+                args.num_objects,
+                measure_memory=not args.skip_memory,
+            )
+        )
+
+    print_results(results)
+
+    if args.output_json is not None:
+        with open(args.output_json, "w") as f:
+            json.dump(
+                {
+                    "num_scenes": args.num_scenes,
+                    "num_objects": args.num_objects,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    results = main(parser.parse_args())
+    sys.exit(0 if all(r.get("meets_target", True) for r in results) else 1)
@@ -0,0 +1,230 @@
+# compares two generated CLEVR-X explanation files, e.g. to verify that a release is reproduced
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from multiprocessing import Pool
+from typing import Any, Dict, List, Tuple
+
+from tqdm import tqdm
+
+from explanations_reader import ExplanationsReader
+
+"""
+Both files are indexed and memory-mapped (c.f. explanations_reader.py). The samples are aligned by
+question_index (or by position if the files have no question indices) and compared in chunks by a
+pool of processes. The explanations are compared as sets, since their order is not deterministic
+between generation runs. All other keys (e.g. the program) are compared exactly.
+
+Example:
+    python compare_datasets.py --published CLEVR_val_explanations_v0.7.10.json \\
+        --reproduced CLEVR_val_explanations_v0.7.13.json --report diff.json
+
+The exit code is 1 if the datasets differ.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--published", required=True, help="Explanations file to compare with"
+)
+parser.add_argument("--reproduced", required=True, help="Explanations file to check")
+parser.add_argument(
+    "--ignore_keys",
+    default="counter_factual_explanation",
+    help="Comma separated keys of the samples, which are not compared",
+)
+parser.add_argument("--num_workers", default=os.cpu_count(), type=int)
+parser.add_argument("--chunk_size", default=10000, type=int)
+parser.add_argument(
+    "--num_shown", default=10, type=int, help="Number of differences to print"
+)
+parser.add_argument("--report", default=None, help="Writes a json report to this file")
+
+Alignment = List[Tuple[int, int]]
+
+
+def align(
+    published: ExplanationsReader, reproduced: ExplanationsReader
+) -> Tuple[Alignment, List[int], List[int]]:
+    """
+    Returns the aligned positions and the positions of the samples, which are only in the published
+    or the reproduced file. Several samples of a question are aligned by their order.
+    """
+
+    def keys(reader: ExplanationsReader) -> List[Tuple[int, int]]:
+        question_indices = reader.index["question_index"].tolist()
+        if -1 in question_indices:
+            return [(position, 0) for position in range(len(reader))]
+        occurrences: Counter = Counter()
+        result = []
+        for question_index in question_indices:
+            result.append((question_index, occurrences[question_index]))
+            occurrences[question_index] += 1
+        return result
+
+    reproduced_positions = {key: p for p, key in enumerate(keys(reproduced))}
+    aligned = []
+    only_published = []
+    for position, key in enumerate(keys(published)):
+        if key in reproduced_positions:
+            aligned.append((position, reproduced_positions.pop(key)))
+        else:
+            only_published.append(position)
+    return aligned, only_published, sorted(reproduced_positions.values())
+
+
+# the keys whose lists are compared as sets
+EXPLANATION_KEYS = ("factual_explanation", "counter_factual_explanation")
+
+
+def normalize(key: str, value: Any) -> Any:
+    """the explanations become sets (of their json encoded elements)"""
+    if key in EXPLANATION_KEYS and isinstance(value, list):
+        return frozenset(json.dumps(v, sort_keys=True) for v in value)
+    return value
+
+
+def compare_samples(
+    published: Dict, reproduced: Dict, ignore_keys: List[str]
+) -> Dict[str, List[Any]]:
+    """the differing keys of both samples with the published and reproduced value"""
+    differences = {}
+    for key in dict.fromkeys([*published, *reproduced]):
+        if key in ignore_keys:
+            continue
+        p, r = published.get(key), reproduced.get(key)
+        if p != r and normalize(key, p) != normalize(key, r):
+            differences[key] = [p, r]
+    return differences
+
+
+def family(sample: Dict) -> str:
+    if "template_filename" in sample:
+        return f'{sample["template_filename"]} {sample.get("question_family_index")}'
+    return str(sample.get("question_family_index"))
+
+
+def compare_chunk(
+    args: Tuple[Alignment, List[str], str, str],
+) -> Tuple[int, List[Dict]]:
+    """compares the aligned samples, returns their number and the differences"""
+    alignment, ignore_keys, published_path, reproduced_path = args
+    differences = []
+    # the indices are current, so opening the readers only maps the files
+    with ExplanationsReader(published_path) as published, ExplanationsReader(
+        reproduced_path
+    ) as reproduced:
+        for p, r in alignment:
+            published_sample, reproduced_sample = published[p], reproduced[r]
+            differing_keys = compare_samples(
+                published_sample, reproduced_sample, ignore_keys
+            )
+            if len(differing_keys) > 0:
+                differences.append(
+                    {
+                        "published_position": p,
+                        "reproduced_position": r,
+                        "question_index": published_sample.get("question_index"),
+                        "family": family(published_sample),
+                        "differences": differing_keys,
+                    }
+                )
+    return len(alignment), differences
+
+
+def compare_datasets(
+    published_path: str,
+    reproduced_path: str,
+    ignore_keys: List[str] = ["counter_factual_explanation"],
+    num_workers: int = 1,
+    chunk_size: int = 10000,
+) -> Dict:
+    """returns the report of the comparison"""
+    # the indices are built once here instead of in every worker
+    with ExplanationsReader(published_path) as published, ExplanationsReader(
+        reproduced_path
+    ) as reproduced:
+        aligned, only_published, only_reproduced = align(published, reproduced)
+        num_published, num_reproduced = len(published), len(reproduced)
+
+    chunks = [
+        (aligned[i : i + chunk_size], ignore_keys, published_path, reproduced_path)
+        for i in range(0, len(aligned), chunk_size)
+    ]
+    differences: List[Dict] = []
+    with tqdm(total=len(aligned)) as progress:
+        if num_workers > 1:
+            with Pool(num_workers) as pool:
+                for num_compared, chunk_differences in pool.imap(compare_chunk, chunks):
+                    differences.extend(chunk_differences)
+                    progress.update(num_compared)
+        else:
+            for chunk in chunks:
+                num_compared, chunk_differences = compare_chunk(chunk)
+                differences.extend(chunk_differences)
+                progress.update(num_compared)
+
+    return {
+        "published": published_path,
+        "reproduced": reproduced_path,
+        "num_published": num_published,
+        "num_reproduced": num_reproduced,
+        "num_compared": len(aligned),
+        "num_different": len(differences),
+        "only_published": only_published,
+        "only_reproduced": only_reproduced,
+        "different_per_family": dict(
+            Counter(d["family"] for d in differences).most_common()
+        ),
+        "differences": differences,
+    }
+
+
+def print_summary(report: Dict, num_shown: int) -> None:
+    print(
+        "Compared %d samples (%d published, %d reproduced)"
+        % (report["num_compared"], report["num_published"], report["num_reproduced"])
+    )
+    print("Only in the published file: %d" % len(report["only_published"]))
+    print("Only in the reproduced file: %d" % len(report["only_reproduced"]))
+    print("Different samples: %d" % report["num_different"])
+    for name, count in report["different_per_family"].items():
+        print(f"    {name}: {count}")
+    for difference in report["differences"][:num_shown]:
+        print(
+            "---- Found a difference (question %s, %s) ----"
+            % (difference["question_index"], difference["family"])
+        )
+        for key, (published, reproduced) in difference["differences"].items():
+            print(f"{key}:")
+            print(f"    published:  {published}")
+            print(f"    reproduced: {reproduced}")
+
+
+def is_identical(report: Dict) -> bool:
+    return (
+        report["num_different"] == 0
+        and len(report["only_published"]) == 0
+        and len(report["only_reproduced"]) == 0
+    )
+
+
+def main(args) -> int:
+    report = compare_datasets(
+        args.published,
+        args.reproduced,
+        [key for key in args.ignore_keys.split(",") if key != ""],
+        args.num_workers,
+        args.chunk_size,
+    )
+    print_summary(report, args.num_shown)
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if is_identical(report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(parser.parse_args()))
@@ -4,6 +4,29 @@
 # https://stackoverflow.com/questions/12151182/python-precondition-postcondition-for-member-function-how
 
 import functools
+import itertools
+import os
+
+# Contract levels: "full" checks every call, "sampled" every SAMPLE_EVERY-th call of a function and "off" none.
+# The level is read from the environment (e.g. CLEVRX_CONTRACTS=off python generate_explanations.py).
+# With "off" at import time, the decorators return the functions untouched, so the checks cost nothing.
+# Otherwise the level can be changed at runtime with set_contract_level (e.g. --contracts of generate_explanations).
+# Sampling counts the calls, it does not use the random state of the generation.
+LEVELS = ("off", "sampled", "full")
+_level = os.environ.get("CLEVRX_CONTRACTS", "sampled")
+assert _level in LEVELS, "CLEVRX_CONTRACTS must be one of %s" % (LEVELS,)
+SAMPLE_EVERY = int(os.environ.get("CLEVRX_CONTRACTS_SAMPLE_EVERY", 64))
+
+
+def contract_level():
+    return _level
+
+
+def set_contract_level(level):
+    """changes the level of the functions decorated so far (unless they were decorated with "off") and of all later ones"""
+    global _level
+    assert level in LEVELS, "level must be one of %s" % (LEVELS,)
+    _level = level
 
 
 def condition(pre_condition=None, post_condition=None):
@@ -25,12 +48,19 @@ def condition(pre_condition=None, post_condition=None):
     """
 
     def decorator(func):
+        if _level == "off":
+            return func
+        calls = itertools.count()
+
         @functools.wraps(func)  # presever name, docstring, etc
         def wrapper(*args, **kwargs):  # NOTE: no self
-            if pre_condition is not None:
+            check = _level == "full" or (
+                _level == "sampled" and next(calls) % SAMPLE_EVERY == 0
+            )
+            if check and pre_condition is not None:
                 assert pre_condition(*args, **kwargs), "Pre-Condition was not met!"
             retval = func(*args, **kwargs)  # call original function or method
-            if post_condition is not None:
+            if check and post_condition is not None:
                 assert post_condition(retval), "Post-Condition was not met!"
             return retval
 
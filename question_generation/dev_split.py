@@ -5,6 +5,9 @@ import random
 from random import shuffle
 import argparse, json, os
 
+from explanations_reader import ExplanationsReader
+from split_engine import split_paths, write_splits
+
 # This is the same seed as used in the rest of the repository.
 random.seed(43)
 
@@ -14,6 +17,81 @@ parser.add_argument("--split", default="train")
 parser.add_argument("--case", default="")
 parser.add_argument("--version", default="v0.7.10")
 parser.add_argument("--rel_dev_size", default=0.2)
+parser.add_argument(
+    "--streaming",
+    action="store_true",
+    help="Write both splits in a single pass over the samples instead of loading all of them",
+)
+
+
+def select_dev_images(image_indices, rel_dev_size):
+    """
+    Shuffles the images (in order of their first sample) and returns the dev and train images.
+
+    Args:
+        image_indices (Iterable[int]): The image index of each sample in file order.
+        rel_dev_size (float): The relative size of the resulting dev set.
+    """
+    # the split needs to be based on the images
+    all_images = list(set(image_indices))
+    shuffle(all_images)
+
+    # sample the dev set away
+    dev_images = set(all_images[: int(len(all_images) * rel_dev_size)])
+    remaining_train_images = set(all_images) - set(dev_images)
+    return dev_images, remaining_train_images
+
+
+def save_image_ids(features_path, split, case, new_version, images):
+    image_ids_path = f"{features_path}/CLEVR_{split}{case}_images_ids_{new_version}.pkl"
+    assert not os.path.exists(image_ids_path), "new image_ids file already exists!"
+    with open(
+        image_ids_path, "wb"
+    ) as f2:
+        pickle.dump(images, f2)
+
+
+def in_memory_split(all_data, features_path, case, new_version, rel_dev_size):
+    data = all_data["questions"]
+    dev_images, remaining_train_images = select_dev_images(
+        (d["image_index"] for d in data), rel_dev_size
+    )
+
+    # save the splits as new dataset pickle files
+    for split, images in zip(["dev", "train"], [dev_images, remaining_train_images]):
+        print(f"Processing {split}...")
+        # select the subset of the data
+        subset_data = [d for d in data if d["image_index"] in images]
+        assert len(subset_data) > 0
+
+        # save the subset of data
+        new_file_path = f"{features_path}/CLEVR_{split}{case}_explanations_{new_version}.json"
+        assert not os.path.exists(new_file_path), "newly splitted file already exists!"
+        with open(new_file_path, "w") as f:
+            all_new_data = {
+                "info": all_data["info"],
+                "questions": subset_data,
+            }
+            json.dump(all_new_data, f)
+
+        # save the ids
+        save_image_ids(features_path, split, case, new_version, images)
+
+
+def streaming_split(reader, features_path, case, new_version, rel_dev_size):
+    """
+    Writes the dev and train subsets in one pass over the samples, which are decoded one at a time
+    (c.f. explanations_reader.py). The outputs are identical to the ones of in_memory_split.
+    """
+    print("Processing dev and train...")
+    image_indices = reader.index["image_index"].tolist()
+    dev_images, remaining_train_images = select_dev_images(image_indices, rel_dev_size)
+    num_samples = write_splits(
+        reader,
+        {"dev": dev_images, "train": remaining_train_images},
+        *split_paths(features_path, case, new_version),
+    )
+    assert all(n > 0 for n in num_samples.values())
 
 
 def dev_split_function(
@@ -22,6 +100,7 @@ def dev_split_function(
     case: str = "",
     version: str = "v0.7.10",
     rel_dev_size: float = 0.2,
+    streaming: bool = False,
 ):
     """
     Splits a original CLEVR train subset into a CLEVRX train and dev subsets.add_constant()
@@ -31,6 +110,7 @@ def dev_split_function(
         split (str): The split to load, which will be splited. Only "train" is currently allowed.
         case (str): The case to split, needed for support of CLEVR CoGenT.
         rel_dev_size (float, optional): The relative size of the resulting dev set. 0.2 was used for the published CLEVR-X. Defaults to 0.2.
+        streaming (bool, optional): Writes the splits in one pass instead of loading all samples into memory. Defaults to False.
     """
 
     # BUG: should load the pickle files with the IDs!
@@ -42,11 +122,15 @@ def dev_split_function(
     complete_path = os.path.join(
         features_path, f"CLEVR_{split}{case}_explanations_{version}.json"
     )
-    with open(complete_path) as f:
-        all_data = json.load(f)
-        data = all_data["questions"]
+    if streaming:
+        with ExplanationsReader(complete_path) as reader:
+            num_samples = len(reader)
+    else:
+        with open(complete_path) as f:
+            all_data = json.load(f)
+            num_samples = len(all_data["questions"])
 
-    assert len(data) == 699964, "must load the original train split!"
+    assert num_samples == 699964, "must load the original train split!"
 
     print("Starting to split original CLEVR train into CLEVRX train and dev!")
     # the "recut" appendix indicataes it is a version which has been recutted. It is also used to detect the dev has to be used.
@@ -54,38 +138,12 @@ def dev_split_function(
     assert new_version != version, "must save with new version name!"
     print(f"New version name is: {new_version}")
 
-    # the split needs to be based on the images
-    all_images = list(set(d["image_index"] for d in data))
-    shuffle(all_images)
-
-    # sample the dev set away
-    dev_images = set(all_images[: int(len(all_images) * rel_dev_size)])
-    remaining_train_images = set(all_images) - set(dev_images)
-
-    # save the splits as new dataset pickle files
-    for split, images in zip(["dev", "train"], [dev_images, remaining_train_images]):
-        print(f"Processing {split}...")
-        # select the subset of the data
-        subset_data = [d for d in data if d["image_index"] in images]
-        assert len(subset_data) > 0
-
-        # save the subset of data
-        new_file_path = f"{features_path}/CLEVR_{split}{case}_explanations_{new_version}.json"
-        assert not os.path.exists(new_file_path), "newly splitted file already exists!"
-        with open(new_file_path, "w") as f:
-            all_new_data = {
-                "info": all_data["info"],
-                "questions": subset_data,
-            }
-            json.dump(all_new_data, f)
-
-        # save the ids
-        image_ids_path = f"{features_path}/CLEVR_{split}{case}_images_ids_{new_version}.pkl"
-        assert not os.path.exists(image_ids_path), "new image_ids file already exists!"
-        with open(
-            image_ids_path, "wb"
-        ) as f2:
-            pickle.dump(images, f2)
+    if streaming:
+        # the index is current, so reopening the reader only maps the files again
+        with ExplanationsReader(complete_path) as reader:
+            streaming_split(reader, features_path, case, new_version, rel_dev_size)
+    else:
+        in_memory_split(all_data, features_path, case, new_version, rel_dev_size)
 
     # Copy val split with new name, so future runs can use the new version name without code changes.
     print(f"Processing val...")
@@ -108,4 +166,5 @@ if __name__ == "__main__":
         case=args.case,
         version=args.version,
         rel_dev_size=args.rel_dev_size,
+        streaming=args.streaming,
     )
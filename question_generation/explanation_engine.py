@@ -0,0 +1,308 @@
+# loads the resources once and explains questions on demand, optionally served over localhost http
+
+import argparse
+import json
+import os
+import random
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from treelib.exceptions import DuplicatedNodeIdError
+
+from answer_distribution import AnswerDistribution
+from custom_types import Metadata, Scene_Struct, Synonyms, Template
+from explanations import QuestionSearch, realize_question, search_question
+from id_handling import register_template
+from scene_context import group_questions_by_image, index_scenes, scene_context
+from realization_cache import RealizationCache
+from sub_program_cache import SubProgramCache
+
+if TYPE_CHECKING:
+    from http.server import HTTPServer
+
+"""
+generate_explanations.py loads metadata, templates and synonyms on every run. The
+ExplanationEngine loads them once and explains single questions or batches of questions:
+
+    engine = ExplanationEngine()
+    explanations = engine.explain(question, scene)
+    batch = engine.explain_batch(questions, scenes)
+
+A question is a sample of CLEVR_*_questions.json and a scene a scene graph of
+CLEVR_*_scenes.json. The result for a question is the list of its factual explanations (as in the
+"factual_explanation" key of the output of generate_explanations.py).
+
+The engine can also be served over localhost http (POST the json payloads to /explain and
+/explain_batch, c.f. request_explanations):
+
+    python explanation_engine.py --port 8765
+
+As the generation uses the global random state, requests are handled one after the other.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--metadata_file", default="metadata.json")
+parser.add_argument("--synonyms_json", default="synonyms.json")
+parser.add_argument("--template_dir", default="CLEVR_1.0_templates")
+parser.add_argument("--instances_per_template", default=1, type=int)
+parser.add_argument("--seed", default=43, type=int)
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", default=8765, type=int)
+
+TEMPLATE_ORDER = [
+    "compare_integer.json",
+    "comparison.json",
+    "three_hop.json",
+    "single_and.json",
+    "same_relate.json",
+    "single_or.json",
+    "one_hop.json",
+    "two_hop.json",
+    "zero_hop.json",
+]
+
+Template_Key = Tuple[str, int]
+
+
+def load_metadata(metadata_file: str) -> Metadata:
+    with open(metadata_file, "r") as f:
+        metadata = json.load(f)
+        dataset = metadata["dataset"]
+        if dataset != "CLEVR-v1.0":
+            raise ValueError('Unrecognized dataset "%s"' % dataset)
+
+    functions_by_name = {}
+    for f in metadata["functions"]:
+        functions_by_name[f["name"]] = f
+    metadata["_functions_by_name"] = functions_by_name
+    return metadata
+
+
+def load_templates(template_dir: str) -> Dict[Template_Key, Template]:
+    """
+    Key is (filename, file_idx). This does not look at the templates which are actually present,
+    but using the template order is important so the matching of question to template is correct
+    """
+    templates = {}
+    for fn in TEMPLATE_ORDER:
+        with open(os.path.join(template_dir, fn), "r") as f:
+            for i, template in enumerate(json.load(f)):
+                templates[(fn, i)] = template
+                register_template(template)
+    return templates
+
+
+class ExplanationEngine:
+    def __init__(
+        self,
+        metadata_file: str = "metadata.json",
+        synonyms_json: str = "synonyms.json",
+        template_dir: str = "CLEVR_1.0_templates",
+        instances_per_template: int = 1,
+        sub_program_cache_size: int = 0,
+        prune_counterfactuals: bool = False,
+        verbose: bool = False,
+        realization_cache_size: int = 0,
+    ) -> None:
+        self.metadata = load_metadata(metadata_file)
+        self.templates = load_templates(template_dir)
+        self.template_items = list(self.templates.items())
+        with open(synonyms_json, "r") as f:
+            self.synonyms: Synonyms = json.load(f)
+
+        self.instances_per_template = instances_per_template
+        self.prune_counterfactuals = prune_counterfactuals
+        self.verbose = verbose
+        self.cache = None
+        if sub_program_cache_size > 0:
+            self.cache = SubProgramCache(sub_program_cache_size)
+        self.realization_cache = None
+        if realization_cache_size > 0:
+            self.realization_cache = RealizationCache(realization_cache_size)
+        # Maps a template (filename, index) to the distribution of the answers of the questions so
+        # far of that template type (c.f. the rejection sampling in do_dfs)
+        self.answer_distributions = {
+            key: AnswerDistribution(self.template_answers(template))
+            for key, template in self.templates.items()
+        }
+
+    def template_answers(self, template: Template) -> List:
+        node_type_to_dtype = {
+            n["name"]: n["output"] for n in self.metadata["functions"]
+        }
+        final_node_type = template["nodes"][-1]["type"]
+        final_dtype = node_type_to_dtype[final_node_type]
+        answers = self.metadata["types"][final_dtype]
+        if final_dtype == "Bool":
+            answers = [True, False]
+        if final_dtype == "Integer":
+            if self.metadata["dataset"] == "CLEVR-v1.0":
+                answers = list(range(0, 11))
+        return answers
+
+    def reset_counts(self) -> None:
+        for answer_distribution in self.answer_distributions.values():
+            answer_distribution.reset()
+
+    def template_of(self, question: Dict) -> Tuple[Template_Key, Template]:
+        return self.template_items[question["question_family_index"]]
+
+    def search_in_context(
+        self, question: Dict, scene_struct: Scene_Struct, timings: Optional[Dict] = None
+    ) -> QuestionSearch:
+        """the search stage of explain_in_context (c.f. search_results.py)"""
+        key, template = self.template_of(question)
+        return search_question(
+            scene_struct,
+            template,
+            question,
+            self.metadata,
+            self.answer_distributions[key],
+            self.synonyms,
+            key,
+            max_instances=self.instances_per_template,
+            verbose=self.verbose,
+            timings=timings,
+            cache=self.cache,
+            prune_cf=self.prune_counterfactuals,
+        )
+
+    def realize_in_context(
+        self,
+        question: Dict,
+        scene_struct: Scene_Struct,
+        search: QuestionSearch,
+        timings: Optional[Dict] = None,
+        rng=random,
+    ) -> List[List[str]]:
+        """the NLG stage of explain_in_context, draws its random numbers from rng"""
+        key, template = self.template_of(question)
+        return realize_question(
+            scene_struct,
+            template,
+            self.synonyms,
+            search,
+            key,
+            timings=timings,
+            realization_cache=self.realization_cache,
+            rng=rng,
+        )
+
+    def explain_in_context(
+        self, question: Dict, scene_struct: Scene_Struct, timings: Optional[Dict] = None
+    ) -> List[List[str]]:
+        """explains the question, the caches of the scene are managed by the caller (c.f. scene_context)"""
+        search = self.search_in_context(question, scene_struct, timings)
+        return self.realize_in_context(question, scene_struct, search, timings)
+
+    def explain(self, question: Dict, scene_struct: Scene_Struct) -> List[List[str]]:
+        with scene_context(scene_struct, self.metadata):
+            return self.explain_in_context(question, scene_struct)
+
+    def explain_batch(
+        self, questions: Sequence[Dict], scenes: Sequence[Scene_Struct]
+    ) -> List[Optional[List[List[str]]]]:
+        """
+        Explains the questions in order. The result of a question is None if there is no unique
+        scene with its image_filename or if its program is malformed.
+        """
+        results: List[Optional[List[List[str]]]] = [None] * len(questions)
+        scenes_by_filename = index_scenes(scenes)
+        for scene_fn, scene_questions in group_questions_by_image(questions):
+            candidates = scenes_by_filename.get(scene_fn, [])
+            if len(candidates) != 1:
+                continue
+            scene_struct = candidates[0]
+            with scene_context(scene_struct, self.metadata):
+                for i, question in scene_questions:
+                    try:
+                        results[i] = self.explain_in_context(question, scene_struct)
+                    except DuplicatedNodeIdError:
+                        pass
+        return results
+
+
+def make_handler(engine: ExplanationEngine):
+    # the http modules are only imported when the engine is served
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, data: Dict) -> None:
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self.send_json(200, {"templates": len(engine.templates)})
+            else:
+                self.send_json(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length))
+                if self.path == "/explain":
+                    result = engine.explain(payload["question"], payload["scene"])
+                elif self.path == "/explain_batch":
+                    result = engine.explain_batch(
+                        payload["questions"], payload["scenes"]
+                    )
+                else:
+                    self.send_json(404, {"error": f"unknown path {self.path}"})
+                    return
+            except Exception as e:
+                self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+                return
+            self.send_json(200, {"explanations": result})
+
+        def log_message(self, format, *args) -> None:
+            if engine.verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def make_server(
+    engine: ExplanationEngine, host: str = "127.0.0.1", port: int = 8765
+) -> "HTTPServer":
+    from http.server import HTTPServer
+
+    return HTTPServer((host, port), make_handler(engine))
+
+
+def request_explanations(url: str, path: str, payload: Dict):
+    """client for the server, e.g. request_explanations("http://127.0.0.1:8765", "/explain", {"question": ..., "scene": ...})"""
+    from urllib.request import Request, urlopen
+
+    request = Request(
+        url + path,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urlopen(request) as response:
+        return json.loads(response.read())["explanations"]
+
+
+def main(args):
+    random.seed(args.seed)
+    engine = ExplanationEngine(
+        args.metadata_file,
+        args.synonyms_json,
+        args.template_dir,
+        args.instances_per_template,
+    )
+    server = make_server(engine, args.host, args.port)
+    print("Serving explanations on http://%s:%d" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
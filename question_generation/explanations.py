@@ -1,30 +1,27 @@
 # this file holds all the explanation code called form generate_explanations
 
 import copy
+import random
+import time
 from collections import ChainMap
 from random import choice, randint, sample
 from statistics import mean
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from treelib import Node, Tree
 from treelib.exceptions import NodeIDAbsentError
 
-from custom_types import (Answer_Counts, Metadata, Scene_Struct, Synonyms,
-                          Template)
-from id_handling import get_id, keep_attr_items_with_id, remove_id
+from answer_distribution import AnswerDistribution
+from custom_types import Metadata, Scene_Struct, Synonyms, Template
+from id_handling import group_by_id, keep_attr_items_with_id, remove_id
 from new_approach import understand_question
+from nlg_system.clauses import Relation
 from nlg_system.objects import CLEVRObject, Objects
-from nlg_templates.compare_integer import compare_integers_new
-from nlg_templates.comparison import comparison
-from nlg_templates.one_hop import one_hop
-from nlg_templates.same_relate import same_relate
-from nlg_templates.single_and import single_and
-from nlg_templates.single_or import single_or
-from nlg_templates.three_hop import three_hop
-from nlg_templates.two_hop import two_hop
-from nlg_templates.zero_hop import zero_hop
+from nlg_templates.nlg_utils import SentencePlan
 from question_engine import execute_handlers
+from realization_cache import RealizationCache, RealizedPlan, plan_signature
 from search_and_expansion import do_dfs
+from sub_program_cache import SubProgramCache, cache_key
 from text_templating import compute_question_synonyms, fill_in_text_templates
 from utils import create_AST, deepest_node, insert_subtree
 
@@ -65,16 +62,28 @@ def expand_nodes_in_tree(template_ast, node, param_to_type):
     return template_ast
 
 
+def _tick(timings: Optional[Dict[str, float]], stage: str, start: float) -> float:
+    """adds the time passed since start to the given stage (if timings are collected) and returns the current time"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+
 def use_instantiated_template(
     scene_struct: Scene_Struct,
     template: Template,
     question,
     metadata: Metadata,
-    answer_counts: Answer_Counts,
+    answer_counts: AnswerDistribution,
     synonyms: Synonyms,
     template_info,
     max_instances: Optional[int] = None,
     verbose: bool = False,
+    timings: Optional[Dict[str, float]] = None,
+    cache: Optional[SubProgramCache] = None,
+    prune_cf: bool = False,
+    realization_cache: Optional[RealizationCache] = None,
 ) -> List[List[str]]:
     """
   This implementation uses an existing question and does not generate its own question.
@@ -85,7 +94,66 @@ def use_instantiated_template(
   Another problem is, that both templates have similar but not identical node tree structures
 
   Go linearly through them
+
+  If a timings dict is given, the seconds spent in each stage are added to it (used by benchmark.py).
+  If a cache is given, the counterfactual sub-program searches are memoized in it.
+  prune_cf skips counterfactual variants, which cannot match additional objects (c.f. do_dfs).
+  If a realization_cache is given, the realizations of the sentence plans are memoized in it.
+  The question is explained in two steps: search_question and realize_question.
   """
+    search = search_question(
+        scene_struct,
+        template,
+        question,
+        metadata,
+        answer_counts,
+        synonyms,
+        template_info,
+        max_instances,
+        verbose,
+        timings,
+        cache,
+        prune_cf,
+    )
+    return realize_question(
+        scene_struct,
+        template,
+        synonyms,
+        search,
+        template_info,
+        timings,
+        realization_cache,
+    )
+
+
+class QuestionSearch(NamedTuple):
+    """
+    What the NLG needs of the search for a question (c.f. search_question). It does not depend on
+    the NLG, so it can be persisted and realized again (c.f. search_results.py).
+    """
+
+    final_filters: Dict[str, str]
+    # the objects found by each explanation filter and the side inputs of the filter node
+    filter_evidence: List[Tuple[List, Optional[List[str]]]]
+    question_synonyms: Optional[Dict[str, List[str]]]
+
+
+def search_question(
+    scene_struct: Scene_Struct,
+    template: Template,
+    question,
+    metadata: Metadata,
+    answer_counts: AnswerDistribution,
+    synonyms: Synonyms,
+    template_info,
+    max_instances: Optional[int] = None,
+    verbose: bool = False,
+    timings: Optional[Dict[str, float]] = None,
+    cache: Optional[SubProgramCache] = None,
+    prune_cf: bool = False,
+) -> QuestionSearch:
+    """matches the program of the question to its template and runs the explanation filters"""
+    start = time.perf_counter()
     assert scene_struct["image_filename"] == question["image_filename"]
 
     program = question["program"]
@@ -129,6 +197,7 @@ def use_instantiated_template(
                 break
 
     final_states = [{"vals": final_filters, "answer": question["answer"]}]
+    start = _tick(timings, "matching", start)
 
     # Second: Find a counter factual explanations
     explanation_states = run_explanation_filters(
@@ -139,7 +208,11 @@ def use_instantiated_template(
         answer_counts,
         max_instances,
         verbose,
+        cache,
+        prune_cf,
     )
+    start = _tick(timings, "explanation_filters", start)
+
     # Fourth: Actually instantiate the template with the solutions we've found
     # NOTE:
     # This code does not output anything that is needed for the final explanation generation. 
@@ -147,13 +220,7 @@ def use_instantiated_template(
     _, _, _ = fill_in_text_templates(
         final_states, explanation_states, template, synonyms, template_info, question
     )
-
-    placeholder_to_attr: Dict[str, str] = {
-        "<Z>": "size",
-        "<C>": "color",
-        "<M>": "material",
-        "<S>": "shape",
-    }
+    start = _tick(timings, "text_templates", start)
 
     assert len(final_states) == 1
     question_synonyms = {}
@@ -161,13 +228,44 @@ def use_instantiated_template(
         question_synonyms, current_synonyms = compute_question_synonyms(
             synonyms, state, template, question
         )
+    _tick(timings, "question_synonyms", start)
 
-    fn, idx = template_info
+    filter_evidence = [
+        (fse[0]["answer"], fltr[-2].get("side_inputs"))
+        for fse, fltr in explanation_states
+    ]
+    return QuestionSearch(final_filters, filter_evidence, question_synonyms)
+
+
+def realize_question(
+    scene_struct: Scene_Struct,
+    template: Template,
+    synonyms: Synonyms,
+    search: QuestionSearch,
+    template_info,
+    timings: Optional[Dict[str, float]] = None,
+    realization_cache: Optional[RealizationCache] = None,
+    rng=random,
+) -> List[List[str]]:
+    """
+    realizes the explanations of a question from its search. The iters of the sentence plan are
+    sampled with rng (c.f. compute_iters).
+    """
+    start = time.perf_counter()
+    final_filters = search.final_filters
 
     # 1. Scene/Question understanding
     filter_to_objects, filter_to_relation = understand_question(
-        explanation_states, final_filters, synonyms, question_synonyms
+        search.filter_evidence, final_filters, synonyms, search.question_synonyms
     )
+    start = _tick(timings, "understanding", start)
+
+    placeholder_to_attr: Dict[str, str] = {
+        "<Z>": "size",
+        "<C>": "color",
+        "<M>": "material",
+        "<S>": "shape",
+    }
 
     # 2. Uniqueness Refinement (NOTE: Maybe all of this code could move up to the object creation)
     # leaves: List of ids for the given template, which is an output (NOTE: in the templates, we could also have a key "extra_attrs" which maps the id to a list of extra attrs, e.g. "3": ["size"]. More flexible, but also more effort and not really needed atm)
@@ -183,11 +281,12 @@ def use_instantiated_template(
         id_to_drop = choice(leaves)
 
     id_to_attrs = {}
+    filters_by_id = group_by_id(ph for ph, value in final_filters.items() if value != "")
     for id, objects in filter_to_objects.items():
         required_attrs = [
             placeholder_to_attr[remove_id(ph)]
-            for ph, value in final_filters.items()
-            if get_id(ph) == id and value != "" and remove_id(ph) != "<R>"
+            for ph in filters_by_id.get(id, [])
+            if remove_id(ph) != "<R>"
         ]
 
         id_to_attrs[id] = {"required": required_attrs, "extra": extra_attrs}
@@ -213,44 +312,83 @@ def use_instantiated_template(
             )
 
     # now each leaf object knows how describe itself in the given scene
+    start = _tick(timings, "scene_settings", start)
 
     # 3. per question NLG Template
     # 4. Text Realization
+    realized = None
+    if realization_cache is not None:
+        plan_key = plan_signature(
+            template_info, filter_to_objects, filter_to_relation, id_to_attrs
+        )
+        realized = realization_cache.get(plan_key)
+    if realized is None:
+        plan = build_sentence_plan(
+            template_info, filter_to_objects, filter_to_relation, id_to_attrs
+        )
+        realized = RealizedPlan(plan, list(filter_to_objects.values()))
+        if realization_cache is not None:
+            realization_cache.put(plan_key, realized)
+    text_f_expl = [realized.sample(rng)]
+
+    if DROP and drop_mode == "nothing_to_drop":
+        # we just remove the explanations, which makes them easy to filter in pandas later on
+        text_f_expl = [[]]
+
+    # the list set thing removes duplicate explanation
+    assert len(text_f_expl) == 1
+    _tick(timings, "realization", start)
+    return [list(set(text_f_expl[0]))]
+
+
+def build_sentence_plan(
+    template_info: Tuple[str, int],
+    filter_to_objects: Dict[str, Objects],
+    filter_to_relation: Dict[str, Relation],
+    id_to_attrs: Dict[str, Dict[str, List[str]]],
+) -> SentencePlan:
+    """builds the sentence plan of the NLG template of the question family"""
+    fn, idx = template_info
+    # (the NLG template of a family is only imported once a question of the family is explained)
     if fn == "compare_integer.json":
-        text_f_expl = [compare_integers_new(idx, filter_to_objects, filter_to_relation)]
+        from nlg_templates.compare_integer import compare_integers_new
+
+        return compare_integers_new(idx, filter_to_objects, filter_to_relation)
     elif fn == "comparison.json":
-        text_f_expl = [
-            comparison(idx, filter_to_objects, filter_to_relation, id_to_attrs)
-        ]
+        from nlg_templates.comparison import comparison
+
+        return comparison(idx, filter_to_objects, filter_to_relation, id_to_attrs)
     elif fn == "zero_hop.json":
-        text_f_expl = [
-            zero_hop(idx, filter_to_objects, filter_to_relation, id_to_attrs)
-        ]
+        from nlg_templates.zero_hop import zero_hop
+
+        return zero_hop(idx, filter_to_objects, filter_to_relation, id_to_attrs)
     elif fn == "one_hop.json":
-        text_f_expl = [one_hop(idx, filter_to_objects, filter_to_relation, id_to_attrs)]
+        from nlg_templates.one_hop import one_hop
+
+        return one_hop(idx, filter_to_objects, filter_to_relation, id_to_attrs)
     elif fn == "two_hop.json":
-        text_f_expl = [two_hop(idx, filter_to_objects, filter_to_relation)]
+        from nlg_templates.two_hop import two_hop
+
+        return two_hop(idx, filter_to_objects, filter_to_relation)
     elif fn == "three_hop.json":
-        text_f_expl = [three_hop(idx, filter_to_objects, filter_to_relation)]
+        from nlg_templates.three_hop import three_hop
+
+        return three_hop(idx, filter_to_objects, filter_to_relation)
     elif fn == "single_or.json":
-        text_f_expl = [single_or(idx, filter_to_objects, filter_to_relation)]
+        from nlg_templates.single_or import single_or
+
+        return single_or(idx, filter_to_objects, filter_to_relation)
     elif fn == "single_and.json":
-        text_f_expl = [single_and(idx, filter_to_objects, filter_to_relation)]
+        from nlg_templates.single_and import single_and
+
+        return single_and(idx, filter_to_objects, filter_to_relation)
     elif fn == "same_relate.json":
-        text_f_expl = [
-            same_relate(idx, filter_to_objects, filter_to_relation, id_to_attrs)
-        ]
+        from nlg_templates.same_relate import same_relate
+
+        return same_relate(idx, filter_to_objects, filter_to_relation, id_to_attrs)
     else:
         raise NotImplementedError
 
-    if DROP and drop_mode == "nothing_to_drop":
-        # we just remove the explanations, which makes them easy to filter in pandas later on
-        text_f_expl = [[]]
-
-    # the list set thing removes duplicate explanation
-    assert len(text_f_expl) == 1
-    return [list(set(text_f_expl[0]))]
-
 
 def drop_objects(
     objects: Objects, final_filters: Dict, current_id
@@ -302,14 +440,63 @@ def drop_objects(
     return objects, drop_mode
 
 
+def cached_do_dfs(
+    sub_template: Template,
+    metadata: Metadata,
+    scene_struct: Scene_Struct,
+    verbose: bool,
+    answer_counts: AnswerDistribution,
+    max_instances: Optional[int],
+    final_filters: Dict[str, str],
+    cache: Optional[SubProgramCache],
+    prune_cf: bool = False,
+):
+    """do_dfs in counterfactual mode, which looks up the result in cache first"""
+    if cache is None:
+        return do_dfs(
+            sub_template,
+            metadata,
+            scene_struct,
+            verbose,
+            answer_counts,
+            max_instances,
+            final_filters=final_filters,
+            prune_cf=prune_cf,
+        )
+
+    key = (
+        *cache_key(scene_struct, sub_template["nodes"], sub_template, final_filters),
+        prune_cf,
+    )
+    result = cache.get(key)
+    if result is None:
+        result = do_dfs(
+            sub_template,
+            metadata,
+            scene_struct,
+            verbose,
+            answer_counts,
+            max_instances,
+            final_filters=final_filters,
+            prune_cf=prune_cf,
+        )
+        cache.put(key, result)
+
+    # callers reorder the list of states, but must not modify the states themselves
+    e, fse = result
+    return e, list(fse)
+
+
 def run_explanation_filters(
     template: Template,
     final_states,
     metadata: Metadata,
     scene_struct: Scene_Struct,
-    answer_counts: Answer_Counts,
+    answer_counts: AnswerDistribution,
     max_instances: Optional[int],
     verbose: bool = False,
+    cache: Optional[SubProgramCache] = None,
+    prune_cf: bool = False,
 ) -> List:
     """
   If a question contains multiple references to the objects, we need to do cf explanations individually for each of them. So this is a per filter iteration (for which we find all objects which almost match), in contrast to a per object iteration (for which we would find all filters, which almost match the object).
@@ -388,14 +575,16 @@ def run_explanation_filters(
         sub_template["nodes"] = nodes_with_qa
 
         # run the sub template against the engine, reverse the result and append it to the list
-        e, fse = do_dfs(
+        e, fse = cached_do_dfs(
             sub_template,
             metadata,
             scene_struct,
             verbose,
             answer_counts,
             max_instances,
-            final_filters=final_filters,
+            final_filters,
+            cache,
+            prune_cf,
         )
 
         if any(["same" in nid["type"] for nid in nodes_with_qa]):
@@ -406,14 +595,16 @@ def run_explanation_filters(
                         "same", "different"
                     )
             sub_template["nodes"] = nodes_with_qa
-            _, fse_cf = do_dfs(
+            _, fse_cf = cached_do_dfs(
                 sub_template,
                 metadata,
                 scene_struct,
                 verbose,
                 answer_counts,
                 max_instances,
-                final_filters=final_filters,
+                final_filters,
+                cache,
+                prune_cf,
             )
             fse = fse_cf + fse
 
@@ -0,0 +1,257 @@
+# random access to the samples of CLEVR_*_explanations_*.json without loading the whole file
+
+import argparse
+import json
+import os
+import pickle
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from scene_store import map_file, read_arrays, read_header, write_arrays
+
+"""
+The explanation files are a single json object ({"info": ..., "questions": [...]}) of more than
+1 GB. Instead of json.load-ing all of it to read a few samples, the file is scanned once and the
+byte range, image_index and question_index of every sample are stored in a sidecar index file
+(<explanations file>.index, rebuilt whenever the explanations file changes). Afterwards the
+explanations file is memory-mapped and samples are decoded one by one on access.
+
+Example:
+    reader = ExplanationsReader("CLEVR_train_explanations_v0.7.10.json")
+    sample = reader[42]
+    samples = reader.image(1337)
+    train_ids = load_image_ids("train_images_ids_v0.7.10-recut.pkl")
+    for sample in reader.subset(train_ids):
+        ...
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--explanations_file",
+    default="../output/CLEVR_explanations.json",
+    help="Builds the index of this file",
+)
+parser.add_argument(
+    "--index_file", default=None, help="Defaults to <explanations_file>.index"
+)
+
+WINDOW_SIZE = 1 << 24
+_decoder = json.JSONDecoder()
+
+
+def load_image_ids(path: str) -> List[int]:
+    """reads the image ids of a split, e.g. train_images_ids_v0.7.10-recut.pkl"""
+    with open(path, "rb") as f:
+        return sorted(pickle.load(f))
+
+
+class _Scanner:
+    """
+    Decodes a window of the file at a time. latin-1 maps every byte to one character, thus the
+    positions in the decoded text are byte offsets (non-ascii bytes only occur within strings).
+    """
+
+    def __init__(self, buffer) -> None:
+        self.buffer = buffer
+        self.window_start = 0
+        self.text = ""
+
+    def load(self, position: int, size: int = WINDOW_SIZE) -> None:
+        self.window_start = position
+        self.text = bytes(self.buffer[position : position + size]).decode("latin-1")
+
+    def skip_whitespace(self, position: int) -> int:
+        while True:
+            i = position - self.window_start
+            if i >= len(self.text):
+                assert position < len(self.buffer), "unexpected end of file"
+                self.load(position)
+                continue
+            if not self.text[i].isspace():
+                return position
+            position += 1
+
+    def char(self, position: int) -> str:
+        position = self.skip_whitespace(position)
+        return self.text[position - self.window_start]
+
+    def value(self, position: int) -> Tuple[object, int, int]:
+        """decodes the value at position, returns it with its start and end"""
+        start = self.skip_whitespace(position)
+        size = WINDOW_SIZE
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, start - self.window_start)
+                return value, start, self.window_start + end
+            except json.JSONDecodeError:
+                # the value continues beyond the window
+                if self.window_start + len(self.text) >= len(self.buffer):
+                    raise
+                size = max(size, 2 * len(self.text))
+                self.load(start, size)
+
+
+def scan(buffer) -> Tuple[Dict, Dict[str, List[int]]]:
+    """returns the info and the byte ranges, image and question indices of the samples"""
+    scanner = _Scanner(buffer)
+    columns: Dict[str, List[int]] = {
+        "starts": [],
+        "ends": [],
+        "image_index": [],
+        "question_index": [],
+    }
+    info = {}
+
+    position = scanner.skip_whitespace(0)
+    assert scanner.char(position) == "{", "expected a json object"
+    position += 1
+    while scanner.char(position) != "}":
+        key, _, position = scanner.value(position)
+        position = scanner.skip_whitespace(position)
+        assert scanner.char(position) == ":"
+        if key != "questions":
+            _, start, position = scanner.value(position + 1)
+            if key == "info":
+                # the scanner decodes latin-1, the info is decoded from its utf-8 bytes
+                info = json.loads(buffer[start:position])
+        else:
+            position = scanner.skip_whitespace(position + 1)
+            assert scanner.char(position) == "[", "questions must be a list"
+            position += 1
+            while scanner.char(position) != "]":
+                sample, start, position = scanner.value(position)
+                columns["starts"].append(start)
+                columns["ends"].append(position)
+                columns["image_index"].append(sample.get("image_index", -1))
+                columns["question_index"].append(sample.get("question_index", -1))
+                if scanner.char(position) == ",":
+                    position += 1
+            position = scanner.skip_whitespace(position) + 1
+        if scanner.char(position) == ",":
+            position += 1
+    return info, columns
+
+
+def build_index(explanations_path: str, index_path: str) -> None:
+    buffer = map_file(explanations_path)
+    try:
+        info, columns = scan(buffer)
+    finally:
+        buffer.close()
+    stat = os.stat(explanations_path)
+    header = {
+        "format": "explanations_index",
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "info": info,
+    }
+    write_arrays(
+        index_path,
+        header,
+        {key: np.array(values, dtype=np.int64) for key, values in columns.items()},
+    )
+
+
+def index_is_current(explanations_path: str, index_path: str) -> bool:
+    if not os.path.exists(index_path):
+        return False
+    buffer = map_file(index_path)
+    try:
+        header, _ = read_header(buffer)
+    finally:
+        buffer.close()
+    stat = os.stat(explanations_path)
+    return (header["source_size"], header["source_mtime"]) == (
+        stat.st_size,
+        stat.st_mtime,
+    )
+
+
+class ExplanationsReader:
+    """lazily decodes the samples of an explanations file by position, question or image index"""
+
+    def __init__(self, path: str, index_path: Optional[str] = None) -> None:
+        index_path = index_path if index_path is not None else path + ".index"
+        if not index_is_current(path, index_path):
+            build_index(path, index_path)
+
+        self._buffer = map_file(path)
+        self._index_buffer = map_file(index_path)
+        index_header, self.index = read_arrays(self._index_buffer)
+        self.info: Dict = index_header["info"]
+        # (argsort of the column, sorted column) for the lookups by value
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def close(self) -> None:
+        # the views of the index have to be released before its buffer can be closed
+        self.index = {}
+        self._sorted = {}
+        self._index_buffer.close()
+        self._buffer.close()
+
+    def __enter__(self) -> "ExplanationsReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.index["starts"])
+
+    def __getitem__(self, position: int) -> Dict:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        start, end = self.index["starts"][position], self.index["ends"][position]
+        return json.loads(self._buffer[start:end])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def _positions(self, column: str, value: int) -> np.ndarray:
+        if column not in self._sorted:
+            order = np.argsort(self.index[column], kind="stable")
+            self._sorted[column] = order, self.index[column][order]
+        order, values = self._sorted[column]
+        begin, end = np.searchsorted(values, [value, value + 1])
+        return np.sort(order[begin:end])
+
+    def image_positions(self, image_index: int) -> np.ndarray:
+        """the positions of all samples of the image in file order"""
+        return self._positions("image_index", image_index)
+
+    def question_positions(self, question_index: int) -> np.ndarray:
+        return self._positions("question_index", question_index)
+
+    def image(self, image_index: int) -> List[Dict]:
+        return [self[p] for p in self.image_positions(image_index)]
+
+    def question(self, question_index: int) -> List[Dict]:
+        """the samples of a question (usually one)"""
+        return [self[p] for p in self.question_positions(question_index)]
+
+    def subset_positions(self, image_ids: Iterable[int]) -> np.ndarray:
+        return np.flatnonzero(
+            np.isin(self.index["image_index"], np.fromiter(image_ids, dtype=np.int64))
+        )
+
+    def subset(self, image_ids: Iterable[int]) -> Iterator[Dict]:
+        """the samples of the given images (e.g. a split from load_image_ids) in file order"""
+        for position in self.subset_positions(image_ids):
+            yield self[position]
+
+
+def main(args):
+    index_path = args.index_file
+    if index_path is None:
+        index_path = args.explanations_file + ".index"
+    build_index(args.explanations_file, index_path)
+    with ExplanationsReader(args.explanations_file, index_path) as reader:
+        print("Indexed %d samples into %s" % (len(reader), index_path))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -1,11 +1,11 @@
 from __future__ import print_function
 
 import random
-from typing import List
-
-from more_itertools import powerset
+from itertools import combinations
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
 
 from custom_types import Attribute_Map, Attribute_Set, Metadata, Scene_Struct
+from question_engine import get_attribute_column
 
 
 def precompute_filter_options(scene_struct: Scene_Struct, metadata: Metadata) -> None:
@@ -26,10 +26,10 @@ def precompute_filter_options(scene_struct: Scene_Struct, metadata: Metadata) ->
             mask.append((i // (2 ** j)) % 2)
         masks.append(mask)
 
-    for object_idx, obj in enumerate(scene_struct["objects"]):
-        if metadata["dataset"] == "CLEVR-v1.0":
-            # mypy bug 7867
-            keys = [tuple(obj[k] for k in attr_keys)]  # type: ignore
+    # the attribute values of the objects, one column per attribute (c.f. get_attribute_column)
+    columns = [get_attribute_column(scene_struct, k) for k in attr_keys]  # type: ignore
+    for object_idx, key in enumerate(zip(*columns)):
+        keys = [key]
         for mask in masks:
             for key in keys:
                 masked_key = []
@@ -123,30 +123,64 @@ def find_relate_filter_options(
     return options
 
 
-def derive_cf_attributes(current_final_filters: Attribute_Set) -> List:
-    # case with only attributes
+def reversed_combinations(n: int, r: int, start: int = 0) -> Iterator[Tuple[int, ...]]:
+    """reversed(list(combinations(range(start, n), r))), but lazy"""
+    if r == 0:
+        yield ()
+        return
+    for i in range(n - r, start - 1, -1):
+        for rest in reversed_combinations(n, r - 1, i + 1):
+            yield (i,) + rest
+
+
+def iter_cf_attributes(
+    current_final_filters: Attribute_Set, general_first: bool = False
+) -> Iterator[Tuple[str, ...]]:
+    """
+    Lazily enumerates all variants of the filter, where any of the used attributes may be dropped ("").
 
-    # reduce the filter from all filtering things
+    By default the most specific variant (the filter itself) comes first and the empty filter last,
+    general_first reverses this order.
+    """
+    # reduce the filter from all filtering things, index() maps repeated values to their first position
     none_list = ["", "thing"]
-    minimized_filter = [
-        filter for filter in current_final_filters if filter not in none_list
+    positions = [
+        current_final_filters.index(filter)
+        for filter in current_final_filters
+        if filter not in none_list
     ]
-    ps = list(powerset(minimized_filter))[::-1]
 
-    extended_ps = []
-    for s in ps:
+    # subsets of the indices into positions, in the order of powerset(positions)
+    indices = list(range(len(positions)))
+    if general_first:
+        subsets = (
+            subset
+            for size in range(len(indices) + 1)
+            for subset in combinations(indices, size)
+        )
+    else:
+        # the same subsets as reversed(list(powerset(indices))), without materializing them
+        subsets = (
+            subset
+            for size in range(len(indices), -1, -1)
+            for subset in reversed_combinations(len(indices), size)
+        )
+
+    for subset in subsets:
         extended_set = [""] * len(current_final_filters)
-        for item in s:
-            try:
-                correct_index = current_final_filters.index(item)
-                extended_set[correct_index] = item
-            except ValueError:
-                pass
-        extended_ps.append(tuple(extended_set))
-    return extended_ps
+        for i in subset:
+            extended_set[positions[i]] = current_final_filters[positions[i]]
+        yield tuple(extended_set)
 
 
-def derive_cf_relations(current_final_filters) -> List:
+def derive_cf_attributes(current_final_filters: Attribute_Set) -> List:
+    # case with only attributes
+    return list(iter_cf_attributes(current_final_filters))
+
+
+def iter_cf_relations(
+    current_final_filters, general_first: bool = False
+) -> Iterator[Tuple[str, Tuple[str, ...]]]:
     """
   generate combinations with varying relations
   
@@ -166,11 +200,40 @@ def derive_cf_relations(current_final_filters) -> List:
             relations = [current_relation] + [
                 op for op in opposites if op != current_relation
             ]
+    if general_first:
+        relations = relations[::-1]
+
+    for filter_variant in iter_cf_attributes(final_attribute_filters, general_first):
+        for relation in relations:
+            yield (relation, filter_variant)
+
+
+def derive_cf_relations(current_final_filters) -> List:
+    return list(iter_cf_relations(current_final_filters))
 
-    relation_attribute_filters = [
-        (relation, filter_variant)
-        for filter_variant in derive_cf_attributes(final_attribute_filters)
-        for relation in relations
-    ]
-    return relation_attribute_filters
 
+def generalizes(general, specific) -> bool:
+    """whether the cf variant general matches every object specific matches (same relation, subset of the attributes)"""
+    if len(general) == 2 and isinstance(general[1], tuple):
+        return general[0] == specific[0] and generalizes(general[1], specific[1])
+    return all(g == "" or g == s for g, s in zip(general, specific))
+
+
+def prune_cf_variants(
+    variants: Iterable, factual, matches: Callable[[Any], Iterable[int]]
+) -> Iterator:
+    """
+    Skips the cf variants, which cannot match any object the factual filter does not match.
+
+    The variants must come in general first order. Once a variant matches no additional objects,
+    neither does any of its more specific variants, so these are skipped. The factual variant
+    itself is always kept.
+    """
+    factual_objects = set(matches(factual))
+    exhausted: List = []
+    for variant in variants:
+        if variant != factual and any(generalizes(e, variant) for e in exhausted):
+            continue
+        yield variant
+        if set(matches(variant)) <= factual_objects:
+            exhausted.append(variant)
@@ -8,17 +8,28 @@
 from __future__ import print_function
 
 import argparse
+import contextlib
 import html
+import itertools
 import json
 import os
 import random
 import time
+from typing import Dict, List
 
-import pandas as pd
 from tqdm import tqdm
 from treelib.exceptions import DuplicatedNodeIdError
 
-from explanations import use_instantiated_template
+from conditions import LEVELS, set_contract_level
+from explanation_engine import ExplanationEngine
+from scene_context import group_questions_by_image, index_scenes, scene_context
+from search_results import (
+    RecordingRandom,
+    ReplayedRandom,
+    SearchWriter,
+    read_header,
+    read_searches,
+)
 
 """
 Generate synthetic explanations for questions and answers for CLEVR images. Input is a single
@@ -65,6 +76,24 @@ parser.add_argument(
     help="JSON file containing ground-truth scene information for all images "
     + "from render_images.py",
 )
+parser.add_argument(
+    "--input_preprocessed_file",
+    default=None,
+    help="Output of preprocess.py, which is memory-mapped instead of reading "
+    + "--input_scene_file and --input_questions_file",
+)
+parser.add_argument(
+    "--input_search_file",
+    default=None,
+    help="Search file written by --output_search_file for the same questions and scenes. "
+    + "Only the NLG is run on it, the search is skipped (c.f. search_results.py)",
+)
+parser.add_argument(
+    "--input_scene_store",
+    default=None,
+    help="Scene store (c.f. scene_store.py), which is memory-mapped instead of "
+    + "reading --input_scene_file",
+)
 parser.add_argument(
     "--input_questions_file",
     default="../output/CLEVR_questions.json",
@@ -92,6 +121,12 @@ parser.add_argument(
     default="../output/CLEVR_explanations.json",
     help="The output file to write containing generated explanations",
 )
+parser.add_argument(
+    "--output_search_file",
+    default=None,
+    help="Optional file to write the search of every explained question to, which "
+    + "--input_search_file realizes again (c.f. search_results.py)",
+)
 
 # Control which and how many images to process
 parser.add_argument(
@@ -149,6 +184,26 @@ parser.add_argument(
     + "result in flatter distributions over templates and answers, but "
     + "will result in longer runtimes.",
 )
+parser.add_argument(
+    "--sub_program_cache_size",
+    default=0,
+    type=int,
+    help="Number of counterfactual sub-program searches to memoize across the questions of "
+    + "a scene (c.f. sub_program_cache.py). 0 disables the cache.",
+)
+parser.add_argument(
+    "--realization_cache_size",
+    default=0,
+    type=int,
+    help="Number of sentence plans whose realizations are memoized across all questions "
+    + "(c.f. realization_cache.py). 0 disables the cache.",
+)
+parser.add_argument(
+    "--prune_counterfactuals",
+    action="store_true",
+    help="Skip counterfactual filter variants, which cannot match any additional object. "
+    + "The explanations only use the factual variants, so this does not change them.",
+)
 parser.add_argument("--verbose", action="store_true", help="Print more verbose output")
 parser.add_argument(
     "--time_dfs",
@@ -161,6 +216,12 @@ parser.add_argument(
 parser.add_argument(
     "--seed", default=43, type=int, help="The seed to set for random.seed()"
 )
+parser.add_argument(
+    "--contracts",
+    default=None,
+    choices=LEVELS,
+    help="Checks of the pre- and post-conditions (c.f. conditions.py). Defaults to the CLEVRX_CONTRACTS environment variable or sampled",
+)
 parser.add_argument(
     "--log_to_dataframe",
     default=False,
@@ -170,203 +231,237 @@ parser.add_argument(
 # args = parser.parse_args()
 
 
-TEMPLATE_ORDER = [
-    "compare_integer.json",
-    "comparison.json",
-    "three_hop.json",
-    "single_and.json",
-    "same_relate.json",
-    "single_or.json",
-    "one_hop.json",
-    "two_hop.json",
-    "zero_hop.json",
-]
+def explanation_items(question: Dict, ef: List[List[str]]) -> List[Dict]:
+    """one output item per factual explanation of the question"""
+    return [
+        {
+            **question,
+            **{
+                "factual_explanation": f,
+                "counter_factual_explanation": [],
+            },
+        }
+        for f in ef
+    ]
 
 
-def main(args):
-    random.seed(args.seed)
-    with open(args.metadata_file, "r") as f:
-        metadata = json.load(f)
-        dataset = metadata["dataset"]
-        if dataset != "CLEVR-v1.0":
-            raise ValueError('Unrecognized dataset "%s"' % dataset)
-
-    functions_by_name = {}
-    for f in metadata["functions"]:
-        functions_by_name[f["name"]] = f
-    metadata["_functions_by_name"] = functions_by_name
-
-    # Load templates from disk
-    # Key is (filename, file_idx)
-    num_loaded_templates = 0
-    templates = {}
-    # FIXME: This does not look at the templates which are actually present, but using the template order is important so the matching of question to template is correct
-    for fn in TEMPLATE_ORDER:
-        if not fn.endswith(".json"):
-            continue
-        with open(os.path.join(args.template_dir, fn), "r") as f:
-            base = os.path.splitext(fn)[0]
-            for i, template in enumerate(json.load(f)):
-                num_loaded_templates += 1
-                key = (fn, i)
-                templates[key] = template
-    print("Read %d templates from disk" % num_loaded_templates)
-
-    def reset_counts():
-        # Maps a template (filename, index) to the number of questions we have
-        # so far using that template
-        template_counts = {}
-        # Maps a template (filename, index) to a dict mapping the answer to the
-        # number of questions so far of that template type with that answer
-        template_answer_counts = {}
-        node_type_to_dtype = {n["name"]: n["output"] for n in metadata["functions"]}
-        for key, template in templates.items():
-            template_counts[key[:2]] = 0
-            final_node_type = template["nodes"][-1]["type"]
-            final_dtype = node_type_to_dtype[final_node_type]
-            answers = metadata["types"][final_dtype]
-            if final_dtype == "Bool":
-                answers = [True, False]
-            if final_dtype == "Integer":
-                if metadata["dataset"] == "CLEVR-v1.0":
-                    answers = list(range(0, 11))
-            template_answer_counts[key[:2]] = {}
-            for a in answers:
-                template_answer_counts[key[:2]][a] = 0
-        return template_counts, template_answer_counts
-
-    template_counts, template_answer_counts = reset_counts()
-
-    all_questions = []
-    with open(args.input_questions_file, "r") as f:
-        questions_data = json.load(f)
-        all_questions = questions_data["questions"]
-
-    # Read file containing input scenes
-    all_scenes = []
-    with open(args.input_scene_file, "r") as f:
-        scene_data = json.load(f)
-        all_scenes = scene_data["scenes"]
-        scene_info = scene_data["info"]
+def write_explanations(path: str, scene_info: Dict, questions: List[Dict]) -> Dict:
+    data = {
+        "info": scene_info,
+        "questions": questions,
+    }
+    with open(path, "w") as f:
+        print("Writing output to %s" % path)
+        json.dump(data, f)
+    return data
 
-    begin = args.scene_start_idx
-    if args.num_scenes > 0:
-        end = args.scene_start_idx + args.num_scenes
-        all_scenes = all_scenes[begin:end]
-        all_questions = all_questions[begin:end]
-    else:
-        all_scenes = all_scenes[begin:]
-        all_questions = all_questions[begin:]
-
-    # Read synonyms file
-    with open(args.synonyms_json, "r") as f:
-        synonyms = json.load(f)
-
-    df = pd.DataFrame(
-        columns=[
-            "Family",
-            "ID",
-            "Instantiated Language",
-            "Image",
-            "Answer",
-            "Factual Answer",
-        ]
+
+def realize_searches(
+    engine: ExplanationEngine,
+    search_file: str,
+    all_questions: List[Dict],
+    scenes_by_filename: Dict[str, List[Dict]],
+) -> List[Dict]:
+    """
+    Runs only the NLG on the searches of the search file (c.f. search_results.py). The random
+    numbers of the full run are replayed, so an unchanged NLG reproduces its explanations.
+    """
+    questions: List[Dict] = []
+    progress = tqdm(total=len(all_questions), smoothing=0.05)
+    scene_searches = itertools.groupby(
+        read_searches(search_file),
+        key=lambda record: all_questions[record[0]]["image_filename"],
     )
-    questions = []
-    scene_count = 0
-    for i, question in tqdm(
-        enumerate(all_questions), total=len(all_questions), smoothing=0.05
-    ):
-        scene_fn: str = question["image_filename"]
-        scene_struct_candidates = [
-            s for s in all_scenes if s["image_filename"] == scene_fn
-        ]
+    for scene_fn, records in scene_searches:
+        scene_struct_candidates = scenes_by_filename.get(scene_fn, [])
         if len(scene_struct_candidates) != 1:
-            print(f"no matching scene graph loaded for fn: {scene_fn}")
+            # as in main, e.g. if the search file was written for other scenes
+            for _ in records:
+                print(f"no matching scene graph loaded for fn: {scene_fn}")
+                progress.update(1)
             continue
 
         scene_struct = scene_struct_candidates[0]
-        assert scene_struct["image_filename"] == question["image_filename"]
+        with scene_context(scene_struct, engine.metadata):
+            for i, search, randoms in records:
+                progress.update(1)
+                question = all_questions[i]
+                ef = engine.realize_in_context(
+                    question, scene_struct, search, rng=ReplayedRandom(randoms)
+                )
+                questions.extend(explanation_items(question, ef))
+    progress.close()
+    return questions
 
-        if args.verbose:
-            print(f"starting question {scene_fn} ({i + 1} / {len(all_questions)})")
 
-        (fn, idx), cur_template = list(templates.items())[
-            question["question_family_index"]
-        ]
+def main(args):
+    if args.contracts is not None:
+        set_contract_level(args.contracts)
+    random.seed(args.seed)
+    engine = ExplanationEngine(
+        args.metadata_file,
+        args.synonyms_json,
+        args.template_dir,
+        instances_per_template=args.instances_per_template,
+        sub_program_cache_size=args.sub_program_cache_size,
+        prune_counterfactuals=args.prune_counterfactuals,
+        verbose=args.verbose,
+        realization_cache_size=args.realization_cache_size,
+    )
+    metadata = engine.metadata
+    print("Read %d templates from disk" % len(engine.templates))
 
-        if args.template_fn is not None and args.template_idx is not None:
-            if args.template_fn != fn or args.template_idx != idx:
-                print(
-                    "Skipped question as the given template filename and index does not match whats required via the args."
-                )
-                continue
+    begin = args.scene_start_idx
+    end = args.scene_start_idx + args.num_scenes if args.num_scenes > 0 else None
 
-        if args.verbose:
-            print("Generating Explanations for template ", fn, idx)
-        if args.time_dfs and args.verbose:
-            tic = time.time()
+    # the optional inputs and outputs import their (heavy) dependencies only when they are used
+    if args.input_preprocessed_file is not None:
+        from preprocess import PreprocessedDataset
 
-        try:
-            ef = use_instantiated_template(
-                scene_struct,
-                cur_template,
-                question,
-                metadata,
-                template_answer_counts[(fn, idx)].copy(),
-                synonyms,
-                (fn, idx),
-                max_instances=args.instances_per_template,
-                verbose=args.verbose,
+        dataset = PreprocessedDataset(args.input_preprocessed_file)
+        all_questions = dataset.questions[begin:end]
+        scene_info = dataset.info
+        scenes_by_filename = dataset.scenes.index_scenes(begin, end)
+    else:
+        with open(args.input_questions_file, "r") as f:
+            questions_data = json.load(f)
+            all_questions = questions_data["questions"][begin:end]
+
+        # Read file containing input scenes
+        if args.input_scene_store is not None:
+            from scene_store import SceneStore
+
+            scene_store = SceneStore.open(args.input_scene_store)
+            scene_info = scene_store.info
+            scenes_by_filename = scene_store.index_scenes(begin, end)
+        else:
+            with open(args.input_scene_file, "r") as f:
+                scene_data = json.load(f)
+                scene_info = scene_data["info"]
+            scenes_by_filename = index_scenes(scene_data["scenes"][begin:end])
+
+    header = {
+        "scene_start_idx": args.scene_start_idx,
+        "num_scenes": args.num_scenes,
+        "num_questions": len(all_questions),
+    }
+    if args.input_search_file is not None:
+        if read_header(args.input_search_file) != header:
+            raise ValueError(
+                "The search file %s was written for other questions or scenes"
+                % args.input_search_file
             )
+        assert not args.log_to_dataframe, "Not supported with --input_search_file"
+        questions = realize_searches(
+            engine, args.input_search_file, all_questions, scenes_by_filename
+        )
+        return write_explanations(args.output_explanations_file, scene_info, questions)
 
-            if args.time_dfs and args.verbose:
-                toc = time.time()
-                print("that took ", toc - tic)
-
-            image_index = int(os.path.splitext(scene_fn)[0].split("_")[-1])
-            for f in ef:
-                questions.append(
-                    {
-                        **question,
-                        **{
-                            "factual_explanation": f,
-                            "counter_factual_explanation": [],
-                        },
-                    }
-                )
-
-                if args.log_to_dataframe:
-                    img = f'<img src="{question["image_filename"]}">'
-                    df = df.append(
-                        {
-                            "Family": fn,
-                            "ID": idx,
-                            "Nodes": html.escape(
-                                json.dumps(cur_template["nodes"], indent=4)
-                            ).replace("\n", "<br>"),
-                            # "Constraints": html.escape(json.dumps(cur_template["constraints"], indent=4)).replace("\n", "<br>"),
-                            # "Instantiated Nodes": json.dumps(question["program"], indent=4).replace("\n", "<br>"),
-                            # "Language Template": "<br><br>".join([html.escape(t) for t in cur_template["text"]]),
-                            "Instantiated Language": question["question"],
-                            "Image": img,
-                            "Answer": question["answer"],
-                            "Factual Answer": "<br><br>".join(f),
-                            # "Counter Factual Answer": "<br><br>".join("<br>".join(x) for x in cf)
-                        },
-                        ignore_index=True,
-                    )
-        except DuplicatedNodeIdError:
-            print(f"ERROR: Malformed program, skipping item {i}")
-            pass
+    if args.log_to_dataframe:
+        import pandas as pd
+
+        df = pd.DataFrame(
+            columns=[
+                "Family",
+                "ID",
+                "Instantiated Language",
+                "Image",
+                "Answer",
+                "Factual Answer",
+            ]
+        )
+    # the search file is closed (and its gzip stream completed) however the loop ends
+    with contextlib.ExitStack() as stack:
+        search_writer = None
+        if args.output_search_file is not None:
+            search_writer = stack.enter_context(
+                SearchWriter(args.output_search_file, header)
+            )
+        questions = []
+        num_explained = 0
+        progress = tqdm(total=len(all_questions), smoothing=0.05)
+        for scene_fn, scene_questions in group_questions_by_image(all_questions):
+            scene_struct_candidates = scenes_by_filename.get(scene_fn, [])
+            if len(scene_struct_candidates) != 1:
+                for _ in scene_questions:
+                    print(f"no matching scene graph loaded for fn: {scene_fn}")
+                progress.update(len(scene_questions))
+                continue
 
-    data = {
-        "info": scene_info,
-        "questions": questions,
-    }
-    with open(args.output_explanations_file, "w") as f:
-        print("Writing output to %s" % args.output_explanations_file)
-        json.dump(data, f)
+            scene_struct = scene_struct_candidates[0]
+            with scene_context(scene_struct, metadata):
+                for i, question in scene_questions:
+                    progress.update(1)
+                    assert scene_struct["image_filename"] == question["image_filename"]
+
+                    if args.verbose:
+                        print(
+                            f"starting question {scene_fn} ({i + 1} / {len(all_questions)})"
+                        )
+
+                    num_explained += 1
+                    if num_explained % args.reset_counts_every == 0:
+                        engine.reset_counts()
+
+                    (fn, idx), cur_template = engine.template_of(question)
+
+                    if args.template_fn is not None and args.template_idx is not None:
+                        if args.template_fn != fn or args.template_idx != idx:
+                            print(
+                                "Skipped question as the given template filename and index does not match whats required via the args."
+                            )
+                            continue
+
+                    if args.verbose:
+                        print("Generating Explanations for template ", fn, idx)
+                    if args.time_dfs and args.verbose:
+                        tic = time.time()
+
+                    try:
+                        if search_writer is not None:
+                            search = engine.search_in_context(question, scene_struct)
+                            rng = RecordingRandom()
+                            ef = engine.realize_in_context(
+                                question, scene_struct, search, rng=rng
+                            )
+                            search_writer.write(i, search, rng.values)
+                        else:
+                            ef = engine.explain_in_context(question, scene_struct)
+
+                        if args.time_dfs and args.verbose:
+                            toc = time.time()
+                            print("that took ", toc - tic)
+
+                        image_index = int(os.path.splitext(scene_fn)[0].split("_")[-1])
+                        questions.extend(explanation_items(question, ef))
+                        for f in ef:
+                            if args.log_to_dataframe:
+                                img = f'<img src="{question["image_filename"]}">'
+                                df = df.append(
+                                    {
+                                        "Family": fn,
+                                        "ID": idx,
+                                        "Nodes": html.escape(
+                                            json.dumps(cur_template["nodes"], indent=4)
+                                        ).replace("\n", "<br>"),
+                                        # "Constraints": html.escape(json.dumps(cur_template["constraints"], indent=4)).replace("\n", "<br>"),
+                                        # "Instantiated Nodes": json.dumps(question["program"], indent=4).replace("\n", "<br>"),
+                                        # "Language Template": "<br><br>".join([html.escape(t) for t in cur_template["text"]]),
+                                        "Instantiated Language": question["question"],
+                                        "Image": img,
+                                        "Answer": question["answer"],
+                                        "Factual Answer": "<br><br>".join(f),
+                                        # "Counter Factual Answer": "<br><br>".join("<br>".join(x) for x in cf)
+                                    },
+                                    ignore_index=True,
+                                )
+                    except DuplicatedNodeIdError:
+                        print(f"ERROR: Malformed program, skipping item {i}")
+                        pass
+
+        progress.close()
+
+    data = write_explanations(args.output_explanations_file, scene_info, questions)
 
     # save this into the val images folder for the images to appear
     # print(df.sort_values(['Family', 'ID']).to_html(escape=False))
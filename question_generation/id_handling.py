@@ -1,35 +1,99 @@
 from __future__ import print_function
 
-from typing import Dict
+import re
+import sys
+from typing import Dict, List, NamedTuple, Tuple, Union
 
-from conditions import pre_condition
+"""
+Placeholders like <Z>, <C2>, <Ccf> or <S3i0> consist of a kind (<Z>, <C>, <S>, ...) and an id (the
+part between the letter and the closing bracket). The functions below are called in tight loops, so
+every placeholder is checked and split only once: the interned record is kept in a registry, which
+is filled with the placeholders of the templates when they are loaded (c.f. register_template) and
+with every other placeholder when it is first seen.
+"""
 
 
-@pre_condition(lambda ph, t="", d0=True: ph[0] == "<" and ph[-1] == ">")
-@pre_condition(lambda ph, t="", d0=True: len(ph) >= 3)
-def replace_id(placeholder: str, text="") -> str:
-    """transforms <Z> --> <Z>. transforms <Z2> --> <Z>. optionally inserts an alternative text"""
-    if type(text) == int:
-        text = str(text) if text > 1 else ""
+class Placeholder(NamedTuple):
+    kind: str  # <Z> for <Z2>
+    id: str  # 3i0 for <S3i0>
+    number: str  # the leading digits of the id, 3 for <S3i0>
+    suffix: str  # the rest of the id, i0 for <S3i0>
+
+
+_placeholders: Dict[str, Placeholder] = {}
+# the results of replace_id
+_replaced: Dict[Tuple[str, Union[str, int]], str] = {}
+
+PLACEHOLDER_PATTERN = re.compile(r"<[^<> ]+>")
+
+
+def register_placeholder(placeholder: str) -> Placeholder:
+    assert len(placeholder) >= 3, "Pre-Condition was not met!"
+    assert (
+        placeholder[0] == "<" and placeholder[-1] == ">"
+    ), "Pre-Condition was not met!"
+    id = placeholder[2:-1]
+    number = re.match(r"\d*", id).group()  # type: ignore
+    record = Placeholder(
+        sys.intern(placeholder[:2] + placeholder[-1]),
+        sys.intern(id),
+        sys.intern(number),
+        sys.intern(id[len(number) :]),
+    )
+    _placeholders[sys.intern(placeholder)] = record
+    return record
+
 
-    return placeholder[:2] + text + placeholder[-1]
+def register_template(template: Dict) -> None:
+    """registers the placeholders of the parameters and texts of a template"""
+    for param in template["params"]:
+        lookup(param["name"])
+    for text in template["text"]:
+        for placeholder in PLACEHOLDER_PATTERN.findall(text):
+            lookup(placeholder)
+
+
+def lookup(placeholder: str) -> Placeholder:
+    record = _placeholders.get(placeholder)
+    if record is None:
+        record = register_placeholder(placeholder)
+    return record
+
+
+def replace_id(placeholder: str, text: Union[str, int] = "") -> str:
+    """transforms <Z> --> <Z>. transforms <Z2> --> <Z>. optionally inserts an alternative text"""
+    key = (placeholder, text)
+    replaced = _replaced.get(key)
+    if replaced is None:
+        kind = lookup(placeholder).kind
+        if type(text) == int:
+            text = str(text) if text > 1 else ""  # type: ignore
+        replaced = sys.intern(kind[:2] + text + kind[-1])  # type: ignore
+        _replaced[key] = replaced
+    return replaced
 
 
 def remove_id(placeholder: str) -> str:
-    return replace_id(placeholder, "")
+    return lookup(placeholder).kind
 
 
-@pre_condition(lambda ph: ph[0] == "<" and ph[-1] == ">")
-@pre_condition(lambda ph: len(ph) >= 3)
 def get_id(placeholder: str) -> str:
     """returns the id value of a placeholder by stripping of the beginning and end"""
-    return placeholder[2:-1]
+    return lookup(placeholder).id
+
+
+def group_by_id(placeholders) -> Dict[str, List[str]]:
+    """maps the ids to their placeholders (in the given order)"""
+    grouped: Dict[str, List[str]] = {}
+    for placeholder in placeholders:
+        grouped.setdefault(lookup(placeholder).id, []).append(placeholder)
+    return grouped
 
 
 def keep_attr_items_with_id(dictionary: Dict, current_id: str) -> Dict:
-    clean_dictionary = {
-        k: v
-        for k, v in dictionary.items()
-        if get_id(k) == current_id and remove_id(k) != "<R>"
-    }
+    clean_dictionary = {}
+    for k, v in dictionary.items():
+        record = lookup(k)
+        if record.id == current_id and record.kind != "<R>":
+            clean_dictionary[k] = v
     return clean_dictionary
@@ -4,11 +4,16 @@ import random
 import re
 from typing import Dict, List
 
-from num2words import num2words
-
 from id_handling import get_id
 
 
+def num2words(number: int) -> str:
+    # num2words loads all of its languages on import, so it is only imported once it is needed
+    from num2words import num2words as _num2words
+
+    return _num2words(number)
+
+
 def handle_match(text: str, match, objs: Dict, fn, replacements) -> str:
     """
     Takes a match (which is a {|()} delimited part of the template) and extends it based on the number of found objects.
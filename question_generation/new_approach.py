@@ -1,33 +1,71 @@
-from typing import Dict, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from custom_types import Synonyms
 from id_handling import get_id, keep_attr_items_with_id, remove_id, replace_id
 from nlg_system.clauses import Relation
-from nlg_system.objects import CLEVRObject, Objects
+from nlg_system.objects import CLEVRObject, Objects, share_synonyms
 
 #### New Approach
 
 
-# 1. Question understanding
-def understand_question(
-    fse_list, final_filters: Dict[str, str], synonyms: Synonyms, question_synonyms
-) -> Tuple[Dict[str, Objects], Dict[str, Relation]]:
-    """
-    The goal of this function is to map each ID (1,2,3,4,...) to a set of found objects.
+class SynonymIndex(NamedTuple):
+    attributes: Synonyms  # the synonyms of the attributes (without thing)
+    relations: Synonyms
+    canonical: Dict[str, List[str]]  # maps a word to the attributes it is a synonym of
+    # the attribute synonyms with the overrides of the questions, by their overrides
+    overridden: Dict[Tuple, Synonyms]
+
+
+# the synonym indices by the id of their synonyms (which are kept alive alongside)
+_synonym_indices: Dict[int, Tuple[Synonyms, SynonymIndex]] = {}
 
-    Futhermore, we also prepare the relations.
-    """
 
-    # split the synonyms into attributes and relation related ones
+def synonym_index(synonyms: Synonyms) -> SynonymIndex:
+    """splits the synonyms into attributes and relation related ones, built once per synonyms dict"""
+    entry = _synonym_indices.get(id(synonyms))
+    if entry is not None and entry[0] is synonyms:
+        return entry[1]
+
     all_relations = ["left", "right", "behind", "front", "above", "below"]
     # thing synonyms are not needed, as we always use the shape
     thing_attr = ["thing"]
-    all_attribute_synonyms = {
+    attributes = {
         k: v
         for k, v in synonyms.items()
         if k not in all_relations and k not in thing_attr
     }
-    all_relation_synonyms = {k: v for k, v in synonyms.items() if k in all_relations}
+    canonical: Dict[str, List[str]] = {}
+    for attr, options in attributes.items():
+        for option in dict.fromkeys(options):
+            canonical.setdefault(option, []).append(attr)
+    # the synonyms are shared by the objects and relations of all questions
+    index = SynonymIndex(
+        share_synonyms(attributes),
+        share_synonyms({k: v for k, v in synonyms.items() if k in all_relations}),
+        canonical,
+        {},
+    )
+    _synonym_indices[id(synonyms)] = (synonyms, index)
+    return index
+
+
+# 1. Question understanding
+def understand_question(
+    filter_evidence: List[Tuple[List, Optional[List[str]]]],
+    final_filters: Dict[str, str],
+    synonyms: Synonyms,
+    question_synonyms,
+) -> Tuple[Dict[str, Objects], Dict[str, Relation]]:
+    """
+    The goal of this function is to map each ID (1,2,3,4,...) to a set of found objects.
+
+    Futhermore, we also prepare the relations.
+
+    The filter evidence holds the objects found by each explanation filter together with the side
+    inputs of the filter node (c.f. explanations.QuestionSearch).
+    """
+
+    index = synonym_index(synonyms)
 
     # compute relations
     # maps from an ID "", "2", "3", ... to the used relations
@@ -35,36 +73,40 @@ def understand_question(
         get_id(k): v for k, v in final_filters.items() if remove_id(k) == "<R>"
     }
     filter_to_relation: Dict[str, Relation] = {
-        k: Relation(v, all_relation_synonyms) for k, v in relations.items()
+        k: Relation(v, index.relations) for k, v in relations.items()
     }
 
     # compute objects
     # (later) maps from an ID "", "2", "3", ... to the found objects
     filter_to_objects: Dict[str, Objects] = {}
-    for fse, fltr in fse_list:
+    for positive_evidence, side_inputs in filter_evidence:
+        if side_inputs is None:
+            side_inputs = ["<Zs>", "<Cs>", "<Ms>", "<Ss>"]
         # determine current id # BUG: how to handle same relate questions?
-        attribute_names = [
-            name
-            for name in fltr[-2].get("side_inputs", ["<Zs>", "<Cs>", "<Ms>", "<Ss>"])
-            if replace_id(name) != "<R>"
-        ]
+        attribute_names = [name for name in side_inputs if replace_id(name) != "<R>"]
         current_id = get_id(attribute_names[0])
 
-        question_state = fse[0]
-        positive_evidence = question_state["answer"]
-
         relevant_synonyms = keep_attr_items_with_id(question_synonyms, current_id)
 
-        # iterate over all synonyms
-        current_attribute_synonyms = all_attribute_synonyms.copy()
-        for synonym, synonym_options in current_attribute_synonyms.items():
-            # iterate over the synonyms the question has used
-            for attr, question_synonym_options in relevant_synonyms.items():
-                # check if that matches
-                if len(set(synonym_options) & set(question_synonym_options)) > 0:
+        # iterate over the synonyms the question has used
+        overrides: Dict[str, List[str]] = {}
+        for question_synonym_options in relevant_synonyms.values():
+            # look up the attributes they are a synonym of
+            for option in question_synonym_options:
+                for synonym in index.canonical.get(option, []):
                     # overwrite the more broad synonyms with the one used by the question
-                    assert len(question_synonym_options) <= len(synonym_options)
-                    current_attribute_synonyms[synonym] = question_synonym_options
+                    assert len(question_synonym_options) <= len(
+                        index.attributes[synonym]
+                    )
+                    overrides[synonym] = question_synonym_options
+
+        current_attribute_synonyms = index.attributes
+        if len(overrides) > 0:
+            key = tuple((k, tuple(v)) for k, v in overrides.items())
+            current_attribute_synonyms = index.overridden.get(key)
+            if current_attribute_synonyms is None:
+                current_attribute_synonyms = {**index.attributes, **overrides}
+                index.overridden[key] = share_synonyms(current_attribute_synonyms)
 
         if len(positive_evidence) > 0:
             factual_objects = Objects.from_iterable(
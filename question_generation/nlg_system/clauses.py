@@ -1,43 +1,35 @@
 from __future__ import annotations
 
-from itertools import product
-from math import prod
 from typing import Dict, Union
 
 from custom_types import Synonyms
 
-from nlg_system.objects import CLEVRObject, Objects
+from nlg_system.objects import CLEVRObject, Objects, synonym_table
 
 
 class Relation:
     def __init__(self, relation: str, synonyms: Synonyms) -> None:
         self.relation = relation
-        self.synonyms = {k: v for k, v in synonyms.items() if k == self.relation}
+        # shared by all relations with the same synonyms (c.f. nlg_system.objects.SynonymTable)
+        self.synonym_table = synonym_table((relation,), synonyms)
 
         self.update_max_iter()
 
+    @property
+    def synonyms(self) -> Synonyms:
+        return self.synonym_table.synonyms
+
     def realize(self, iter: int = 0) -> str:
         assert 0 <= iter < self.max_iter
 
-        # create all possible synonym permutations (or rather their indices)
-        permuted_synonyms_indices = list(
-            product(*[range(len(v)) for v in self.synonyms.values()])
-        )
-
-        def relation2syn(attr):
-            if attr in self.synonyms.keys():
-                idx = list(self.synonyms.keys()).index(attr)
-                syn_idx = permuted_synonyms_indices[iter][idx]
-                return list(self.synonyms.values())[idx][syn_idx]
-            else:
-                return attr
+        # decode the synonym combination (or rather its indices) of this iter
+        synonym_indices = self.synonym_table.indices(iter)
 
-        return relation2syn(self.relation)
+        return self.synonym_table.synonym(self.relation, synonym_indices)
 
     def update_max_iter(self):
         # the max iter is a product of all the synonym variations
-        option_lens = [len(v) for v in self.synonyms.values()]
-        self.max_iter = prod(option_lens)
+        self.max_iter = self.synonym_table.max_iter
 
     def __eq__(self, other: Relation) -> bool:
         return self.relation == other.relation
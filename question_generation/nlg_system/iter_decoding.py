@@ -0,0 +1,53 @@
+"""
+Lazy decoding of iters.
+
+The NLG components enumerate their variants (synonyms, object orders, ...) through a single
+integer iter. Instead of materializing all permutations or synonym products and indexing
+into them, the helpers below decode the requested entry directly. Python integers have
+arbitrary precision, so this works for any iter, however large the number of variants is.
+"""
+
+from math import factorial, prod
+from typing import List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def nth_product_indices(radices: Sequence[int], index: int) -> Tuple[int, ...]:
+    """
+    Equivalent to list(product(*[range(r) for r in radices]))[index], but in O(len(radices)).
+
+    The last position changes fastest, which makes this a mixed radix decoding of index.
+    """
+    assert 0 <= index < prod(radices), "index out of range"
+    digits: List[int] = []
+    for radix in reversed(radices):
+        index, digit = divmod(index, radix)
+        digits.append(digit)
+    return tuple(reversed(digits))
+
+
+def nth_permutation(items: Sequence[T], index: int) -> Tuple[T, ...]:
+    """
+    Equivalent to list(permutations(items))[index], without enumerating the permutations.
+
+    Decodes index in the factorial number system. This needs len(items) divisions plus
+    removing the chosen items from a list.
+    """
+    n = len(items)
+    assert 0 <= index < factorial(n), "index out of range"
+    remaining = list(items)
+    permutation = []
+    # number of permutations of the items after the current position
+    place_value = factorial(n - 1) if n > 0 else 1
+    for position in range(n - 1, -1, -1):
+        digit, index = divmod(index, place_value)
+        permutation.append(remaining.pop(digit))
+        if position > 0:
+            place_value //= position
+    return tuple(permutation)
+
+
+def count_permutations(items: Sequence) -> int:
+    """Equivalent to len(list(permutations(items)))"""
+    return factorial(len(items))
@@ -1,15 +1,122 @@
 from __future__ import annotations
 
 from collections import Counter
-from itertools import chain, combinations, permutations, product
+from itertools import chain, combinations
 from math import prod
-from typing import Dict, Iterable, List, Set
+from typing import Dict, Iterable, List, Set, Tuple
 
+from custom_types import Synonyms
 from id_handling import remove_id
-from match_set_templating import join_list_with_comma_and
-from num2words import num2words
+from match_set_templating import join_list_with_comma_and, num2words
 
 from nlg_system.equality_functions import equal_except
+from nlg_system.iter_decoding import (
+    count_permutations,
+    nth_permutation,
+    nth_product_indices,
+)
+
+"""
+CLEVR has only a few attribute combinations and relations, but every explanation creates new
+CLEVRObjects and Relations. Their immutable parts are shared (flyweights): the attributes of an
+object (ObjectDescription, c.f. describe) and the synonyms of a set of attributes together with
+their mixed radix decoding (SynonymTable, c.f. synonym_table). A CLEVRObject is a thin view, which
+only holds the state of its question (e.g. required_attrs and describing_attrs).
+"""
+
+
+class ObjectDescription:
+    """the attributes of an object. The attrs must not be changed, as they are shared"""
+
+    __slots__ = ("attrs", "effective_length")
+
+    def __init__(self, size: str, color: str, material: str, shape: str) -> None:
+        self.attrs = {
+            "size": size,
+            "color": color,
+            "material": material,
+            "shape": shape,
+        }
+        self.effective_length = sum(
+            [attr != "" for attr in [size, color, material, shape]]
+        )
+
+
+_descriptions: Dict[Tuple[str, str, str, str], ObjectDescription] = {}
+
+
+def describe(size: str, color: str, material: str, shape: str) -> ObjectDescription:
+    key = (size, color, material, shape)
+    description = _descriptions.get(key)
+    if description is None:
+        description = _descriptions[key] = ObjectDescription(*key)
+    return description
+
+
+class SynonymTable:
+    """the synonyms of some attributes (in the order of the synonyms dict) and the decoding of their iters"""
+
+    __slots__ = (
+        "synonyms",
+        "key",
+        "positions",
+        "options",
+        "radices",
+        "max_iter",
+        "_indices",
+    )
+
+    def __init__(self, synonyms: Synonyms) -> None:
+        self.synonyms = synonyms
+        # hashable form of the synonyms
+        self.key = tuple((attr, tuple(options)) for attr, options in synonyms.items())
+        self.positions = {attr: i for i, attr in enumerate(synonyms)}
+        self.options = list(synonyms.values())
+        self.radices = [len(v) for v in self.options]
+        self.max_iter = prod(self.radices)
+        self._indices: Dict[int, Tuple[int, ...]] = {}
+
+    def indices(self, iter: int) -> Tuple[int, ...]:
+        """the synonym indices of the iter (c.f. nth_product_indices)"""
+        indices = self._indices.get(iter)
+        if indices is None:
+            indices = self._indices[iter] = nth_product_indices(self.radices, iter)
+        return indices
+
+    def synonym(self, attr: str, indices: Tuple[int, ...]) -> str:
+        position = self.positions.get(attr)
+        if position is None:
+            return attr
+        return self.options[position][indices[position]]
+
+
+EMPTY_SYNONYM_TABLE = SynonymTable({})
+
+# the synonyms dicts which are used by many questions (c.f. share_synonyms), by their id
+_shared_synonyms: Dict[int, Synonyms] = {}
+_synonym_tables: Dict[Tuple[int, Tuple[str, ...]], SynonymTable] = {}
+
+
+def share_synonyms(synonyms: Synonyms) -> Synonyms:
+    """
+    Marks a synonyms dict, so the synonym tables built from it are kept. The dict must not be
+    changed afterwards. Synonyms dicts which are not shared (e.g. ChainMaps) get a new table.
+    """
+    _shared_synonyms[id(synonyms)] = synonyms
+    return synonyms
+
+
+def synonym_table(attrs: Tuple[str, ...], synonyms: Synonyms) -> SynonymTable:
+    """the table of the synonyms of the given attribute values"""
+    if _shared_synonyms.get(id(synonyms)) is not synonyms:
+        return SynonymTable({k: v for k, v in synonyms.items() if k in attrs})
+    key = (id(synonyms), attrs)
+    table = _synonym_tables.get(key)
+    if table is None:
+        table = _synonym_tables[key] = SynonymTable(
+            {k: v for k, v in synonyms.items() if k in attrs}
+        )
+    return table
 
 
 class CLEVRObject:
@@ -18,19 +125,14 @@ class CLEVRObject:
         self.color = color
         self.material = material
         self.shape = shape
+        description = describe(size, color, material, shape)
         # the attrs are the main way to interact with the objects attributes
-        self.attrs = {
-            "size": self.size,
-            "color": self.color,
-            "material": self.material,
-            "shape": self.shape,
-        }
+        # they are shared with the description until they are muted (c.f. Objects.set_scene_settings)
+        self.attrs = description.attrs
 
         self.max_iter = 1
 
-        self.effective_length = sum(
-            [attr != "" for attr in [size, color, material, shape]]
-        )
+        self.effective_length = description.effective_length
 
         self.scene_struct = None
 
@@ -41,10 +143,14 @@ class CLEVRObject:
         # each unique_attr in unique_attrs has >= number of elements than self.required_attrs
         self.describing_attrs = [self.attrs.keys()]
 
-        self.synonyms: Dict[str, List[str]] = {}
+        self.synonym_table = EMPTY_SYNONYM_TABLE
 
         self.update_max_iter()
 
+    @property
+    def synonyms(self) -> Synonyms:
+        return self.synonym_table.synonyms
+
     def __eq__(self, other):
         return self.attrs == other.attrs
 
@@ -54,22 +160,15 @@ class CLEVRObject:
     def realize(self, iter: int = 0, complete_description: bool = False) -> str:
         assert 0 <= iter < self.max_iter
 
-        # create all possible synonym permutations
-        # permuted_synonyms = list(product(*self.synonyms.values()))
-        permuted_synonyms_indices = list(
-            product(*[range(len(v)) for v in self.synonyms.values()])
-        )
-
+        table = self.synonym_table
         attribute_synonym_iter = iter // len(self.describing_attrs)
-        description_iter = iter // prod([len(v) for v in self.synonyms.values()])
+        description_iter = iter // table.max_iter
+
+        # decode the synonym combination of this iter (instead of creating all synonym permutations)
+        synonym_indices = table.indices(attribute_synonym_iter)
 
         def attr2syn(attr):
-            if attr in self.synonyms.keys():
-                idx = list(self.synonyms.keys()).index(attr)
-                syn_idx = permuted_synonyms_indices[attribute_synonym_iter][idx]
-                return list(self.synonyms.values())[idx][syn_idx]
-            else:
-                return attr
+            return table.synonym(attr, synonym_indices)
 
         if complete_description:
             full_description = " ".join(
@@ -90,20 +189,13 @@ class CLEVRObject:
         # Technically the max_iter would be different for this, as we do not have the permutations
         assert 0 <= iter < self.max_iter
 
-        # create all possible synonym permutations
-        permuted_synonyms_indices = list(
-            product(*[range(len(v)) for v in self.synonyms.values()])
-        )
-
         attribute_synonym_iter = iter // len(self.describing_attrs)
 
+        # decode the synonym combination of this iter (instead of creating all synonym permutations)
+        synonym_indices = self.synonym_table.indices(attribute_synonym_iter)
+
         def attr2syn(attr):
-            if attr in self.synonyms.keys():
-                idx = list(self.synonyms.keys()).index(attr)
-                syn_idx = permuted_synonyms_indices[attribute_synonym_iter][idx]
-                return list(self.synonyms.values())[idx][syn_idx]
-            else:
-                return attr
+            return self.synonym_table.synonym(attr, synonym_indices)
 
         non_empty_attrs = {
             "size": self.size,
@@ -122,6 +214,17 @@ class CLEVRObject:
         assert self.required_attrs is not None
         scene_objects = self.scene_struct["objects"]
 
+        # the solution only depends on the scene, so it is shared by all questions of the scene
+        cache = self.scene_struct.setdefault("_unique_descriptions", {})
+        cache_key = (
+            tuple(self.attrs.values()),
+            frozenset(self.required_attrs),
+            self.lower_attr_count_bound,
+        )
+        if cache_key in cache:
+            self.describing_attrs = cache[cache_key]
+            return
+
         unique_attrs = []
         all_attrs = ["size", "color", "material", "shape"]
 
@@ -168,6 +271,7 @@ class CLEVRObject:
         # store it in describing_attrs
         assert len(unique_attrs) > 0
         self.describing_attrs = unique_attrs
+        cache[cache_key] = unique_attrs
 
     def __minimal_descriptions(self):
         """
@@ -225,7 +329,7 @@ class CLEVRObject:
         # TODO: It would be nicer to have this directly in __init__
 
         # We get all synonyms but we should restrict ourself to only those which are relevant to our attributes
-        self.synonyms = {k: v for k, v in synonyms.items() if k in self.attrs.values()}
+        self.synonym_table = synonym_table(tuple(self.attrs.values()), synonyms)
 
         self.update_max_iter()
 
@@ -234,8 +338,7 @@ class CLEVRObject:
         # NOTE: Actually, if a a unique combination does not need e.g. the size, those synonym variations are irrelevant
 
         # a synonym option of len 1 does not give us any extra choices
-        option_lens = [len(v) for v in self.synonyms.values()]
-        self.max_iter = prod(option_lens) * len(self.describing_attrs)
+        self.max_iter = self.synonym_table.max_iter * len(self.describing_attrs)
 
     @staticmethod
     def from_filters(filters: Dict[str, str]):
@@ -320,7 +423,7 @@ class Objects:
             self.effective_length = sum(
                 obj.effective_length for obj in self.multiple_objects
             )
-            self.permutation_max_iter = len(list(permutations(self.multiple_objects)))
+            self.permutation_max_iter = count_permutations(self.multiple_objects)
             self.objects_max_iter = prod(obj.max_iter for obj in self.multiple_objects)
             self.aggregation_mode = "some_identical"
         elif all(equal_except(self.objects[0], o, "size") for o in self.objects):
@@ -342,7 +445,7 @@ class Objects:
             self.numerus = "singular"
             self.determiner = "a"
             self.effective_length = self.objects[0].effective_length * len(self.objects)
-            self.permutation_max_iter = len(list(permutations(self.objects)))
+            self.permutation_max_iter = count_permutations(self.objects)
             self.objects_max_iter = prod(obj.max_iter for obj in self.objects)
             self.aggregation_mode = "all_different"
 
@@ -362,8 +465,17 @@ class Objects:
             raise StopIteration
 
     def realize(self, neg_evidence: bool = False, iter: int = 0) -> str:
+        """
+        Realizes the objects for the given iter.
+
+        The iter is decoded lazily (c.f. nlg_system.iter_decoding), so the cost is linear in the
+        number of objects instead of enumerating all permutations of them.
+        """
         assert 0 <= iter < self.max_iter
 
+        # the product is the same for any permutation of self.objects
+        objects_max_iter_product = prod(obj.max_iter for obj in self.objects)
+
         def object_iter(
             objects_list: List[CLEVRObject], iter: int, obj_idx: int,
         ) -> int:
@@ -378,15 +490,15 @@ class Objects:
             Returns:
                 int: the final iter
             """
-            all_other_objexts = objects_list[:obj_idx] + objects_list[obj_idx + 1 :]
-            iter = iter // (
-                self.permutation_max_iter
-                * prod(obj.max_iter for obj in all_other_objexts)
+            # product of the max_iters of all other objects
+            all_other_objects_max_iter = (
+                objects_max_iter_product // objects_list[obj_idx].max_iter
             )
+            iter = iter // (self.permutation_max_iter * all_other_objects_max_iter)
             return iter
 
         if len(self.objects) > 1:
-            permutation_iter = iter // prod(obj.max_iter for obj in self.objects)
+            permutation_iter = iter // objects_max_iter_product
         else:
             permutation_iter = 0
 
@@ -407,9 +519,7 @@ class Objects:
             return f"{self.determiner} {realized_object}s"
         elif len(set(self.objects)) < len(self.objects):
             # some objects are the same
-            permuted_objects = list(permutations(self.multiple_objects))[
-                permutation_iter
-            ]
+            permuted_objects = nth_permutation(self.multiple_objects, permutation_iter)
             realized_objs = [f"{obj.realize()}" for obj in permuted_objects]
             return join_list_with_comma_and(realized_objs)
         elif all(equal_except(self.objects[0], o, "size") for o in self.objects):
@@ -465,7 +575,7 @@ class Objects:
             else:
                 raise NotImplementedError
         else:
-            permuted_objects = list(permutations(self.objects))[permutation_iter]
+            permuted_objects = nth_permutation(self.objects, permutation_iter)
             realized_objects = [
                 obj.realize(object_iter(permuted_objects, iter, i))
                 for i, obj in enumerate(permuted_objects)
@@ -531,8 +641,12 @@ class Objects:
                 set(required_attrs) | set(extra_attrs) | set(["shape"])
             )
             for obj in self.objects:
-                for attr_to_mute in attrs_to_mute:
-                    obj.attrs[attr_to_mute] = "EMPTY"
+                if len(attrs_to_mute) > 0:
+                    # the attrs may be shared (c.f. ObjectDescription), so they are replaced
+                    obj.attrs = {
+                        attr: "EMPTY" if attr in attrs_to_mute else value
+                        for attr, value in obj.attrs.items()
+                    }
 
             self.__run_aggregation()
 
@@ -133,6 +133,13 @@ class ActiveSentence:
         if len(self.objects.negative_objects) > 0:
             return self.realize_negative_objects(iter)
 
+        relation_max_iter = 1
+        if self.relation is not None and self.relation_object is not None:
+            relation_max_iter = self.relation.max_iter * self.relation_object.max_iter
+
+        # computed once, so each object_iter call is constant instead of linear in the number of objects
+        objects_max_iter_product = prod(obj.max_iter for obj in self.objects.objects)
+
         def object_iter(
             objects_list: List[CLEVRObject], iter: int, obj_idx: int,
         ) -> int:
@@ -147,16 +154,11 @@ class ActiveSentence:
             Returns:
                 int: the final iter
             """
-            relation_max_iter = 1
-            if self.relation is not None and self.relation_object is not None:
-                relation_max_iter = (
-                    self.relation.max_iter * self.relation_object.max_iter
-                )
-
-            all_other_objects = objects_list[:obj_idx] + objects_list[obj_idx + 1 :]
-            iter = iter // (
-                prod(obj.max_iter for obj in all_other_objects) * relation_max_iter
+            # product of the max_iters of all other objects
+            all_other_objects_max_iter = (
+                objects_max_iter_product // objects_list[obj_idx].max_iter
             )
+            iter = iter // (all_other_objects_max_iter * relation_max_iter)
 
             return iter
 
@@ -364,11 +366,10 @@ class CompositeSentence:
             assert 0 <= iter < self.max_iter
 
             realized_sentences = []
+            prev_max_iters = 1
             for i, sentence in enumerate(self.sentences):
-                prev_max_iters = prod(
-                    sentence.max_iter for sentence in self.sentences[:i]
-                )
                 current_iter = iter // prev_max_iters % sentence.max_iter
+                prev_max_iters *= sentence.max_iter
                 include_period = True
                 if i == 0:
                     new_sentence = sentence.realize(
@@ -398,11 +399,10 @@ class CompositeSentence:
             assert 0 <= iter < self.max_iter
 
             realized_sentences = []
+            prev_max_iters = 1
             for i, sentence in enumerate(self.sentences):
-                prev_max_iters = prod(
-                    sentence.max_iter for sentence in self.sentences[:i]
-                )
                 current_iter = iter // prev_max_iters % sentence.max_iter
+                prev_max_iters *= sentence.max_iter
                 realized_sentence = sentence.realize(
                     neg_evidence=neg_evidence, iter=current_iter,
                 )
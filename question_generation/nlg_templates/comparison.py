@@ -9,7 +9,7 @@ from nlg_system.sentences import (
     SentenceGroup,
 )
 
-from nlg_templates.nlg_utils import compute_iters
+from nlg_templates.nlg_utils import SentencePlan
 
 
 def comparison(
@@ -118,6 +118,5 @@ def comparison(
         raise NotImplementedError
 
     sg = SentenceGroup(sentences)
-    iters = compute_iters(sg)
-    return [sg.realize(neg_evidence=True, iter=iter) for iter in iters]
+    return SentencePlan(sg)
 
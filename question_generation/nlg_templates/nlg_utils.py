@@ -1,6 +1,6 @@
 import random
 import sys
-from typing import List, Union
+from typing import List, NamedTuple, Union
 
 from id_handling import get_id
 from nlg_system.clauses import RelativeClause
@@ -8,13 +8,30 @@ from nlg_system.objects import CLEVRObject, Objects
 from nlg_system.sentences import CompositeSentence, Sentence, SentenceGroup
 
 
+class SentencePlan(NamedTuple):
+    """the sentence (group) of an explanation, which the NLG templates build, and how to realize it"""
+
+    component: Union[Sentence, CompositeSentence, SentenceGroup]
+    neg_evidence: bool = True
+
+
 def compute_iters(
-    component: Union[Sentence, CompositeSentence, SentenceGroup], k: int = 10
+    component: Union[Sentence, CompositeSentence, SentenceGroup], k: int = 10, rng=random
 ) -> List[int]:
+    """
+    Samples k iters of the component.
+
+    The components decode any iter below their max_iter lazily, so max_iter may grow far beyond
+    sys.maxsize for scenes with many objects. random.choices cannot sample from such a range, in this
+    case the iters are drawn from the first sys.maxsize variants, which keeps the random number
+    generation identical to the one used for the official dataset release.
+
+    The iters are drawn from rng, the global random state by default (c.f. search_results.py).
+    """
     try:
-        iters = random.choices(range(component.max_iter), k=k)
+        iters = rng.choices(range(component.max_iter), k=k)
     except OverflowError:
-        iters = random.choices(range(sys.maxsize), k=k)
+        iters = rng.choices(range(sys.maxsize), k=k)
 
     return iters
 
@@ -9,7 +9,7 @@ from nlg_system.sentences import (
     SentenceGroup,
 )
 
-from nlg_templates.nlg_utils import compute_iters
+from nlg_templates.nlg_utils import SentencePlan
 
 
 def one_hop(
@@ -48,5 +48,4 @@ def one_hop(
         raise NotImplementedError
 
     sg = SentenceGroup(sentences)
-    iters = compute_iters(sg)
-    return [sg.realize(neg_evidence=True, iter=iter) for iter in iters]
+    return SentencePlan(sg)
@@ -15,7 +15,7 @@ from nlg_system.sentences import (
     SentenceGroup,
 )
 
-from nlg_templates.nlg_utils import compute_iters
+from nlg_templates.nlg_utils import SentencePlan
 
 
 def same_relate(
@@ -131,5 +131,4 @@ def same_relate(
         raise NotImplementedError
 
     sg = SentenceGroup(sentences)
-    iters = compute_iters(sg)
-    return [sg.realize(neg_evidence=True, iter=iter) for iter in iters]
+    return SentencePlan(sg)
@@ -4,7 +4,7 @@ from nlg_system.clauses import Relation, RelativeClause
 from nlg_system.objects import CLEVRObject, Objects
 from nlg_system.sentences import CompositeSentence, Sentence
 
-from nlg_templates.nlg_utils import compute_iters
+from nlg_templates.nlg_utils import SentencePlan
 
 
 # FIXME: Remove negative evidence and look at outputs
@@ -59,5 +59,4 @@ def single_or(
         raise NotImplementedError
 
     cs = CompositeSentence(sentences)
-    iters = compute_iters(cs)
-    return [cs.realize(neg_evidence=not drop_neg_evidence, iter=iter) for iter in iters]
+    return SentencePlan(cs, neg_evidence=not drop_neg_evidence)
@@ -4,7 +4,7 @@ from nlg_system.clauses import Relation, RelativeClause
 from nlg_system.objects import CLEVRObject, Objects
 from nlg_system.sentences import CompositeSentence, Sentence
 
-from nlg_templates.nlg_utils import compute_iters
+from nlg_templates.nlg_utils import SentencePlan
 
 
 def three_hop(
@@ -30,5 +30,4 @@ def three_hop(
         raise NotImplementedError
 
     cs = CompositeSentence(sentences)
-    iters = compute_iters(cs)
-    return [cs.realize(neg_evidence=True, iter=iter) for iter in iters]
+    return SentencePlan(cs)
@@ -0,0 +1,302 @@
+# converts the CLEVR scene and question json files into a single memory-mappable binary file
+
+import argparse
+import json
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from custom_types import Metadata, Scene_Struct
+from scene_store import (
+    SceneStore,
+    build_scene_arrays,
+    encode_strings,
+    map_file,
+    prefixed,
+    read_arrays,
+    section,
+    write_arrays,
+)
+
+"""
+Parsing CLEVR_*_scenes.json and CLEVR_*_questions.json takes most of the startup time of
+generate_explanations.py. This script converts both once into a columnar binary file:
+
+- the scenes as in scene_store.py (attribute codes, relation adjacency, filenames)
+- one column per question key: integers as int64 arrays, strings as string tables
+  (offsets + utf-8 bytes) and anything else as a string table of json
+- the programs as node tables: node ranges per question, function codes and the inputs and
+  value inputs of the nodes as lists of codes
+
+The file is memory-mapped, questions are decoded on access (PreprocessedDataset.questions[i]) into
+exactly the dicts of the json file, including their key order.
+
+Example:
+    python preprocess.py --input_scene_file ../output/CLEVR_val_scenes.json \\
+        --input_questions_file ../output/CLEVR_val_questions.json \\
+        --output_file ../output/CLEVR_val.bin
+    python generate_explanations.py --input_preprocessed_file ../output/CLEVR_val.bin
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--input_scene_file", default="../output/CLEVR_scenes.json")
+parser.add_argument("--input_questions_file", default="../output/CLEVR_questions.json")
+parser.add_argument("--metadata_file", default="metadata.json")
+parser.add_argument("--output_file", default="../output/CLEVR_preprocessed.bin")
+
+
+def column_kind(values: List[Any]) -> str:
+    if all(type(v) is int for v in values):
+        return "int"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    if all(isinstance(v, list) and all(type(x) is int for x in v) for v in values):
+        return "int_list"
+    if all(isinstance(v, list) and all(isinstance(x, str) for x in v) for v in values):
+        return "category_list"
+    return "json"
+
+
+def encode_column(
+    name: str, kind: str, values: List[Any]
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """returns the spec (stored in the header) and the arrays of the column"""
+    spec: Dict[str, Any] = {"kind": kind}
+    if kind == "int":
+        return spec, {name: np.array(values, dtype=np.int64)}
+    if kind == "category":
+        vocab = list(dict.fromkeys(values))
+        codes = {v: c for c, v in enumerate(vocab)}
+        spec["vocab"] = vocab
+        return spec, {name: np.array([codes[v] for v in values], dtype=np.uint16)}
+    if kind in ["int_list", "category_list"]:
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(v) for v in values])
+        flat = [x for v in values for x in v]
+        if kind == "int_list":
+            flat_values = np.array(flat, dtype=np.int32)
+        else:
+            vocab = list(dict.fromkeys(flat))
+            codes = {v: c for c, v in enumerate(vocab)}
+            spec["vocab"] = vocab
+            flat_values = np.array([codes[v] for v in flat], dtype=np.uint16)
+        return spec, {f"{name}/offsets": offsets, f"{name}/values": flat_values}
+
+    if kind == "json":
+        values = [json.dumps(v) for v in values]
+    offsets, data = encode_strings(values)
+    return spec, {f"{name}/offsets": offsets, f"{name}/bytes": data}
+
+
+def decode_column(
+    spec: Dict, arrays: Dict[str, np.ndarray], name: str, begin: int, end: int
+) -> List[Any]:
+    """the values of the rows begin:end"""
+    kind = spec["kind"]
+    if kind == "int":
+        return arrays[name][begin:end].tolist()
+    if kind == "category":
+        return [spec["vocab"][c] for c in arrays[name][begin:end].tolist()]
+    if kind in ["int_list", "category_list"]:
+        offsets = arrays[f"{name}/offsets"][begin : end + 1].tolist()
+        flat = arrays[f"{name}/values"][offsets[0] : offsets[-1]].tolist()
+        if kind == "category_list":
+            flat = [spec["vocab"][c] for c in flat]
+        return [
+            flat[a - offsets[0] : b - offsets[0]] for a, b in zip(offsets, offsets[1:])
+        ]
+
+    offsets = arrays[f"{name}/offsets"][begin : end + 1].tolist()
+    data = arrays[f"{name}/bytes"][offsets[0] : offsets[-1]].tobytes()
+    strings = [
+        data[a - offsets[0] : b - offsets[0]].decode("utf-8")
+        for a, b in zip(offsets, offsets[1:])
+    ]
+    if kind == "json":
+        return [json.loads(s) for s in strings]
+    return strings
+
+
+def node_keys(programs: List[List[Dict]]) -> Optional[List[str]]:
+    """the common keys of all program nodes or None if they differ between nodes"""
+    keys = None
+    for program in programs:
+        for node in program:
+            if keys is None:
+                keys = list(node.keys())
+            elif list(node.keys()) != keys:
+                return None
+    return keys
+
+
+def encode_programs(
+    name: str, programs: List[List[Dict]]
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    keys = node_keys(programs)
+    if keys is None:
+        return encode_column(name, "json", programs)
+
+    nodes = [node for program in programs for node in program]
+    offsets = np.zeros(len(programs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(program) for program in programs])
+    spec: Dict[str, Any] = {"kind": "program", "node_keys": keys, "node_columns": {}}
+    arrays = {f"{name}/offsets": offsets}
+    for key in keys:
+        values = [node[key] for node in nodes]
+        kind = column_kind(values)
+        # e.g. the function names of the nodes
+        kind = "category" if kind == "str" else kind
+        spec["node_columns"][key], key_arrays = encode_column(
+            f"{name}/{key}", kind, values
+        )
+        arrays.update(key_arrays)
+    return spec, arrays
+
+
+def decode_program(
+    spec: Dict, arrays: Dict[str, np.ndarray], name: str, question_idx: int
+) -> List[Dict]:
+    begin, end = arrays[f"{name}/offsets"][question_idx : question_idx + 2].tolist()
+    columns = [
+        decode_column(spec["node_columns"][key], arrays, f"{name}/{key}", begin, end)
+        for key in spec["node_keys"]
+    ]
+    return [dict(zip(spec["node_keys"], values)) for values in zip(*columns)]
+
+
+def build_question_arrays(
+    questions: List[Dict], info: Dict
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    keys = list(questions[0].keys()) if len(questions) > 0 else []
+    assert all(
+        list(q.keys()) == keys for q in questions
+    ), "all questions must have the same keys"
+
+    header: Dict[str, Any] = {"info": info, "keys": keys, "columns": {}}
+    arrays: Dict[str, np.ndarray] = {}
+    for key in keys:
+        values = [q[key] for q in questions]
+        if key == "program":
+            spec, key_arrays = encode_programs(key, values)
+        else:
+            kind = column_kind(values)
+            kind = "json" if kind.endswith("_list") else kind
+            spec, key_arrays = encode_column(key, kind, values)
+        header["columns"][key] = spec
+        arrays.update(key_arrays)
+    return header, arrays
+
+
+class QuestionTable(Sequence):
+    """decodes the questions on access, slicing returns a view"""
+
+    def __init__(
+        self,
+        header: Dict,
+        arrays: Dict[str, np.ndarray],
+        begin: int = 0,
+        end: Optional[int] = None,
+    ) -> None:
+        self.header = header
+        self.arrays = arrays
+        self.info: Dict = header["info"]
+        num_questions = self._num_rows()
+        self.begin, self.end = slice(begin, end).indices(num_questions)[:2]
+        self.end = max(self.begin, self.end)
+
+    def _num_rows(self) -> int:
+        if len(self.header["keys"]) == 0:
+            return 0
+        key = self.header["keys"][0]
+        if key in self.arrays:
+            return len(self.arrays[key])
+        return len(self.arrays[f"{key}/offsets"]) - 1
+
+    def __len__(self) -> int:
+        return self.end - self.begin
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            assert idx.step in [None, 1], "only contiguous slices are supported"
+            begin, end = slice(idx.start, idx.stop).indices(len(self))[:2]
+            return QuestionTable(
+                self.header, self.arrays, self.begin + begin, self.begin + end
+            )
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        row = self.begin + idx
+
+        question = {}
+        for key in self.header["keys"]:
+            spec = self.header["columns"][key]
+            if spec["kind"] == "program":
+                question[key] = decode_program(spec, self.arrays, key, row)
+            else:
+                question[key] = decode_column(spec, self.arrays, key, row, row + 1)[0]
+        return question
+
+
+class PreprocessedDataset:
+    """the memory-mapped output of preprocess.py"""
+
+    def __init__(self, path: str) -> None:
+        self._buffer = map_file(path)
+        header, arrays = read_arrays(self._buffer)
+        assert header["format"] == "preprocessed", "not a preprocessed dataset"
+        self.scenes = SceneStore(self._buffer)
+        self.questions = QuestionTable(*section(header, arrays, "questions"))
+        self.info = self.scenes.info
+
+    def close(self) -> None:
+        self.scenes.close()
+        self.questions.arrays = {}
+        self._buffer.close()
+
+
+def preprocess(
+    path: str,
+    scene_data: Dict,
+    questions_data: Dict,
+    metadata: Metadata,
+) -> None:
+    scenes: List[Scene_Struct] = scene_data["scenes"]
+    scene_header, scene_arrays = build_scene_arrays(scenes, metadata)
+    question_header, question_arrays = build_question_arrays(
+        questions_data["questions"], questions_data["info"]
+    )
+    header = {
+        "format": "preprocessed",
+        "scenes": {**scene_header, "info": scene_data["info"]},
+        "questions": question_header,
+    }
+    write_arrays(
+        path,
+        header,
+        {**prefixed("scenes", scene_arrays), **prefixed("questions", question_arrays)},
+    )
+
+
+def main(args):
+    with open(args.metadata_file, "r") as f:
+        metadata = json.load(f)
+    with open(args.input_scene_file, "r") as f:
+        scene_data = json.load(f)
+    with open(args.input_questions_file, "r") as f:
+        questions_data = json.load(f)
+
+    preprocess(args.output_file, scene_data, questions_data, metadata)
+    print(
+        "Wrote %d scenes and %d questions to %s"
+        % (
+            len(scene_data["scenes"]),
+            len(questions_data["questions"]),
+            args.output_file,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
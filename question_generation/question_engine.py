@@ -5,10 +5,11 @@
 # LICENSE file in the root directory of this source tree. An additional grant
 # of patent rights can be found in the PATENTS file in the same directory.
 
-from typing import Any, List, Literal, Tuple, Union
+from typing import Any, Dict, List, Literal, Set, Tuple, Union
 
 from custom_types import (Attribute, Inputs, Metadata, Node, Scene_Struct,
                           Side_Inputs)
+from search_types import ABSENT, NodeCode, ProgramNode, node_code
 
 """
 Utilities for working with function program representations of questions.
@@ -29,14 +30,26 @@ def scene_handler(scene_struct: Scene_Struct, inputs: Inputs, side_inputs: Side_
   return list(range(len(scene_struct['objects'])))
 
 
+def get_attribute_column(scene_struct: Scene_Struct, attribute: Attribute) -> List[str]:
+  # the attribute values of all objects, the scenes of a scene store keep them as columns (c.f. scene_store.StoredScene)
+  columns = getattr(scene_struct, 'columns', None)
+  if columns is not None and attribute in columns:
+    return columns[attribute]
+  cache_key = '_column_%s' % attribute
+  if cache_key not in scene_struct:
+    scene_struct[cache_key] = [obj[attribute] for obj in scene_struct['objects']]  # type: ignore
+  return scene_struct[cache_key]  # type: ignore
+
+
 def make_filter_handler(attribute: Union[Attribute, Literal["objectcategory"]]):
   def filter_handler(scene_struct: Scene_Struct, inputs: List[Inputs], side_inputs: Side_Inputs):
     assert len(inputs) == 1
     assert len(side_inputs) == 1
     value = side_inputs[0]
+    column = get_attribute_column(scene_struct, attribute)  # type: ignore
     output = []
     for idx in inputs[0]:
-      atr = scene_struct['objects'][idx][attribute]  # type: ignore
+      atr = column[idx]
       if value == atr or value in atr:
         output.append(idx)
     return output
@@ -60,6 +73,30 @@ def vg_relate_handler(scene_struct, inputs: Inputs, side_inputs: Side_Inputs) ->
   return sorted(list(output))
 
 
+def get_relationship_sets(scene_struct: Scene_Struct) -> Dict[str, List[Set[int]]]:
+  # cache the related objects of all objects as sets, the sets must not be modified
+  if '_relationship_sets' not in scene_struct:
+    scene_struct['_relationship_sets'] = {  # type: ignore
+      relation: [set(related) for related in all_related]
+      for relation, all_related in scene_struct['relationships'].items()
+    }
+  return scene_struct['_relationship_sets']  # type: ignore
+
+
+def get_same_attr_cache(scene_struct: Scene_Struct, attribute: Attribute) -> Dict[int, List[int]]:
+  # cache all possible similarities
+  cache_key = '_same_%s' % attribute
+  if cache_key not in scene_struct:
+    column = get_attribute_column(scene_struct, attribute)
+    # group the objects by their value instead of comparing all pairs
+    groups: Dict[str, List[int]] = {}
+    for i, value in enumerate(column):
+      groups.setdefault(value, []).append(i)
+    cache = {i: [j for j in groups[value] if j != i] for i, value in enumerate(column)}
+    scene_struct[cache_key] = cache  # type: ignore
+  return scene_struct[cache_key]  # type: ignore
+
+
 def relate_handler(scene_struct: Scene_Struct, inputs: Tuple[Inputs, List[Inputs]], side_inputs: Side_Inputs):
   assert len(inputs) == 1
   assert len(side_inputs) == 1
@@ -67,7 +104,8 @@ def relate_handler(scene_struct: Scene_Struct, inputs: Tuple[Inputs, List[Inputs
   if type(inputs[0]) == int:
     return scene_struct['relationships'][relation][inputs[0]]
   else:
-    all_results = [set(scene_struct['relationships'][relation][i]) for i in inputs[0]]
+    relationship_sets = get_relationship_sets(scene_struct)
+    all_results = [relationship_sets[relation][i] for i in inputs[0]]
     joint_result = set.intersection(*all_results) if len(all_results) > 0 else set()
     return list(joint_result)
     
@@ -97,19 +135,7 @@ def count_handler(scene_struct: Scene_Struct, inputs: List[Inputs], side_inputs:
 
 def make_same_attr_handler(attribute: Attribute):
   def same_attr_handler(scene_struct: Scene_Struct, inputs: Inputs, side_inputs: Side_Inputs):
-    # cache all possible similarities
-    cache_key = '_same_%s' % attribute
-    if cache_key not in scene_struct:
-      cache = {}
-      for i, obj1 in enumerate(scene_struct['objects']):
-        same = []
-        for j, obj2 in enumerate(scene_struct['objects']):
-          if i != j and obj1[attribute] == obj2[attribute]:
-            same.append(j)
-        cache[i] = same
-      scene_struct[cache_key] = cache  # type: ignore
-
-    cache = scene_struct[cache_key]  # type: ignore
+    cache = get_same_attr_cache(scene_struct, attribute)
 
     # Hotpatch Multilayered Lists
     if type(inputs) == list:
@@ -127,19 +153,7 @@ def make_same_attr_handler(attribute: Attribute):
 
 def make_different_attr_handler(attribute: Attribute):
   def different_attr_handler(scene_struct: Scene_Struct, inputs: Inputs, side_inputs: Side_Inputs):
-    # cache all possible similarities
-    cache_key = '_same_%s' % attribute
-    if cache_key not in scene_struct:
-      cache = {}
-      for i, obj1 in enumerate(scene_struct['objects']):
-        same = []
-        for j, obj2 in enumerate(scene_struct['objects']):
-          if i != j and obj1[attribute] == obj2[attribute]:
-            same.append(j)
-        cache[i] = same
-      scene_struct[cache_key] = cache  # type: ignore
-
-    cache = scene_struct[cache_key]  # type: ignore
+    cache = get_same_attr_cache(scene_struct, attribute)
 
     # Hotpatch Multilayered Lists
     if type(inputs) == list:
@@ -258,6 +272,20 @@ execute_handlers = {
 }
 
 
+def execute_code(scene_struct: Scene_Struct, code: NodeCode, node_inputs: List, side_inputs: Side_Inputs):
+  """executes a node by its parsed type (c.f. search_types.node_code)"""
+  msg = 'Could not find handler for "%s"' % code.type
+  assert code.type in execute_handlers, msg
+  handler = execute_handlers[code.type]
+  if "amputated" in code.type:
+    return handler(scene_struct, node_inputs, side_inputs, list(code.baggage))
+  return handler(scene_struct, node_inputs, side_inputs)
+
+
+def execute_node(scene_struct: Scene_Struct, node_type: str, node_inputs: List, side_inputs: Side_Inputs):
+  return execute_code(scene_struct, node_code(node_type), node_inputs, side_inputs)
+
+
 def answer_question(question, metadata: Metadata, scene_struct: Scene_Struct, all_outputs: bool=False, cache_outputs: bool=True) -> List[int]:
   """
   Use structured scene information to answer a structured question. Most of the
@@ -272,20 +300,19 @@ def answer_question(question, metadata: Metadata, scene_struct: Scene_Struct, al
   all_output_types: List = []
   node_outputs: List = []
   for node in question['nodes']:
-    if cache_outputs and '_output' in node:
+    if type(node) is ProgramNode:
+      # the nodes of the search are read by attribute (c.f. search_types.py)
+      node_output = node._output if cache_outputs else ABSENT
+      if node_output is ABSENT:
+        side_inputs = node.side_inputs if node.side_inputs is not ABSENT else []
+        node_output = execute_code(scene_struct, node.code, [node_outputs[idx] for idx in node.inputs], side_inputs)
+        if cache_outputs:
+          node._output = node_output
+    elif cache_outputs and '_output' in node:
       node_output = node['_output']
     else:
-      node_type = node['type'].split(";")[0]
-      node_baggage = [int(item) for item in node['type'].split(";")[1:]]
-      msg = 'Could not find handler for "%s"' % node_type
-      assert node_type in execute_handlers, msg
-      handler = execute_handlers[node_type]
       node_inputs = [node_outputs[idx] for idx in node['inputs']]
-      side_inputs = node.get('side_inputs', [])
-      if "amputated" in node_type:
-        node_output = handler(scene_struct, node_inputs, side_inputs, node_baggage)
-      else:
-        node_output = handler(scene_struct, node_inputs, side_inputs)
+      node_output = execute_node(scene_struct, node['type'], node_inputs, node.get('side_inputs', []))
       if cache_outputs:
         node['_output'] = node_output
     node_outputs.append(node_output)
@@ -0,0 +1,125 @@
+# memoizes the realizations of the sentence plans of the NLG templates across questions
+
+import random
+from typing import Dict, List, Tuple
+
+from nlg_system.clauses import Relation
+from nlg_system.objects import CLEVRObject, Objects
+from nlg_templates.nlg_utils import SentencePlan, compute_iters
+from sub_program_cache import SubProgramCache
+
+"""
+The NLG templates build a sentence plan for every question and realize the sampled iters of it.
+Many questions lead to the same plan: the same template, the same objects with the same attributes,
+descriptions and synonyms and the same relations. The plans are cached in a bounded LRU cache keyed
+by such a signature (c.f. plan_signature) together with the texts of the iters realized so far.
+
+The iters are still sampled with compute_iters for every question, so the random state is the same
+with and without the cache. A realization is not quite a function of the plan and the iter though:
+realizing a relation sets the determiner of its objects to "the", which changes the texts of later
+iters of the same question (e.g. the shared objects of same_relate). The determiners of the objects
+are the only state a realization changes, so each text is stored with the determiners before and
+after it, and the determiners are restored on the plan before an iter is realized.
+
+The iters are drawn from all variants of a plan, which are often far more than a question ever
+realizes again. Each plan therefore keeps at most max_texts texts (the first ones realized), so
+the memory of the cache is bounded by --realization_cache_size plans of max_texts texts each.
+
+The signature is exact, so it includes the synonyms the question has used and the descriptions of
+all objects of the answer. On the synthetic scenes only a few percent of the plans repeat, hence the
+cache is off by default (c.f. --realization_cache_size).
+"""
+
+Determiners = Tuple[str, ...]
+
+# the texts kept per plan, the plans of small scenes have fewer variants than that
+MAX_TEXTS = 64
+
+
+def object_signature(obj: CLEVRObject) -> Tuple:
+    return (
+        obj.size,
+        obj.color,
+        obj.material,
+        obj.shape,
+        tuple(obj.attrs.values()),
+        tuple(tuple(attrs) for attrs in obj.describing_attrs),
+        obj.synonym_table.key,
+    )
+
+
+def objects_signature(objects: Objects) -> Tuple:
+    return (
+        tuple(object_signature(obj) for obj in objects.objects),
+        tuple(object_signature(obj) for obj in objects.negative_objects),
+        objects.determiner,
+        objects.numerus,
+        objects.aggregation,
+        objects.unique_descriptions,
+    )
+
+
+def plan_signature(
+    template_info: Tuple[str, int],
+    filter_to_objects: Dict[str, Objects],
+    filter_to_relation: Dict[str, Relation],
+    id_to_attrs: Dict[str, Dict[str, List[str]]],
+) -> Tuple:
+    """everything the NLG templates read to build the sentence plan of a question"""
+    return (
+        template_info,
+        tuple((id, objects_signature(o)) for id, o in filter_to_objects.items()),
+        tuple(
+            (id, r.relation, r.synonym_table.key)
+            for id, r in filter_to_relation.items()
+        ),
+        tuple(
+            (id, tuple(attrs["required"]), tuple(attrs["extra"]))
+            for id, attrs in id_to_attrs.items()
+        ),
+    )
+
+
+class RealizedPlan:
+    """a sentence plan with the texts of the iters realized so far"""
+
+    def __init__(
+        self, plan: SentencePlan, objects: List[Objects], max_texts: int = MAX_TEXTS
+    ) -> None:
+        self.plan = plan
+        self.max_texts = max_texts
+        # the objects of the plan, whose determiners may change during a realization
+        self.objects = objects
+        self.initial_determiners = self.determiners()
+        self.texts: Dict[Tuple[Determiners, int], Tuple[str, Determiners]] = {}
+
+    def determiners(self) -> Determiners:
+        return tuple(objects.determiner for objects in self.objects)
+
+    def realize(self, iters: List[int]) -> List[str]:
+        """the texts of the iters, as if they were realized in order on a new plan"""
+        determiners = self.initial_determiners
+        texts = []
+        for iter in iters:
+            key = (determiners, iter)
+            realized = self.texts.get(key)
+            if realized is None:
+                for objects, determiner in zip(self.objects, determiners):
+                    objects.determiner = determiner
+                text = self.plan.component.realize(
+                    neg_evidence=self.plan.neg_evidence, iter=iter
+                )
+                realized = (text, self.determiners())
+                if len(self.texts) < self.max_texts:
+                    self.texts[key] = realized
+            text, determiners = realized
+            texts.append(text)
+        return texts
+
+    def sample(self, rng=random) -> List[str]:
+        """realizes the iters sampled by compute_iters"""
+        return self.realize(compute_iters(self.plan.component, rng=rng))
+
+
+class RealizationCache(SubProgramCache):
+    """LRU cache for the RealizedPlans by their plan_signature"""
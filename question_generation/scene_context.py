@@ -0,0 +1,75 @@
+# groups the questions by image, so that the per scene work is shared by all questions of an image
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from custom_types import Metadata, Scene_Struct
+from filters import precompute_filter_options
+from question_engine import get_relationship_sets, get_same_attr_cache
+
+"""
+CLEVR has about 10 questions per image. The engine caches everything that only depends on
+the scene in the scene struct itself (all keys starting with "_", e.g. "_filter_options",
+"_same_color" or "_unique_descriptions"), so that these caches are shared by all questions of an image.
+
+generate_explanations.main processes the questions image by image: the caches of a scene are
+warmed once, when its first question is processed, and dropped after its last one. This way
+the memory stays bounded by a single scene, instead of growing with all scenes of the split.
+
+The questions are never reordered, as the explanations draw from the global random state.
+Thus, a group is a run of consecutive questions on the same image. The CLEVR question files
+are ordered by image, i.e. there is exactly one group per image.
+"""
+
+ATTRIBUTES = ["size", "color", "material", "shape"]
+
+
+def index_scenes(scenes: List[Scene_Struct]) -> Dict[str, List[Scene_Struct]]:
+    """maps image filenames to their scenes (a list, to detect duplicates)"""
+    scenes_by_filename: Dict[str, List[Scene_Struct]] = {}
+    for scene_struct in scenes:
+        scenes_by_filename.setdefault(scene_struct["image_filename"], []).append(
+            scene_struct
+        )
+    return scenes_by_filename
+
+
+def group_questions_by_image(
+    questions: List[Dict],
+) -> Iterator[Tuple[str, List[Tuple[int, Dict]]]]:
+    """yields (image_filename, [(question_idx, question), ...]) for each run of consecutive questions on the same image"""
+    group: List[Tuple[int, Dict]] = []
+    for i, question in enumerate(questions):
+        if (
+            len(group) > 0
+            and group[0][1]["image_filename"] != question["image_filename"]
+        ):
+            yield group[0][1]["image_filename"], group
+            group = []
+        group.append((i, question))
+    if len(group) > 0:
+        yield group[0][1]["image_filename"], group
+
+
+def warm_scene_caches(scene_struct: Scene_Struct, metadata: Metadata) -> None:
+    """precomputes the caches, which are otherwise computed lazily by the first question that needs them"""
+    if "_filter_options" not in scene_struct:
+        precompute_filter_options(scene_struct, metadata)
+    for attribute in ATTRIBUTES:
+        get_same_attr_cache(scene_struct, attribute)  # type: ignore
+    get_relationship_sets(scene_struct)
+
+
+def release_scene_caches(scene_struct: Scene_Struct) -> None:
+    for key in [k for k in scene_struct if k.startswith("_")]:
+        del scene_struct[key]  # type: ignore
+
+
+@contextmanager
+def scene_context(scene_struct: Scene_Struct, metadata: Metadata):
+    """warm caches for all questions of a scene, which are released afterwards"""
+    warm_scene_caches(scene_struct, metadata)
+    try:
+        yield scene_struct
+    finally:
+        release_scene_caches(scene_struct)
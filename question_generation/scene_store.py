@@ -0,0 +1,375 @@
+# compact, read-only scene store, which is shared zero-copy between processes
+
+import argparse
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from math import prod
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from custom_types import Metadata, Object, Scene_Struct
+
+"""
+Loading CLEVR_*_scenes.json takes long and each process holds its own copy of all scene dicts.
+The scene store keeps the parts of the scenes, which the engine reads (attributes, relationships,
+filenames), in a few flat arrays:
+
+- attr_codes: one row of attribute codes (size, color, material, shape) per object
+- object_offsets: scene i owns the objects object_offsets[i]:object_offsets[i + 1]
+- relation_offsets, relation_indices: for each relation the related objects as CSR
+  (relation_indices[relation_offsets[r, o]:relation_offsets[r, o + 1]] for object o)
+- filename_offsets, filename_bytes: the utf-8 encoded image filenames
+- image_index
+
+The store is a single file (a json header followed by the aligned arrays). It is either
+memory-mapped (all processes share the page cache) or copied into a multiprocessing.shared_memory
+block once and attached to by name. In both cases the arrays are views, nothing is copied or
+parsed per process. scene_struct(i) decodes a scene into the usual dict, on which question_engine,
+filters and the NLG work as before.
+
+Example:
+    python scene_store.py --input_scene_file ../output/CLEVR_val_scenes.json \\
+        --output_store_file ../output/CLEVR_val_scenes.bin
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--input_scene_file", default="../output/CLEVR_scenes.json")
+parser.add_argument("--metadata_file", default="metadata.json")
+parser.add_argument("--output_store_file", default="../output/CLEVR_scenes.bin")
+
+MAGIC = b"CLEVRXCB"
+ALIGNMENT = 64
+ATTRIBUTES = ["size", "color", "material", "shape"]
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_arrays(path: str, header: Dict, arrays: Dict[str, np.ndarray]) -> None:
+    """writes a json header and the arrays (each aligned to ALIGNMENT bytes) into a single file"""
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += array.nbytes
+    header_bytes = json.dumps({**header, "arrays": layout}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+
+
+def read_header(buffer) -> Tuple[Dict, int]:
+    """the json header of a file written by write_arrays and the start of its arrays"""
+    assert bytes(buffer[: len(MAGIC)]) == MAGIC, "Unrecognized file format"
+    (header_size,) = struct.unpack("<Q", bytes(buffer[len(MAGIC) : len(MAGIC) + 8]))
+    header_start = len(MAGIC) + 8
+    header = json.loads(bytes(buffer[header_start : header_start + header_size]))
+    return header, _align(header_start + header_size)
+
+
+def read_arrays(buffer) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """the inverse of write_arrays, the arrays are read-only views into buffer"""
+    header, data_start = read_header(buffer)
+    arrays = {}
+    for name, layout in header.pop("arrays").items():
+        dtype = np.dtype(layout["dtype"])
+        array = np.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=prod(layout["shape"]),
+            offset=data_start + layout["offset"],
+        )
+        arrays[name] = array.reshape(layout["shape"])
+    return header, arrays
+
+
+def map_file(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def prefixed(prefix: str, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {f"{prefix}/{name}": array for name, array in arrays.items()}
+
+
+def section(
+    header: Dict, arrays: Dict[str, np.ndarray], name: str
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """the header and arrays, which were written as prefixed(name, ...) into a combined file"""
+    prefix = f"{name}/"
+    return header[name], {
+        key[len(prefix) :]: array
+        for key, array in arrays.items()
+        if key.startswith(prefix)
+    }
+
+
+def encode_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """string table: (offsets, utf-8 bytes), string i is bytes[offsets[i]:offsets[i + 1]]"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def decode_string(offsets: np.ndarray, data: np.ndarray, i: int) -> str:
+    return data[offsets[i] : offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def objects_of_columns(columns: Dict[str, List[str]]) -> List[Object]:
+    return [dict(zip(ATTRIBUTES, values)) for values in zip(*columns.values())]  # type: ignore
+
+
+def build_scene_arrays(
+    scenes: List[Scene_Struct], metadata: Metadata
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    attribute_values = {
+        attr: metadata["types"][attr.capitalize()] for attr in ATTRIBUTES
+    }
+    codes = {
+        attr: {value: code for code, value in enumerate(values)}
+        for attr, values in attribute_values.items()
+    }
+    relations = list(scenes[0]["relationships"].keys()) if len(scenes) > 0 else []
+    splits = set(scene["split"] for scene in scenes)
+    assert len(splits) <= 1, "all scenes must be from the same split"
+
+    num_objects = [len(scene["objects"]) for scene in scenes]
+    assert max(num_objects, default=0) <= np.iinfo(np.uint16).max
+    object_offsets = np.zeros(len(scenes) + 1, dtype=np.int64)
+    object_offsets[1:] = np.cumsum(num_objects)
+    total_objects = int(object_offsets[-1])
+
+    attr_codes = np.zeros((total_objects, len(ATTRIBUTES)), dtype=np.uint8)
+    relation_offsets = np.zeros((len(relations), total_objects + 1), dtype=np.int64)
+    relation_indices: List[int] = []
+    for r, relation in enumerate(relations):
+        object_idx = 0
+        relation_offsets[r, 0] = len(relation_indices)
+        for scene in scenes:
+            for related in scene["relationships"][relation]:
+                relation_indices.extend(related)
+                object_idx += 1
+                relation_offsets[r, object_idx] = len(relation_indices)
+    object_idx = 0
+    for scene in scenes:
+        assert list(scene["relationships"].keys()) == relations
+        for obj in scene["objects"]:
+            attr_codes[object_idx] = [codes[attr][obj[attr]] for attr in ATTRIBUTES]  # type: ignore
+            object_idx += 1
+
+    filename_offsets, filename_bytes = encode_strings(
+        [scene["image_filename"] for scene in scenes]
+    )
+    header = {
+        "format": "scene_store",
+        "split": splits.pop() if len(splits) > 0 else None,
+        "attribute_values": attribute_values,
+        "relations": relations,
+    }
+    arrays = {
+        "attr_codes": attr_codes,
+        "object_offsets": object_offsets,
+        "relation_offsets": relation_offsets,
+        "relation_indices": np.array(relation_indices, dtype=np.uint16),
+        "filename_offsets": filename_offsets,
+        "filename_bytes": filename_bytes,
+        "image_index": np.array(
+            [scene.get("image_index", i) for i, scene in enumerate(scenes)],  # type: ignore
+            dtype=np.int64,
+        ),
+    }
+    return header, arrays
+
+
+class SceneStore:
+    """read-only view of the scene store arrays in buffer (a mmap or shared memory)"""
+
+    def __init__(self, buffer, owner: Any = None) -> None:
+        header, arrays = read_arrays(buffer)
+        if header["format"] == "preprocessed":
+            # the scenes of a preprocessed dataset (c.f. preprocess.py)
+            header, arrays = section(header, arrays, "scenes")
+        assert header["format"] == "scene_store", "not a scene store"
+        self.info: Dict = header.get("info", {})
+        self.split: Optional[str] = header["split"]
+        self.attribute_values: Dict[str, List[str]] = header["attribute_values"]
+        self.relations: List[str] = header["relations"]
+        self.arrays = arrays
+        self.size = len(buffer)
+        # keeps the mmap or shared memory alive as long as the arrays are used
+        self._buffer = buffer
+        self._owner = owner
+        self._filename_to_idxs: Optional[Dict[str, List[int]]] = None
+        # (scene idx, scene struct) of the last decoded scene
+        self._decoded: Optional[Tuple[int, Scene_Struct]] = None
+
+    @staticmethod
+    def write(
+        path: str, scenes: List[Scene_Struct], metadata: Metadata, info: Dict = {}
+    ) -> None:
+        header, arrays = build_scene_arrays(scenes, metadata)
+        write_arrays(path, {**header, "info": info}, arrays)
+
+    @classmethod
+    def open(cls, path: str) -> "SceneStore":
+        """memory-maps the store, processes which open the same file share its pages"""
+        buffer = map_file(path)
+        return cls(buffer, owner=buffer)
+
+    def to_shared_memory(self) -> shared_memory.SharedMemory:
+        """copies the store into a new shared memory block. The caller has to unlink it eventually"""
+        shm = shared_memory.SharedMemory(create=True, size=self.size)
+        shm.buf[: self.size] = self._buffer[: self.size]
+        return shm
+
+    @classmethod
+    def attach(cls, name: str) -> "SceneStore":
+        """attaches to a shared memory block created by to_shared_memory"""
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm.buf, owner=shm)
+
+    def close(self) -> None:
+        # the views have to be released before the buffer can be closed
+        self.arrays = {}
+        self._buffer = None
+        self._decoded = None
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+    def __len__(self) -> int:
+        return len(self.arrays["object_offsets"]) - 1
+
+    def filename(self, scene_idx: int) -> str:
+        return decode_string(
+            self.arrays["filename_offsets"], self.arrays["filename_bytes"], scene_idx
+        )
+
+    def find(self, filename: str) -> List[int]:
+        """the idxs of all scenes with this image filename"""
+        if self._filename_to_idxs is None:
+            self._filename_to_idxs = {}
+            for i in range(len(self)):
+                self._filename_to_idxs.setdefault(self.filename(i), []).append(i)
+        return self._filename_to_idxs.get(filename, [])
+
+    def num_objects(self, scene_idx: int) -> int:
+        offsets = self.arrays["object_offsets"]
+        return int(offsets[scene_idx + 1] - offsets[scene_idx])
+
+    def columns(self, scene_idx: int) -> Dict[str, List[str]]:
+        """the attribute values of the objects of the scene, one column per attribute"""
+        offsets = self.arrays["object_offsets"]
+        codes = self.arrays["attr_codes"][offsets[scene_idx] : offsets[scene_idx + 1]]
+        return {
+            attr: [self.attribute_values[attr][code] for code in codes[:, a].tolist()]
+            for a, attr in enumerate(ATTRIBUTES)
+        }
+
+    def objects(self, scene_idx: int) -> List[Object]:
+        return objects_of_columns(self.columns(scene_idx))
+
+    def relationships(self, scene_idx: int) -> Dict[str, List[List[int]]]:
+        object_offsets = self.arrays["object_offsets"]
+        start, end = int(object_offsets[scene_idx]), int(object_offsets[scene_idx + 1])
+        relationships = {}
+        for r, relation in enumerate(self.relations):
+            offsets = self.arrays["relation_offsets"][r, start : end + 1].tolist()
+            indices = self.arrays["relation_indices"][offsets[0] : offsets[-1]].tolist()
+            relationships[relation] = [
+                indices[a - offsets[0] : b - offsets[0]]
+                for a, b in zip(offsets, offsets[1:])
+            ]
+        return relationships
+
+    def scene_struct(self, scene_idx: int) -> Scene_Struct:
+        """
+        decodes the scene into the dict layout of CLEVR_*_scenes.json (only the fields used by the
+        engine). The last decoded scene is kept, so all questions of a scene share its dict.
+        """
+        if self._decoded is not None and self._decoded[0] == scene_idx:
+            return self._decoded[1]
+        columns = self.columns(scene_idx)
+        scene_struct = StoredScene(
+            {
+                "split": self.split,
+                "image_index": int(self.arrays["image_index"][scene_idx]),
+                "image_filename": self.filename(scene_idx),
+                "objects": objects_of_columns(columns),
+                "relationships": self.relationships(scene_idx),
+            },
+            columns,
+        )
+        self._decoded = scene_idx, scene_struct
+        return scene_struct  # type: ignore
+
+    def index_scenes(self, begin: int = 0, end: Optional[int] = None) -> "StoredScenes":
+        """like scene_context.index_scenes for the scenes begin:end, but decodes the scenes on access"""
+        return StoredScenes(self, *slice(begin, end).indices(len(self))[:2])
+
+
+class StoredScene(dict):
+    """
+    A scene decoded from the store. Besides the usual dict, it keeps the attribute columns of its
+    objects, which the engine reads instead of the object dicts (c.f. question_engine.get_attribute_column).
+    """
+
+    def __init__(self, fields: Dict, columns: Dict[str, List[str]]) -> None:
+        super().__init__(fields)
+        self.columns = columns
+
+
+class StoredScenes(Mapping):
+    """maps image filenames to the list of their (decoded) scenes"""
+
+    def __init__(self, store: SceneStore, begin: int, end: int) -> None:
+        self.store = store
+        self.begin, self.end = begin, end
+
+    def __getitem__(self, filename: str) -> List[Scene_Struct]:
+        idxs = [i for i in self.store.find(filename) if self.begin <= i < self.end]
+        if len(idxs) == 0:
+            raise KeyError(filename)
+        return [self.store.scene_struct(i) for i in idxs]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(
+            dict.fromkeys(self.store.filename(i) for i in range(self.begin, self.end))
+        )
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def main(args):
+    with open(args.metadata_file, "r") as f:
+        metadata = json.load(f)
+    with open(args.input_scene_file, "r") as f:
+        scene_data = json.load(f)
+
+    SceneStore.write(
+        args.output_store_file, scene_data["scenes"], metadata, scene_data["info"]
+    )
+    print("Wrote %d scenes to %s" % (len(scene_data["scenes"]), args.output_store_file))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
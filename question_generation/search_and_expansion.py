@@ -1,98 +1,238 @@
 # This file contains the code of searching a valid instanciated template and expanding the templates
 import random
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import question_engine as qeng
-from custom_types import (Answer_Counts, Metadata, Node, Scene_Struct, State,
-                          Template)
-from filters import (add_empty_filter_options, derive_cf_attributes,
-                     derive_cf_relations, find_filter_options,
-                     find_relate_filter_options)
-from utils import node_shallow_copy
+from answer_distribution import AnswerDistribution
+from custom_types import Metadata, Node, Scene_Struct, Template
+from filters import (add_empty_filter_options, find_filter_options,
+                     find_relate_filter_options, iter_cf_attributes,
+                     iter_cf_relations, precompute_filter_options,
+                     prune_cf_variants)
+from search_types import ABSENT, ProgramNode, SearchState
 
 
-def do_dfs(template: Template, metadata: Metadata, scene_struct: Scene_Struct, verbose: bool, answer_counts: Answer_Counts, max_instances: Optional[int], final_filters=None) -> Tuple[Dict[str, List[Node]], List[State]]:
-  param_name_to_type = {p['name']: p['type'] for p in template['params']} 
+# nodes which are expanded with the filter options of the scene (c.f. expand_filter_options)
+SPECIAL_NODES = frozenset({
+    'filter_unique', 'filter_count', 'filter_qa_count', 'filter_exist', 'filter',
+    'relate_filter', 'relate_filter_unique', 'relate_filter_count',
+    'relate_filter_exist', 'relate',
+})
+# in cf mode, the single attribute filters are expanded with their counterfactual variants as well
+ATTRIBUTE_FILTER_NODES = frozenset({'filter_size', 'filter_color', 'filter_material', 'filter_shape'})
 
-  # initial_state: State = {
-  initial_state: State = {  # type: ignore    
-    'nodes': [node_shallow_copy(template['nodes'][0])],
-    'vals': {},
-    'input_map': {0: 0},
-    'next_template_node': 1,
-  }
-  states = [initial_state]
-  final_states = []
-  state_iter = 0
-  dfs_mode = final_filters is None
-  while states:
-    state = states.pop()
-    if verbose:
-      # print(f"Processing state {state_iter}: {state}")
-      state_iter = state_iter + 1
-    
-    # Check to make sure the current state is valid
-    q = {'nodes': state['nodes']}
-    outputs = qeng.answer_question(q, metadata, scene_struct, all_outputs=True)
-    answer = outputs[-1]
-    if answer == '__INVALID__': continue
+# how do_dfs expands a state with the next template node
+EXPAND_FILTER_OPTIONS, EXPAND_SIDE_INPUT, EXPAND_NODE = range(3)
+
+# returns True if the state violates the constraint, gets the state and the outputs of its nodes
+Constraint_Checker = Callable[[SearchState, List], bool]
 
-    # Check to make sure constraints are satisfied for the current state
-    skip_state = False
-    for constraint in template['constraints']:
-      if not dfs_mode:
-        # do not evaluate constraints during non dfs mode
-        pass
-      elif constraint['type'] == 'NEQ':
-        p1, p2 = constraint['params']
-        v1, v2 = state['vals'].get(p1), state['vals'].get(p2)
+
+def compile_expansions(template: Template, dfs_mode: bool) -> List[int]:
+  """the kind of expansion for each template node"""
+  kinds = []
+  for node in template['nodes']:
+    if node['type'] in SPECIAL_NODES or (node['type'] in ATTRIBUTE_FILTER_NODES and not dfs_mode):
+      kinds.append(EXPAND_FILTER_OPTIONS)
+    elif 'side_inputs' in node:
+      kinds.append(EXPAND_SIDE_INPUT)
+    else:
+      kinds.append(EXPAND_NODE)
+  return kinds
+
+
+def compile_constraints(template: Template, verbose: bool) -> List[List[Constraint_Checker]]:
+  """
+  The checkers of the constraints for each template node, which need to be evaluated once the node is added to a state.
+  A state only differs from its parent in the values and the input of its last template node and the parent already
+  satisfied all constraints, thus only the constraints on this node can be violated.
+  """
+  param_to_node = {si: i for i, node in enumerate(template['nodes']) for si in node.get('side_inputs', [])}
+  checkers: List[List[Constraint_Checker]] = [[] for _ in template['nodes']]
+  for constraint in template['constraints']:
+    if constraint['type'] == 'NEQ':
+      p1, p2 = constraint['params']
+      def check(state, outputs, p1=p1, p2=p2, constraint=constraint):
+        v1, v2 = state.vals.get(p1), state.vals.get(p2)
         if v1 is not None and v2 is not None and v1 != v2:
           if verbose:
             print('skipping due to NEQ constraint')
             print(constraint)
-            print(state['vals'])
-          skip_state = True
-          break
-      elif constraint['type'] == 'NULL':
-        p = constraint['params'][0]
-        p_type = param_name_to_type[p]
-        v = state['vals'].get(p)
+            print(state.vals)
+          return True
+        return False
+      nodes = [param_to_node.get(p1), param_to_node.get(p2)]
+    elif constraint['type'] == 'NULL':
+      p = constraint['params'][0]
+      def check(state, outputs, p=p, constraint=constraint):
+        v = state.vals.get(p)
         if v is not None:
           if v not in ["", "thing"]:
             if verbose:
               print('skipping due to NULL constraint')
               print(constraint)
-              print(state['vals'])
-            skip_state = True
-            break
-      elif constraint['type'] == 'OUT_NEQ':
-        i, j = constraint['params']
-        i = state['input_map'].get(i, None)
-        j = state['input_map'].get(j, None)
+              print(state.vals)
+            return True
+        return False
+      nodes = [param_to_node.get(p)]
+    elif constraint['type'] == 'OUT_NEQ':
+      i, j = constraint['params']
+      def check(state, outputs, i=i, j=j):
+        i = state.input_map.get(i, None)
+        j = state.input_map.get(j, None)
         if i is not None and j is not None and outputs[i] == outputs[j]:
           if verbose:
             print('skipping due to OUT_NEQ constraint')
             print(outputs[i])
             print(outputs[j])
-          skip_state = True
-          break
-      else:
-        assert False, 'Unrecognized constraint type "%s"' % constraint['type']
+          return True
+        return False
+      nodes = [i, j]
+    else:
+      assert False, 'Unrecognized constraint type "%s"' % constraint['type']
+    for node in dict.fromkeys(nodes):
+      if node is not None and 0 <= node < len(checkers):
+        checkers[node].append(check)
+  return checkers
+
+
+def expand_filter_options(state: SearchState, next_node: Node, filter_option_keys: Iterable, param_name_to_type: Dict[str, str], metadata: Metadata) -> Iterator[SearchState]:
+  """yields one child state per filter option of a special node"""
+  for k in filter_option_keys:
+    new_nodes = []
+    cur_next_vals = {k: v for k, v in state.vals.items()}
+    next_input = state.input_map[next_node['inputs'][0]]
+    filter_side_inputs = next_node['side_inputs']
+    if next_node['type'].startswith('relate'):
+      param_name = next_node['side_inputs'][0] # First one should be relate
+      filter_side_inputs = next_node['side_inputs'][1:]
+      param_type = param_name_to_type[param_name]
+      assert param_type == 'Relation'
+      param_val = k[0]
+      k = k[1]
+      new_nodes.append(ProgramNode('relate', [next_input], [param_val]))
+      cur_next_vals[param_name] = param_val
+      next_input = len(state.nodes) + len(new_nodes) - 1
+    for param_name, param_val in zip(filter_side_inputs, k):
+      param_type = param_name_to_type[param_name]
+      filter_type = 'filter_%s' % param_type.lower()
+      if param_val is not None:
+        new_nodes.append(ProgramNode(filter_type, [next_input], [param_val]))
+        cur_next_vals[param_name] = param_val
+        next_input = len(state.nodes) + len(new_nodes) - 1
+      elif param_val is None:
+        if metadata['dataset'] == 'CLEVR-v1.0' and param_type == 'Shape':
+          param_val = 'thing'
+        else:
+          param_val = ''
+        cur_next_vals[param_name] = param_val
+    input_map = {k: v for k, v in state.input_map.items()}
+    extra_type = None
+    if next_node['type'].endswith('unique'):
+      extra_type = 'unique'
+    if next_node['type'].endswith('count'):
+      extra_type = 'count'
+    if next_node['type'].endswith('exist'):
+      extra_type = 'exist'
+    if extra_type is not None:
+      new_nodes.append(ProgramNode(extra_type, [input_map[next_node['inputs'][0]] + len(new_nodes)]))
+    input_map[state.next_template_node] = len(state.nodes) + len(new_nodes) - 1
+    yield SearchState(state.nodes + new_nodes, cur_next_vals, input_map, state.next_template_node + 1)
+
+
+def expand_side_input(state: SearchState, next_node: Node, param_name: str, param_vals: List[str]) -> Iterator[SearchState]:
+  """yields one child state per value of the single template parameter of the node"""
+  for val in param_vals:
+    input_map = {k: v for k, v in state.input_map.items()}
+    input_map[state.next_template_node] = len(state.nodes)
+    cur_next_node = ProgramNode(next_node['type'], [input_map[idx] for idx in next_node['inputs']], [val])
+    cur_next_vals = {k: v for k, v in state.vals.items()}
+    cur_next_vals[param_name] = val
+
+    yield SearchState(state.nodes + [cur_next_node], cur_next_vals, input_map, state.next_template_node + 1)
+
 
-    if skip_state:
+def expand_node(state: SearchState, next_node: Node) -> SearchState:
+  """the child state for a template node without parameters"""
+  input_map = {k: v for k, v in state.input_map.items()}
+  input_map[state.next_template_node] = len(state.nodes)
+  next_node = ProgramNode(next_node['type'], [input_map[idx] for idx in next_node['inputs']], _output=next_node.get('_output', ABSENT))
+  return SearchState(state.nodes + [next_node], state.vals, input_map, state.next_template_node + 1)
+
+
+def cf_variants_can_be_matched(answer) -> bool:
+  # the input of a counterfactual filter is usually a list of object idxs (or a single idx)
+  return type(answer) == int or (type(answer) == list and all(type(i) == int for i in answer))
+
+
+def cf_variant_matches(scene_struct: Scene_Struct, metadata: Metadata, answer, side_inputs: List[str], param_name_to_type: Dict[str, str], variant) -> Set[int]:
+  """the idxs of the objects, which the counterfactual variant of a (relate) filter node selects from answer"""
+  if param_name_to_type.get(side_inputs[0]) == 'Relation':
+    relation, variant = variant
+    answer = qeng.relate_handler(scene_struct, [answer], [relation])
+    side_inputs = side_inputs[1:]
+  if type(answer) == int:
+    answer = [answer]
+
+  # look up the objects with these attributes (c.f. precompute_filter_options)
+  if '_filter_options' not in scene_struct:
+    precompute_filter_options(scene_struct, metadata)
+  key = [None, None, None, None]
+  attr_keys = ['size', 'color', 'material', 'shape']
+  for si, val in zip(side_inputs, variant):
+    if val != '':
+      key[attr_keys.index(param_name_to_type[si].lower())] = val
+  return set(answer) & scene_struct['_filter_options'].get(tuple(key), set())  # type: ignore
+
+
+def do_dfs(template: Template, metadata: Metadata, scene_struct: Scene_Struct, verbose: bool, answer_counts: AnswerDistribution, max_instances: Optional[int], final_filters=None, prune_cf: bool=False) -> Tuple[Dict[str, List[Node]], List[SearchState]]:
+  """
+  Instantiates the template on the scene (dfs mode) or, if final_filters are given, searches the counterfactual
+  variants of the filters (cf mode). prune_cf skips the variants, which cannot match any additional object.
+  """
+  param_name_to_type = {p['name']: p['type'] for p in template['params']} 
+
+  initial_state = SearchState([ProgramNode.from_dict(template['nodes'][0])], {}, {0: 0}, 1)
+  states = [initial_state]
+  final_states = []
+  state_iter = 0
+  dfs_mode = final_filters is None
+  expansions = compile_expansions(template, dfs_mode)
+  if dfs_mode:
+    constraint_checkers = compile_constraints(template, verbose)
+  while states:
+    state = states.pop()
+    if not isinstance(state, SearchState):
+      # lazily expanded counterfactual variants (c.f. below), put the remaining ones back
+      pending = state
+      state = next(pending, None)
+      if state is None:
+        continue
+      states.append(pending)
+    if verbose:
+      # print(f"Processing state {state_iter}: {state}")
+      state_iter = state_iter + 1
+    
+    # Check to make sure the current state is valid
+    q = {'nodes': state.nodes}
+    outputs = qeng.answer_question(q, metadata, scene_struct, all_outputs=True)
+    answer = outputs[-1]
+    if answer == '__INVALID__': continue
+
+    # Check to make sure constraints are satisfied for the current state (c.f. compile_constraints)
+    # do not evaluate constraints during non dfs mode
+    if dfs_mode and any(check(state, outputs) for check in constraint_checkers[state.next_template_node - 1]):
       continue
 
     # We have already checked to make sure the answer is valid, so if we have
     # processed all the nodes in the template then the current state is a valid
     # question, so add it if it passes our rejection sampling tests.
-    if state['next_template_node'] == len(template['nodes']) and dfs_mode:
+    if state.next_template_node == len(template['nodes']) and dfs_mode:
       # Use our rejection sampling heuristics to decide whether we should
       # keep this template instantiation
       cur_answer_count = answer_counts[answer]
-      answer_counts_sorted = sorted(answer_counts.values())
-      median_count = answer_counts_sorted[len(answer_counts_sorted) // 2]
-      median_count = max(median_count, 5)
-      if cur_answer_count > 1.1 * answer_counts_sorted[-2]:
+      median_count = max(answer_counts.median(), 5)
+      if cur_answer_count > 1.1 * answer_counts.second_largest():
         if verbose: print('skipping due to second count')
         continue
       if cur_answer_count > 5.0 * median_count:
@@ -108,28 +248,23 @@ def do_dfs(template: Template, metadata: Metadata, scene_struct: Scene_Struct, v
         if degen:
           continue
 
-      answer_counts[answer] += 1
+      answer_counts.add(answer)
 
-    if state['next_template_node'] == len(template['nodes']):
+    if state.next_template_node == len(template['nodes']):
       # This basically checks whether we have reached the end of the program specified in nodes.
       # this has almost the same check as the if above, but has to be run, regardless whether we generate answers or explanations  
-      state['answer'] = answer  # type: ignore
+      state.answer = answer
       final_states.append(state)
       if max_instances is not None and len(final_states) == max_instances and dfs_mode:
         break
       continue
 
     # Otherwise fetch the next node from the template
-    # Make a shallow copy so cached _outputs don't leak ... this is very nasty
-    next_node = template['nodes'][state['next_template_node']]
-    next_node = node_shallow_copy(next_node)
-
-    special_nodes = {
-        'filter_unique', 'filter_count', 'filter_qa_count', 'filter_exist', 'filter',
-        'relate_filter', 'relate_filter_unique', 'relate_filter_count',
-        'relate_filter_exist', 'relate',
-    }
-    if next_node['type'] in special_nodes or (next_node["type"] in ['filter_size', 'filter_color', 'filter_material', 'filter_shape'] and not dfs_mode):
+    # (it is only read, the new nodes of the program are ProgramNodes, so cached _outputs don't leak)
+    next_node = template['nodes'][state.next_template_node]
+
+    expansion = expansions[state.next_template_node]
+    if expansion == EXPAND_FILTER_OPTIONS:
       if next_node['type'].startswith('relate_filter'):
         # Don't compute this, if we are in cf explanation mode, bc. find_relate_filter_options is not able to deal with List[List[]]
         if dfs_mode:
@@ -170,73 +305,29 @@ def do_dfs(template: Template, metadata: Metadata, scene_struct: Scene_Struct, v
         # create Almost Matching filters, to get the objects which almost match to the original filter
         current_final_filters = tuple(final_filters[si] for si in next_node["side_inputs"])
         
+        # the variants are enumerated in reverse (most general first), as the stack pops them in this order
         if any(["R" in si for si in next_node["side_inputs"]]):
           # case with relations, this means that there is a relation which needs to be prepended (relation, (attr1, attr2, ...))
-          filter_option_keys = derive_cf_relations(current_final_filters)
+          filter_option_keys = iter_cf_relations(current_final_filters, general_first=True)
+          factual = next(iter_cf_relations(current_final_filters))
         else:
           # case with only attributes
-          filter_option_keys = derive_cf_attributes(current_final_filters)  # type: ignore
-
-        # if verbose: print(filter_option_keys)
-
-      for k in filter_option_keys:
-        new_nodes = []
-        cur_next_vals = {k: v for k, v in state['vals'].items()}
-        next_input = state['input_map'][next_node['inputs'][0]]
-        filter_side_inputs = next_node['side_inputs']
-        if next_node['type'].startswith('relate'):
-          param_name = next_node['side_inputs'][0] # First one should be relate
-          filter_side_inputs = next_node['side_inputs'][1:]
-          param_type = param_name_to_type[param_name]
-          assert param_type == 'Relation'
-          param_val = k[0]
-          k = k[1]
-          new_nodes.append({
-            'type': 'relate',
-            'inputs': [next_input],
-            'side_inputs': [param_val],
-          })
-          cur_next_vals[param_name] = param_val
-          next_input = len(state['nodes']) + len(new_nodes) - 1
-        for param_name, param_val in zip(filter_side_inputs, k):
-          param_type = param_name_to_type[param_name]
-          filter_type = 'filter_%s' % param_type.lower()
-          if param_val is not None:
-            new_nodes.append({
-              'type': filter_type,
-              'inputs': [next_input],
-              'side_inputs': [param_val],
-            })
-            cur_next_vals[param_name] = param_val
-            next_input = len(state['nodes']) + len(new_nodes) - 1
-          elif param_val is None:
-            if metadata['dataset'] == 'CLEVR-v1.0' and param_type == 'Shape':
-              param_val = 'thing'
-            else:
-              param_val = ''
-            cur_next_vals[param_name] = param_val
-        input_map = {k: v for k, v in state['input_map'].items()}
-        extra_type = None
-        if next_node['type'].endswith('unique'):
-          extra_type = 'unique'
-        if next_node['type'].endswith('count'):
-          extra_type = 'count'
-        if next_node['type'].endswith('exist'):
-          extra_type = 'exist'
-        if extra_type is not None:
-          new_nodes.append({
-            'type': extra_type,
-            'inputs': [input_map[next_node['inputs'][0]] + len(new_nodes)],
-          })
-        input_map[state['next_template_node']] = len(state['nodes']) + len(new_nodes) - 1
-        states.append({  # type: ignore
-          'nodes': state['nodes'] + new_nodes,
-          'vals': cur_next_vals,
-          'input_map': input_map,
-          'next_template_node': state['next_template_node'] + 1,
-        })
-
-    elif 'side_inputs' in next_node:
+          filter_option_keys = iter_cf_attributes(current_final_filters, general_first=True)  # type: ignore
+          factual = next(iter_cf_attributes(current_final_filters))
+
+        if prune_cf and cf_variants_can_be_matched(answer):
+          matches = lambda variant, answer=answer, side_inputs=next_node['side_inputs']: cf_variant_matches(
+            scene_struct, metadata, answer, side_inputs, param_name_to_type, variant)
+          filter_option_keys = prune_cf_variants(filter_option_keys, factual, matches)
+
+      if dfs_mode:
+        states.extend(expand_filter_options(state, next_node, filter_option_keys, param_name_to_type, metadata))
+      else:
+        # push the variants lazily: the generator goes back onto the stack after each variant, so the
+        # variants are processed in the same order as if all of them were pushed at once in reverse
+        states.append(expand_filter_options(state, next_node, filter_option_keys, param_name_to_type, metadata))  # type: ignore
+
+    elif expansion == EXPAND_SIDE_INPUT:
       # If the next node has template parameters, expand them out
       # TODO: Generalize this to work for nodes with more than one side input
       assert len(next_node['side_inputs']) == 1, 'NOT IMPLEMENTED'
@@ -249,38 +340,7 @@ def do_dfs(template: Template, metadata: Metadata, scene_struct: Scene_Struct, v
       param_type = param_name_to_type[param_name]
       param_vals = metadata['types'][param_type][:]
       random.shuffle(param_vals)
-      for val in param_vals:
-        input_map = {k: v for k, v in state['input_map'].items()}
-        input_map[state['next_template_node']] = len(state['nodes'])
-        cur_next_node = {
-          'type': next_node['type'],
-          'inputs': [input_map[idx] for idx in next_node['inputs']],
-          'side_inputs': [val],
-        }
-        cur_next_vals = {k: v for k, v in state['vals'].items()}
-        cur_next_vals[param_name] = val
-
-        states.append({  # type: ignore
-          'nodes': state['nodes'] + [cur_next_node],
-          'vals': cur_next_vals,
-          'input_map': input_map,
-          'next_template_node': state['next_template_node'] + 1,
-        })
+      states.extend(expand_side_input(state, next_node, param_name, param_vals))
     else:
-      input_map = {k: v for k, v in state['input_map'].items()}
-      input_map[state['next_template_node']] = len(state['nodes'])
-      _output = next_node.get("_output")
-      next_node = {
-        'type': next_node['type'],
-        'inputs': [input_map[idx] for idx in next_node['inputs']],
-      }
-      if _output is not None:
-        next_node["_output"] = _output
-
-      states.append({ # type: ignore
-        'nodes': state['nodes'] + [next_node],
-        'vals': state['vals'],
-        'input_map': input_map,
-        'next_template_node': state['next_template_node'] + 1,
-      })
+      states.append(expand_node(state, next_node))
   return q, final_states
@@ -0,0 +1,124 @@
+# persists the results of the search stage, so the explanations can be realized again without it
+
+import gzip
+import json
+import random
+from typing import IO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from explanations import QuestionSearch
+
+"""
+The explanations are generated in two stages (c.f. explanations.use_instantiated_template): the
+search (matching the program to its template and running the explanation filters) and the NLG
+(understanding the question, the sentence plans and their realization). The search does not
+depend on nlg_system, nlg_templates or the synonyms of the NLG, but takes most of the time.
+
+generate_explanations.py --output_search_file writes the search of every explained question into
+a search file, generate_explanations.py --input_search_file then only runs the NLG on it:
+
+    python generate_explanations.py --output_search_file ../output/CLEVR_val_search.jsonl.gz
+    # change nlg_system, nlg_templates or synonyms.json
+    python generate_explanations.py --input_search_file ../output/CLEVR_val_search.jsonl.gz
+
+The search file holds one json line per explained question (gzip compressed if the path ends
+with .gz) after a header line with the selected scenes:
+
+    {"question": index of the question within the selected questions,
+     "final_filters": ..., "filter_evidence": ..., "question_synonyms": ... (c.f. QuestionSearch),
+     "randoms": the random numbers drawn by the NLG of the question}
+
+The NLG draws its random numbers (c.f. nlg_templates.nlg_utils.compute_iters) from the global
+random state in between the searches. They are recorded (c.f. RecordingRandom) and replayed
+(c.f. ReplayedRandom), so an unchanged NLG reproduces the explanations of the full run exactly.
+The mapping of the ids to their attributes is not stored, it follows from the final filters and
+the extra_attrs of the template, which are part of the NLG.
+"""
+
+
+class RecordingRandom(random.Random):
+    """draws from the global random state and records the drawn numbers"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.values: List[float] = []
+
+    def random(self) -> float:
+        value = random.random()
+        self.values.append(value)
+        return value
+
+
+class ReplayedRandom(random.Random):
+    """replays the recorded numbers, any further numbers are drawn from its own seeded state"""
+
+    def __init__(self, values: Sequence[float], seed: int = 0) -> None:
+        super().__init__(seed)
+        self.values = iter(values)
+
+    def random(self) -> float:
+        value = next(self.values, None)
+        if value is None:
+            return super().random()
+        return value
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")  # type: ignore
+    return open(path, mode, encoding="utf-8")
+
+
+class SearchWriter:
+    """writes the search file (c.f. the module docstring)"""
+
+    def __init__(self, path: str, header: Dict) -> None:
+        self.file = _open(path, "w")
+        self._write(header)
+
+    def _write(self, line: Dict) -> None:
+        self.file.write(json.dumps(line, separators=(",", ":")))
+        self.file.write("\n")
+
+    def write(
+        self, question_idx: int, search: QuestionSearch, randoms: List[float]
+    ) -> None:
+        self._write(
+            {
+                "question": question_idx,
+                "final_filters": search.final_filters,
+                "filter_evidence": search.filter_evidence,
+                "question_synonyms": search.question_synonyms,
+                "randoms": randoms,
+            }
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "SearchWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_header(path: str) -> Dict:
+    with _open(path, "r") as f:
+        return json.loads(f.readline())
+
+
+def read_searches(path: str) -> Iterator[Tuple[int, QuestionSearch, List[float]]]:
+    """yields the index of the question, its search and the random numbers of its NLG"""
+    with _open(path, "r") as f:
+        f.readline()
+        for line in f:
+            record = json.loads(line)
+            # the objects are attribute tuples (c.f. new_approach.understand_question)
+            filter_evidence: List[Tuple[List, Optional[List[str]]]] = [
+                ([tuple(obj) for obj in objects], side_inputs)
+                for objects, side_inputs in record["filter_evidence"]
+            ]
+            search = QuestionSearch(
+                record["final_filters"], filter_evidence, record["question_synonyms"]
+            )
+            yield record["question"], search, record["randoms"]
@@ -0,0 +1,149 @@
+# compact program nodes and states of the template search (c.f. do_dfs)
+
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+"""
+do_dfs creates a state and a few program nodes for every step of the search, millions per run. As
+dicts with string keys, each of them takes ~200 bytes; the slotted ProgramNode and SearchState
+below take a third of that. The node types are parsed once into interned codes (the type of the
+handler and the integer baggage, c.f. NodeCode), which question_engine.execute_code runs directly.
+
+The search and question_engine.answer_question use the attributes. Everything else reads the nodes
+and the final states like the dicts they replace (node["type"], node.get("side_inputs", []),
+"_output" in node, state["vals"]), and to_dict converts them at the json boundary.
+"""
+
+
+class _Absent:
+    """marks an optional field, which is not set (the missing key of the dict)"""
+
+    def __repr__(self) -> str:
+        return "ABSENT"
+
+
+ABSENT: Any = _Absent()
+
+
+class NodeCode(NamedTuple):
+    """a node type like amputated_intersect;3;5 split into the handler type and the baggage"""
+
+    type: str  # amputated_intersect
+    baggage: Tuple[int, ...]  # (3, 5)
+
+
+_codes: Dict[str, NodeCode] = {}
+
+
+def node_code(node_type: str) -> NodeCode:
+    code = _codes.get(node_type)
+    if code is None:
+        type, *baggage = node_type.split(";")
+        code = NodeCode(sys.intern(type), tuple(int(item) for item in baggage))
+        _codes[node_type] = code
+    return code
+
+
+class ProgramNode:
+    # the keys of the dict, the code follows from the type
+    _FIELDS = ("type", "inputs", "side_inputs", "_output")
+    __slots__ = _FIELDS + ("code",)
+
+    def __init__(
+        self,
+        type: str,
+        inputs: List[int],
+        side_inputs: Any = ABSENT,
+        _output: Any = ABSENT,
+    ) -> None:
+        self.type = sys.intern(type)
+        self.code = node_code(self.type)
+        self.inputs = inputs
+        self.side_inputs = side_inputs
+        self._output = _output
+
+    @classmethod
+    def from_dict(cls, node: Dict) -> "ProgramNode":
+        return cls(
+            node["type"],
+            node["inputs"],
+            node.get("side_inputs", ABSENT),
+            node.get("_output", ABSENT),
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, key, ABSENT) if key in self._FIELDS else ABSENT
+        if value is ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        assert key in self._FIELDS, f"a program node has no {key}"
+        if key == "type":
+            value = sys.intern(value)
+            self.code = node_code(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._FIELDS and getattr(self, key) is not ABSENT
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self._FIELDS if key in self}
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ProgramNode):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"ProgramNode({self.to_dict()})"
+
+
+class SearchState:
+    __slots__ = ("nodes", "vals", "input_map", "next_template_node", "answer")
+
+    def __init__(
+        self,
+        nodes: List[ProgramNode],
+        vals: Dict[str, str],
+        input_map: Dict[int, int],
+        next_template_node: int,
+    ) -> None:
+        self.nodes = nodes
+        self.vals = vals
+        self.input_map = input_map
+        self.next_template_node = next_template_node
+        # only set for final states
+        self.answer: Optional[Any] = ABSENT
+
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, key, ABSENT) if key in self.__slots__ else ABSENT
+        if value is ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and getattr(self, key) is not ABSENT
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def to_dict(self) -> Dict:
+        state = {key: getattr(self, key) for key in self.__slots__ if key in self}
+        state["nodes"] = [node.to_dict() for node in self.nodes]
+        return state
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, SearchState):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"SearchState({self.to_dict()})"
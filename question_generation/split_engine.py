@@ -0,0 +1,173 @@
+# splits an explanations file into named splits or k folds of images in a single streaming pass
+
+import argparse
+import json
+import os
+import pickle
+import random
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+from explanations_reader import ExplanationsReader
+
+"""
+All questions of an image go into the same split. The images are shuffled with a
+random.Random(seed) and either cut into named splits by their relative sizes or dealt into k
+folds. Each split is written as CLEVR_<split><case>_explanations_<version>.json with its image ids
+in CLEVR_<split><case>_images_ids_<version>.pkl (the layout of dev_split.py).
+
+Examples:
+    python split_engine.py --input_explanations_file CLEVR_train_explanations_v0.7.10.json \\
+        --splits train=0.8,dev=0.1,test=0.1 --version v0.7.10-three-way
+    python split_engine.py --input_explanations_file CLEVR_train_explanations_v0.7.10.json \\
+        --folds 5 --version v0.7.10-5fold
+
+For k-fold cross-validation, fold i is the dev set of round i. cross_validation() returns the
+(train, dev) image ids of all rounds.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--input_explanations_file", required=True)
+parser.add_argument(
+    "--output_dir", default=None, help="Defaults to the directory of the input file"
+)
+parser.add_argument("--case", default="")
+parser.add_argument("--version", required=True, help="Version name of the new files")
+parser.add_argument(
+    "--splits",
+    default=None,
+    help="Named splits and their relative sizes, e.g. train=0.8,dev=0.2",
+)
+parser.add_argument("--folds", default=0, type=int, help="Number of folds")
+parser.add_argument("--seed", default=43, type=int)
+
+Assignment = Dict[str, Set[int]]
+
+
+def parse_splits(spec: str) -> Dict[str, float]:
+    splits = {}
+    for item in spec.split(","):
+        name, size = item.split("=")
+        splits[name.strip()] = float(size)
+    return splits
+
+
+def shuffled_images(image_indices: Iterable[int], seed: int) -> List[int]:
+    images = sorted(set(image_indices))
+    random.Random(seed).shuffle(images)
+    return images
+
+
+def assign_splits(
+    image_indices: Iterable[int], sizes: Dict[str, float], seed: int
+) -> Assignment:
+    """cuts the shuffled images by the relative sizes, the last split gets the remaining images"""
+    assert len(sizes) > 0 and all(size > 0 for size in sizes.values())
+    assert abs(sum(sizes.values()) - 1) < 1e-6, "the relative sizes must sum up to 1"
+    images = shuffled_images(image_indices, seed)
+
+    assignment = {}
+    begin = 0
+    for i, (name, size) in enumerate(sizes.items()):
+        end = len(images) if i == len(sizes) - 1 else begin + int(len(images) * size)
+        assignment[name] = set(images[begin:end])
+        begin = end
+    return assignment
+
+
+def assign_folds(image_indices: Iterable[int], num_folds: int, seed: int) -> Assignment:
+    """deals the shuffled images into num_folds folds, whose sizes differ by at most one"""
+    assert num_folds > 1, "need at least two folds"
+    images = shuffled_images(image_indices, seed)
+    return {f"fold{i}": set(images[i::num_folds]) for i in range(num_folds)}
+
+
+def cross_validation(folds: Assignment) -> List[Tuple[Set[int], Set[int]]]:
+    """the (train, dev) image ids of each round"""
+    return [
+        (
+            set().union(*(images for other, images in folds.items() if other != name)),
+            dev,
+        )
+        for name, dev in folds.items()
+    ]
+
+
+def split_paths(
+    output_dir: str, case: str, version: str
+) -> Tuple[Callable[[str], str], Callable[[str], str]]:
+    """the paths of the explanations and the image ids of a split"""
+    return (
+        lambda split: f"{output_dir}/CLEVR_{split}{case}_explanations_{version}.json",
+        lambda split: f"{output_dir}/CLEVR_{split}{case}_images_ids_{version}.pkl",
+    )
+
+
+def write_splits(
+    reader: ExplanationsReader,
+    assignment: Assignment,
+    explanations_path: Callable[[str], str],
+    image_ids_path: Callable[[str], str],
+) -> Dict[str, int]:
+    """
+    Writes all splits in one pass over the samples and returns their number of samples. The
+    files have the layout of json.dump({"info": ..., "questions": [...]}). Samples of images
+    without split are skipped.
+    """
+    split_of_image = {}
+    for split, images in assignment.items():
+        for image in images:
+            assert image not in split_of_image, f"image {image} is in several splits"
+            split_of_image[image] = split
+
+    for split in assignment:
+        for path in [explanations_path(split), image_ids_path(split)]:
+            assert not os.path.exists(path), f"{path} already exists!"
+
+    num_samples = {split: 0 for split in assignment}
+    files = {split: open(explanations_path(split), "w") for split in assignment}
+    try:
+        for f in files.values():
+            f.write('{"info": ' + json.dumps(reader.info) + ', "questions": [')
+        image_indices = reader.index["image_index"].tolist()
+        for position, image_index in enumerate(image_indices):
+            split = split_of_image.get(image_index)
+            if split is None:
+                continue
+            files[split].write(", " if num_samples[split] > 0 else "")
+            files[split].write(json.dumps(reader[position]))
+            num_samples[split] += 1
+        for f in files.values():
+            f.write("]}")
+    finally:
+        for f in files.values():
+            f.close()
+
+    for split, images in assignment.items():
+        with open(image_ids_path(split), "wb") as f:
+            pickle.dump(images, f)
+    return num_samples
+
+
+def main(args):
+    assert (args.splits is None) != (args.folds == 0), "use either --splits or --folds"
+    with ExplanationsReader(args.input_explanations_file) as reader:
+        image_indices = reader.index["image_index"].tolist()
+        if args.splits is not None:
+            assignment = assign_splits(
+                image_indices, parse_splits(args.splits), args.seed
+            )
+        else:
+            assignment = assign_folds(image_indices, args.folds, args.seed)
+
+        output_dir = args.output_dir
+        if output_dir is None:
+            output_dir = os.path.dirname(os.path.abspath(args.input_explanations_file))
+        num_samples = write_splits(
+            reader, assignment, *split_paths(output_dir, args.case, args.version)
+        )
+    for split, images in assignment.items():
+        print(f"{split}: {len(images)} images, {num_samples[split]} samples")
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+# benchmark for the startup time of the entry points, i.e. the time until their modules are imported
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+"""
+Every module is imported in a fresh interpreter (as every shard of a sharded job does) a number of
+times and the time of the import is recorded. In addition, the heavy optional dependencies
+(e.g. pandas or numpy) which are imported as a side effect are listed, as they should only be
+imported once the feature using them is enabled (e.g. --log_to_dataframe).
+
+Example:
+    python startup_benchmark.py --modules generate_explanations explanation_engine --repeats 10
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--modules",
+    default=["generate_explanations", "explanation_engine", "explanations"],
+    nargs="+",
+    help="Modules to import",
+)
+parser.add_argument("--repeats", default=5, type=int)
+parser.add_argument(
+    "--output_json",
+    default=None,
+    help="Optionally write the results to this file, e.g. to compare runs",
+)
+
+OPTIONAL_DEPENDENCIES = ["pandas", "numpy", "num2words", "http.server"]
+
+# runs in the fresh interpreter, prints the import time and the loaded optional dependencies
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {optional} if m in sys.modules]}}))
+"""
+
+
+def time_interpreter(module: str) -> Dict:
+    script = IMPORT_SCRIPT.format(module=module, optional=OPTIONAL_DEPENDENCIES)
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark_module(module: str, repeats: int) -> Dict:
+    import_seconds: List[float] = []
+    for _ in range(repeats):
+        result = time_interpreter(module)
+        import_seconds.append(result["seconds"])
+    return {
+        "module": module,
+        "median_import_ms": 1000 * statistics.median(import_seconds),
+        "min_import_ms": 1000 * min(import_seconds),
+        "loaded_optional_dependencies": result["loaded"],
+    }
+
+
+def print_results(results: List[Dict]) -> None:
+    header = ["module", "median ms", "min ms", "optional dependencies"]
+    rows = [header]
+    for r in results:
+        rows.append(
+            [
+                r["module"],
+                f"{r['median_import_ms']:.1f}",
+                f"{r['min_import_ms']:.1f}",
+                ", ".join(r["loaded_optional_dependencies"]) or "-",
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main(args):
+    results = [benchmark_module(module, args.repeats) for module in args.modules]
+    print_results(results)
+
+    if args.output_json is not None:
+        with open(args.output_json, "w") as f:
+            json.dump({"repeats": args.repeats, "results": results}, f, indent=2)
+
+    return results
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,111 @@
+# memoizes the counterfactual sub-program searches of run_explanation_filters across questions
+
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from custom_types import Node, Scene_Struct, Template
+
+"""
+run_explanation_filters turns every filter subtree of a question into a sub-program and searches
+all counterfactual variants of it with do_dfs. Many questions on the same scene share such
+sub-programs (e.g. "the large red cube" in zero_hop and one_hop questions), so their results are
+cached in a bounded LRU cache keyed by (scene id, canonical sub-program, final filter values).
+
+The counterfactual search neither uses the random state nor the answer counts, thus a cache hit
+returns exactly what the search would have returned.
+
+Whether the cache pays off depends on the questions: for the CLEVR question distribution only a
+few percent of the sub-programs repeat within a scene, which is about what the key computation
+and the retained states cost. Hence it is off by default (c.f. --sub_program_cache_size).
+"""
+
+_scene_ids = count()
+
+
+def scene_id(scene_struct: Scene_Struct) -> int:
+    """
+    Id of the scene for the cache keys. It is stored with the other scene caches (c.f.
+    scene_context.py), so it changes whenever the caches of the scene are released.
+    """
+    if "_scene_id" not in scene_struct:
+        scene_struct["_scene_id"] = next(_scene_ids)  # type: ignore
+    return scene_struct["_scene_id"]  # type: ignore
+
+
+def freeze(value: Any) -> Hashable:
+    """converts nested lists and dicts into tuples"""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple((k, freeze(v)) for k, v in sorted(value.items()))
+    return value
+
+
+def canonical_program(nodes: List[Node], template: Template) -> Tuple:
+    """
+    Hashable form of everything do_dfs reads from a sub template in counterfactual mode: the
+    nodes (including the outputs of frozen nodes) and the types of the used placeholders.
+    """
+    param_to_type = {p["name"]: p["type"] for p in template["params"]}
+    canonical_nodes = tuple(
+        (
+            node["type"],
+            tuple(node["inputs"]),
+            tuple(node.get("side_inputs", [])),
+            freeze(node.get("_output")),
+        )
+        for node in nodes
+    )
+    placeholders = used_placeholders(nodes)
+    return canonical_nodes, tuple(param_to_type.get(p) for p in placeholders)
+
+
+def used_placeholders(nodes: List[Node]) -> List[str]:
+    return list(
+        dict.fromkeys(si for node in nodes for si in node.get("side_inputs", []))
+    )
+
+
+def cache_key(
+    scene_struct: Scene_Struct,
+    nodes: List[Node],
+    template: Template,
+    final_filters: Dict[str, str],
+) -> Tuple:
+    """only the final filter values of the placeholders in the sub-program are part of the key"""
+    filter_values = tuple((p, final_filters.get(p)) for p in used_placeholders(nodes))
+    return scene_id(scene_struct), canonical_program(nodes, template), filter_values
+
+
+class SubProgramCache:
+    """LRU cache for the (q, final_states) results of do_dfs"""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        assert maxsize > 0, "the cache needs room for at least one entry"
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Tuple]:
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: Tuple, value: Tuple) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
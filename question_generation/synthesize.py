@@ -0,0 +1,356 @@
+# synthesizes new questions, answers and explanations for arbitrary scenes from the CLEVR templates
+
+import argparse
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tqdm import tqdm
+from treelib.exceptions import DuplicatedNodeIdError
+
+from answer_distribution import AnswerDistribution
+from custom_types import Metadata, Scene_Struct, Synonyms, Template
+from explanation_engine import ExplanationEngine, Template_Key
+from scene_context import scene_context
+from search_and_expansion import do_dfs
+from text_templating import fill_in_text_templates
+
+"""
+generate_explanations.py explains the questions of CLEVR. This script generates new questions for
+any scene graphs (e.g. the ones of synthetic_scenes.py) to augment the training data: the templates
+are instantiated with do_dfs in dfs mode (with the rejection sampling of the CLEVR question
+generation, c.f. AnswerDistribution) and the questions are explained with use_instantiated_template.
+
+The scenes are processed in chunks by a pool of processes. Each chunk starts with empty template and
+answer counts and a random state derived from --seed and the chunk index, so the output does not
+depend on the number of workers.
+
+Example:
+    python synthesize.py --input_scene_file synthetic_scenes.json \\
+        --output_explanations_file synthetic_explanations.json --num_workers 8
+
+The output has the layout of the output of generate_explanations.py.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--input_scene_file", default="../output/CLEVR_val_scenes.json")
+parser.add_argument(
+    "--input_scene_store",
+    default=None,
+    help="Binary scene store (c.f. scene_store.py), which is used instead of --input_scene_file",
+)
+parser.add_argument(
+    "--output_explanations_file", default="../output/synthetic_explanations.json"
+)
+parser.add_argument("--metadata_file", default="metadata.json")
+parser.add_argument("--synonyms_json", default="synonyms.json")
+parser.add_argument("--template_dir", default="CLEVR_1.0_templates")
+parser.add_argument(
+    "--families",
+    default=None,
+    nargs="+",
+    help="Template families (e.g. zero_hop.json) to use. Defaults to all of them.",
+)
+parser.add_argument(
+    "--templates_per_image",
+    default=10,
+    type=int,
+    help="The number of different templates that should be instantiated on each image",
+)
+parser.add_argument(
+    "--instances_per_template",
+    default=1,
+    type=int,
+    help="The number of times each template should be instantiated on an image",
+)
+parser.add_argument("--scene_start_idx", default=0, type=int)
+parser.add_argument(
+    "--num_scenes",
+    default=0,
+    type=int,
+    help="The number of scenes to use; 0 uses all of them",
+)
+parser.add_argument("--num_workers", default=os.cpu_count(), type=int)
+parser.add_argument(
+    "--chunk_size",
+    default=25,
+    type=int,
+    help="Number of scenes per chunk. The template and answer counts are reset for every chunk.",
+)
+parser.add_argument("--seed", default=43, type=int)
+
+# the engine of the worker processes
+_engine: Optional[ExplanationEngine] = None
+
+
+def empty_answer_counts(
+    template: Template, metadata: Metadata, num_objects: int = 10
+) -> AnswerDistribution:
+    """no questions yet for all possible answers of a template (c.f. ExplanationEngine.template_answers). Counts go up to the number of objects"""
+    node_type_to_dtype = {n["name"]: n["output"] for n in metadata["functions"]}
+    final_dtype = node_type_to_dtype[template["nodes"][-1]["type"]]
+    answers = metadata["types"][final_dtype]
+    if final_dtype == "Bool":
+        answers = [True, False]
+    if final_dtype == "Integer":
+        answers = list(range(0, max(10, num_objects) + 1))
+    return AnswerDistribution(answers)
+
+
+def instantiate_template(
+    scene_struct: Scene_Struct,
+    template: Template,
+    template_key: Template_Key,
+    question_family_index: int,
+    metadata: Metadata,
+    synonyms: Synonyms,
+    answer_counts: AnswerDistribution,
+    max_instances: Optional[int] = 1,
+) -> List[Dict]:
+    """instantiates the template on the scene and returns the questions in the layout of CLEVR_*_questions.json"""
+    _, final_states = do_dfs(
+        template,
+        metadata,
+        scene_struct,
+        False,
+        answer_counts,
+        max_instances=max_instances,
+    )
+    if len(final_states) == 0:
+        return []
+
+    text_questions, _, _ = fill_in_text_templates(
+        final_states, [], template, synonyms, template_key
+    )
+
+    questions = []
+    for state, text in zip(final_states, text_questions):
+        answer = state["answer"]
+        if type(answer) == bool:
+            answer = "yes" if answer else "no"
+        questions.append(
+            {
+                "split": scene_struct["split"],
+                "image_index": scene_struct["image_index"],
+                "image_filename": scene_struct["image_filename"],
+                "question": text,
+                "answer": str(answer),
+                "program": [
+                    {
+                        "function": node["type"],
+                        "inputs": node["inputs"],
+                        "value_inputs": node.get("side_inputs", []),
+                    }
+                    for node in state["nodes"]
+                ],
+                "template_filename": template_key[0],
+                "question_family_index": question_family_index,
+            }
+        )
+    return questions
+
+
+def synthesize_scene(
+    engine: ExplanationEngine,
+    scene_struct: Scene_Struct,
+    answer_counts: Dict[Template_Key, AnswerDistribution],
+    template_counts: Dict[Template_Key, int],
+    templates_per_image: int,
+    families: Optional[Sequence[str]] = None,
+) -> List[Dict]:
+    """
+    Instantiates up to templates_per_image templates on the scene and explains the questions. As in
+    the CLEVR question generation, the templates which have been used the least are tried first.
+    """
+    candidates = [
+        (family_index, key, template)
+        for family_index, (key, template) in enumerate(engine.template_items)
+        if families is None or key[0] in families
+    ]
+    random.shuffle(candidates)
+    candidates.sort(key=lambda candidate: template_counts[candidate[1]])
+
+    samples = []
+    num_instantiated = 0
+    with scene_context(scene_struct, engine.metadata):
+        for family_index, key, template in candidates:
+            if num_instantiated >= templates_per_image:
+                break
+            questions = instantiate_template(
+                scene_struct,
+                template,
+                key,
+                family_index,
+                engine.metadata,
+                engine.synonyms,
+                answer_counts[key],
+                engine.instances_per_template,
+            )
+            if len(questions) == 0:
+                continue
+            template_counts[key] += 1
+            num_instantiated += 1
+
+            for question in questions:
+                try:
+                    explanations = engine.explain_in_context(question, scene_struct)
+                except DuplicatedNodeIdError:
+                    continue
+                for f in explanations:
+                    samples.append(
+                        {
+                            **question,
+                            "factual_explanation": f,
+                            "counter_factual_explanation": [],
+                        }
+                    )
+    return samples
+
+
+def _load_engine(
+    metadata_file: str,
+    synonyms_json: str,
+    template_dir: str,
+    instances_per_template: int,
+) -> None:
+    global _engine
+    _engine = ExplanationEngine(
+        metadata_file, synonyms_json, template_dir, instances_per_template
+    )
+
+
+def synthesize_chunk(
+    args: Tuple[str, List[Scene_Struct], int, Optional[Sequence[str]]],
+) -> Tuple[int, List[Dict]]:
+    """synthesizes the samples of a chunk of scenes, returns the number of scenes and the samples"""
+    seed, scenes, templates_per_image, families = args
+    assert _engine is not None
+    # the search and the NLG draw from the global random state, which is the caller's own if the
+    # chunk runs in the caller's process (num_workers=1)
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return len(scenes), synthesize_scenes(scenes, templates_per_image, families)
+    finally:
+        random.setstate(state)
+
+
+def synthesize_scenes(
+    scenes: List[Scene_Struct],
+    templates_per_image: int,
+    families: Optional[Sequence[str]],
+) -> List[Dict]:
+    assert _engine is not None
+    max_objects = max(len(scene_struct["objects"]) for scene_struct in scenes)
+    answer_counts = {
+        key: empty_answer_counts(template, _engine.metadata, max_objects)
+        for key, template in _engine.templates.items()
+    }
+    template_counts = {key: 0 for key in _engine.templates}
+
+    samples = []
+    for scene_struct in scenes:
+        samples.extend(
+            synthesize_scene(
+                _engine,
+                scene_struct,
+                answer_counts,
+                template_counts,
+                templates_per_image,
+                families,
+            )
+        )
+    return samples
+
+
+def synthesize(
+    scenes: Sequence[Scene_Struct],
+    metadata_file: str = "metadata.json",
+    synonyms_json: str = "synonyms.json",
+    template_dir: str = "CLEVR_1.0_templates",
+    templates_per_image: int = 10,
+    instances_per_template: int = 1,
+    families: Optional[Sequence[str]] = None,
+    num_workers: int = 1,
+    chunk_size: int = 25,
+    seed: int = 43,
+) -> List[Dict]:
+    """the samples of all scenes (in the order of the scenes) with their question_index"""
+    engine_args = (metadata_file, synonyms_json, template_dir, instances_per_template)
+    chunks = [
+        (
+            f"{seed}-{i // chunk_size}",
+            list(scenes[i : i + chunk_size]),
+            templates_per_image,
+            families,
+        )
+        for i in range(0, len(scenes), chunk_size)
+    ]
+
+    samples: List[Dict] = []
+    with tqdm(total=len(scenes)) as progress:
+        if num_workers > 1:
+            with Pool(num_workers, _load_engine, engine_args) as pool:
+                for num_scenes, chunk_samples in pool.imap(synthesize_chunk, chunks):
+                    samples.extend(chunk_samples)
+                    progress.update(num_scenes)
+        else:
+            _load_engine(*engine_args)
+            for chunk in chunks:
+                num_scenes, chunk_samples = synthesize_chunk(chunk)
+                samples.extend(chunk_samples)
+                progress.update(num_scenes)
+
+    for question_index, sample in enumerate(samples):
+        sample["question_index"] = question_index
+    return samples
+
+
+def main(args):
+    begin = args.scene_start_idx
+    end = args.scene_start_idx + args.num_scenes if args.num_scenes > 0 else None
+    if args.input_scene_store is not None:
+        from scene_store import SceneStore
+
+        scene_store = SceneStore.open(args.input_scene_store)
+        scene_info = scene_store.info
+        scenes = [
+            scene_store.scene_struct(i) for i in range(len(scene_store))[begin:end]
+        ]
+    else:
+        with open(args.input_scene_file, "r") as f:
+            scene_data = json.load(f)
+        scene_info = scene_data["info"]
+        scenes = scene_data["scenes"][begin:end]
+
+    start = time.perf_counter()
+    samples = synthesize(
+        scenes,
+        args.metadata_file,
+        args.synonyms_json,
+        args.template_dir,
+        args.templates_per_image,
+        args.instances_per_template,
+        args.families,
+        args.num_workers,
+        args.chunk_size,
+        args.seed,
+    )
+    seconds = time.perf_counter() - start
+    print(
+        "Synthesized %d samples for %d scenes (%.1f samples/s/core)"
+        % (len(samples), len(scenes), len(samples) / seconds / args.num_workers)
+    )
+
+    data = {"info": scene_info, "questions": samples}
+    with open(args.output_explanations_file, "w") as f:
+        print("Writing output to %s" % args.output_explanations_file)
+        json.dump(data, f)
+    return data
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
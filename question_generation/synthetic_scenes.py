@@ -0,0 +1,211 @@
+# generates synthetic CLEVR scene graphs, e.g. for benchmarks and scale tests without the CLEVR download
+
+import argparse
+import json
+import math
+import random
+from typing import Dict, List
+
+from custom_types import Directions, Metadata, Object, Relationships, Scene_Struct
+
+"""
+Synthetic scenes follow the layout of CLEVR_*_scenes.json: objects are sampled from the
+attribute types in metadata.json and placed on the ground plane, afterwards the spatial
+relationships are computed the same way as the CLEVR renderer does. Thus, the scenes can be
+used with question_engine and filters like any real CLEVR scene.
+
+In contrast to CLEVR (3 to 10 objects), any number of objects can be generated; the ground
+plane grows with the number of objects, so that they do not overlap.
+
+Example:
+    python synthetic_scenes.py --num_scenes 100 --min_objects 3 --max_objects 50 \\
+        --output_scene_file ../output/CLEVR_synthetic_scenes.json
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--metadata_file", default="metadata.json")
+parser.add_argument(
+    "--output_scene_file", default="../output/CLEVR_synthetic_scenes.json"
+)
+parser.add_argument("--num_scenes", default=100, type=int)
+parser.add_argument("--min_objects", default=3, type=int)
+parser.add_argument("--max_objects", default=10, type=int)
+parser.add_argument("--split", default="synthetic")
+parser.add_argument("--seed", default=43, type=int)
+
+# camera dependent unit vectors of the CLEVR renderer (they are the same in all CLEVR scenes)
+DIRECTIONS: Directions = {
+    "above": [0.0, 0.0, 1.0],
+    "behind": [-0.754490315914154, 0.6563112735748291, 0.0],
+    "below": [-0.0, -0.0, -1.0],
+    "front": [0.754490315914154, -0.6563112735748291, -0.0],
+    "left": [-0.6563112735748291, -0.7544902563095093, 0.0],
+    "right": [0.6563112735748291, 0.7544902563095093, -0.0],
+}
+
+# object radius per size, as in the CLEVR renderer
+SIZE_TO_RADIUS = {"large": 0.7, "small": 0.35}
+
+# placement settings of the CLEVR renderer
+MIN_DIST = 0.25
+MARGIN = 0.4
+CLEVR_MAX_OBJECTS = 10
+CLEVR_PLANE_EXTENT = 3.0
+
+IMAGE_WIDTH, IMAGE_HEIGHT = 480, 320
+
+
+def plane_extent(num_objects: int) -> float:
+    """half the side length of the ground plane. It grows with sqrt(num_objects) beyond the CLEVR object count, to keep the object density constant"""
+    return CLEVR_PLANE_EXTENT * math.sqrt(max(1.0, num_objects / CLEVR_MAX_OBJECTS))
+
+
+def project_to_pixels(coords: List[float], extent: float) -> List[float]:
+    """rough stand in for the camera projection: maps the plane onto the image, the third value is the depth"""
+    right = sum(c * d for c, d in zip(coords, DIRECTIONS["right"]))
+    behind = sum(c * d for c, d in zip(coords, DIRECTIONS["behind"]))
+    x = IMAGE_WIDTH / 2 + right / (2 * extent) * IMAGE_WIDTH
+    y = IMAGE_HEIGHT / 2 - behind / (2 * extent) * IMAGE_HEIGHT
+    depth = 10.0 - behind
+    return [round(x), round(y), depth]
+
+
+def position_is_valid(
+    x: float, y: float, r: float, positions: List[List[float]]
+) -> bool:
+    """checks that a new object neither overlaps nor is ambiguously placed in any cardinal direction (c.f. CLEVR renderer)"""
+    for (xx, yy, rr) in positions:
+        dx, dy = x - xx, y - yy
+        if math.sqrt(dx * dx + dy * dy) - r - rr < MIN_DIST:
+            return False
+        for name in ["left", "right", "front", "behind"]:
+            direction_x, direction_y, _ = DIRECTIONS[name]
+            margin = dx * direction_x + dy * direction_y
+            if 0 < margin < MARGIN:
+                return False
+    return True
+
+
+def sample_objects(
+    metadata: Metadata, num_objects: int, max_retries: int = 50
+) -> List[Object]:
+    """samples the attributes and positions of num_objects objects"""
+    extent = plane_extent(num_objects)
+    positions: List[List[float]] = []
+    objects = []
+    for _ in range(num_objects):
+        obj = {
+            attr.lower(): random.choice(metadata["types"][attr])
+            for attr in ["Size", "Color", "Material", "Shape"]
+        }
+        r = SIZE_TO_RADIUS.get(obj["size"], 0.5)
+
+        # the CLEVR renderer starts over in this case, we instead keep the last try, as a denser
+        # scene is preferable over a (potentially) endless loop for large object counts
+        for _ in range(max_retries):
+            x = random.uniform(-extent, extent)
+            y = random.uniform(-extent, extent)
+            if position_is_valid(x, y, r, positions):
+                break
+        positions.append([x, y, r])
+
+        coords = [x, y, r]
+        objects.append(
+            {
+                **obj,
+                "rotation": 360.0 * random.random(),
+                "3d_coords": coords,
+                "pixel_coords": project_to_pixels(coords, extent),
+            }
+        )
+    return objects  # type: ignore
+
+
+def compute_all_relationships(
+    objects: List[Object], directions: Directions = DIRECTIONS, eps: float = 0.2
+) -> Relationships:
+    """
+    Computes relationships between all pairs of objects in the scene (same as the CLEVR renderer).
+
+    Returns a dictionary mapping string relationship names to lists of lists of integers,
+    where output[rel][i] gives a list of object indices that have the relationship rel with object i.
+    For example if j is in output['left'][i] then object j is left of object i.
+    """
+    all_relationships = {}
+    for name, direction_vec in directions.items():
+        if name == "above" or name == "below":
+            continue
+        all_relationships[name] = []
+        for i, obj1 in enumerate(objects):
+            coords1 = obj1["3d_coords"]
+            related = set()
+            for j, obj2 in enumerate(objects):
+                if i == j:
+                    continue
+                coords2 = obj2["3d_coords"]
+                diff = [coords2[k] - coords1[k] for k in [0, 1, 2]]
+                dot = sum(diff[k] * direction_vec[k] for k in [0, 1, 2])
+                if dot > eps:
+                    related.add(j)
+            all_relationships[name].append(sorted(list(related)))
+    return all_relationships  # type: ignore
+
+
+def generate_scene(
+    metadata: Metadata,
+    num_objects: int,
+    image_index: int = 0,
+    split: str = "synthetic",
+) -> Scene_Struct:
+    """generates a single scene graph with num_objects objects"""
+    assert num_objects > 0, "a scene needs at least one object"
+    objects = sample_objects(metadata, num_objects)
+    return {  # type: ignore
+        "split": split,
+        "image_index": image_index,
+        "image_filename": f"CLEVR_{split}_{image_index:06d}.png",
+        "objects": objects,
+        "relationships": compute_all_relationships(objects),
+        "directions": DIRECTIONS,
+    }
+
+
+def generate_scenes(
+    metadata: Metadata,
+    num_scenes: int,
+    min_objects: int = 3,
+    max_objects: int = 10,
+    split: str = "synthetic",
+    start_idx: int = 0,
+) -> List[Scene_Struct]:
+    """generates num_scenes scenes, each with a uniformly sampled number of objects in [min_objects, max_objects]"""
+    assert 0 < min_objects <= max_objects
+    return [
+        generate_scene(
+            metadata, random.randint(min_objects, max_objects), image_index, split
+        )
+        for image_index in range(start_idx, start_idx + num_scenes)
+    ]
+
+
+def main(args) -> Dict:
+    random.seed(args.seed)
+    with open(args.metadata_file, "r") as f:
+        metadata = json.load(f)
+
+    scenes = generate_scenes(
+        metadata, args.num_scenes, args.min_objects, args.max_objects, args.split
+    )
+    data = {
+        "info": {"split": args.split, "version": "synthetic", "seed": args.seed},
+        "scenes": scenes,
+    }
+    with open(args.output_scene_file, "w") as f:
+        print("Writing output to %s" % args.output_scene_file)
+        json.dump(data, f)
+
+    return data
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
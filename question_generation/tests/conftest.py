@@ -0,0 +1,4 @@
+import os
+
+# the tests check every pre- and post-condition (c.f. conditions.py)
+os.environ.setdefault("CLEVRX_CONTRACTS", "full")
@@ -0,0 +1,23 @@
+import random
+
+from answer_distribution import AnswerDistribution
+
+
+def test_order_statistics_match_sorting():
+    random.seed(0)
+    answers = ["cube", "sphere", "cylinder", True, 3]
+    distribution = AnswerDistribution(answers)
+    counts = {a: 0 for a in answers}
+    for step in range(500):
+        if step % 150 == 149:
+            distribution.reset()
+            counts = {a: 0 for a in answers}
+        # skewed, so that the counts of the answers differ
+        answer = random.choice(answers[: random.randint(1, len(answers))])
+        distribution.add(answer)
+        counts[answer] += 1
+
+        counts_sorted = sorted(counts.values())
+        assert distribution[answer] == counts[answer]
+        assert distribution.median() == counts_sorted[len(counts_sorted) // 2]
+        assert distribution.second_largest() == counts_sorted[-2]
@@ -0,0 +1,83 @@
+import json
+
+from compare_datasets import compare_datasets, compare_samples, is_identical
+
+
+def make_samples(num_questions):
+    return [
+        {
+            "question_index": i,
+            "template_filename": "zero_hop.json",
+            "question_family_index": i % 2,
+            "factual_explanation": [f"There is cube {i}.", f"There is block {i}."],
+            "counter_factual_explanation": [],
+        }
+        for i in range(num_questions)
+    ]
+
+
+def write(path, samples):
+    with open(path, "w") as f:
+        json.dump({"info": {}, "questions": samples}, f)
+    return str(path)
+
+
+def test_compare_samples_ignores_order():
+    published = {"answer": "yes", "factual_explanation": ["a", "b"]}
+    assert (
+        compare_samples(published, {**published, "factual_explanation": ["b", "a"]}, [])
+        == {}
+    )
+    assert compare_samples(published, {**published, "answer": "no"}, []) == {
+        "answer": ["yes", "no"]
+    }
+    assert compare_samples(published, {**published, "answer": "no"}, ["answer"]) == {}
+
+
+def test_compare_samples_keeps_the_order_of_programs():
+    program = [
+        {"type": "scene", "inputs": []},
+        {"type": "filter_color", "inputs": [0], "side_inputs": ["red"]},
+        {"type": "filter_shape", "inputs": [1], "side_inputs": ["cube"]},
+    ]
+    published = {"program": program, "factual_explanation": ["a"]}
+    reordered = [program[0], program[2], program[1]]
+    assert compare_samples(published, {**published, "program": reordered}, []) == {
+        "program": [program, reordered]
+    }
+    duplicated = program + [program[-1]]
+    assert list(
+        compare_samples(published, {**published, "program": duplicated}, [])
+    ) == ["program"]
+
+
+def test_identical_datasets_in_different_order(tmp_path):
+    samples = make_samples(20)
+    reordered = [
+        {**s, "factual_explanation": s["factual_explanation"][::-1]}
+        for s in samples[::-1]
+    ]
+    published = write(tmp_path / "published.json", samples)
+    reproduced = write(tmp_path / "reproduced.json", reordered)
+
+    report = compare_datasets(published, reproduced, num_workers=2, chunk_size=3)
+    assert report["num_compared"] == 20
+    assert is_identical(report)
+
+
+def test_report_of_differences(tmp_path):
+    samples = make_samples(10)
+    changed = [dict(s) for s in samples[:-1]]
+    changed[3]["factual_explanation"] = ["Something else."]
+    changed[5]["counter_factual_explanation"] = ["ignored"]
+    published = write(tmp_path / "published.json", samples)
+    reproduced = write(tmp_path / "reproduced.json", changed)
+
+    report = compare_datasets(published, reproduced, chunk_size=4)
+    assert not is_identical(report)
+    assert report["only_published"] == [9] and report["only_reproduced"] == []
+    assert report["num_different"] == 1
+    assert report["different_per_family"] == {"zero_hop.json 1": 1}
+    (difference,) = report["differences"]
+    assert difference["question_index"] == 3
+    assert list(difference["differences"]) == ["factual_explanation"]
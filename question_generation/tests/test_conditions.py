@@ -0,0 +1,42 @@
+import pytest
+
+import conditions
+from conditions import contract_level, pre_condition, set_contract_level
+
+
+@pytest.fixture
+def level():
+    previous = contract_level()
+    yield set_contract_level
+    set_contract_level(previous)
+
+
+def positive(x):
+    return x
+
+
+def test_full_checks_every_call(level):
+    level("full")
+    checked = pre_condition(lambda x: x > 0)(positive)
+    assert checked(1) == 1
+    with pytest.raises(AssertionError, match="Pre-Condition"):
+        checked(-1)
+
+
+def test_sampled_checks_every_nth_call(level, monkeypatch):
+    level("sampled")
+    monkeypatch.setattr(conditions, "SAMPLE_EVERY", 3)
+    calls = []
+    checked = pre_condition(lambda x: calls.append(x) or True)(positive)
+    for x in range(7):
+        checked(x)
+    assert calls == [0, 3, 6]
+
+
+def test_off_returns_the_function(level):
+    level("off")
+    assert pre_condition(lambda x: x > 0)(positive) is positive
+    level("full")
+    checked = pre_condition(lambda x: x > 0)(positive)
+    level("off")
+    assert checked(-1) == -1
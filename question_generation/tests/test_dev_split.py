@@ -0,0 +1,66 @@
+import json
+import os
+import random
+
+from dev_split import in_memory_split, streaming_split
+from explanations_reader import ExplanationsReader
+
+
+def write_explanations(path, info={"split": "train", "version": "1.0"}, **kwargs):
+    random.seed(0)
+    images = list(range(40))
+    random.shuffle(images)
+    samples = [
+        {
+            "image_index": image,
+            "question": f"Question {q} about image {image} with ünicode?",
+            "factual_explanation": ["There is a cube.", "It is red."],
+        }
+        for image in images
+        for q in range(random.randint(1, 4))
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"info": info, "questions": samples}, f, **kwargs)
+
+
+def read_outputs(path):
+    return {fn: open(os.path.join(path, fn), "rb").read() for fn in os.listdir(path)}
+
+
+def split_both_ways(tmp_path, source):
+    in_memory_dir, streaming_dir = tmp_path / "in_memory", tmp_path / "streaming"
+    in_memory_dir.mkdir()
+    streaming_dir.mkdir()
+
+    random.seed(43)
+    with open(source, encoding="utf-8") as f:
+        in_memory_split(json.load(f), str(in_memory_dir), "", "v1-recut", 0.2)
+    random.seed(43)
+    with ExplanationsReader(source) as reader:
+        streaming_split(reader, str(streaming_dir), "", "v1-recut", 0.2)
+    return read_outputs(in_memory_dir), read_outputs(streaming_dir)
+
+
+def test_streaming_split_is_identical(tmp_path):
+    source = str(tmp_path / "CLEVR_train_explanations_v1.json")
+    write_explanations(source)
+    in_memory, streaming = split_both_ways(tmp_path, source)
+    assert sorted(streaming) == [
+        "CLEVR_dev_explanations_v1-recut.json",
+        "CLEVR_dev_images_ids_v1-recut.pkl",
+        "CLEVR_train_explanations_v1-recut.json",
+        "CLEVR_train_images_ids_v1-recut.pkl",
+    ]
+    assert streaming == in_memory
+
+
+def test_streaming_split_with_non_ascii_info(tmp_path):
+    source = str(tmp_path / "CLEVR_train_explanations_v1.json")
+    # unescaped utf-8 in the info and the samples
+    write_explanations(
+        source, {"split": "train", "note": "Tübingen"}, ensure_ascii=False
+    )
+
+    in_memory, streaming = split_both_ways(tmp_path, source)
+    assert len(streaming) == 4
+    assert streaming == in_memory
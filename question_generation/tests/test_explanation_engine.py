@@ -0,0 +1,87 @@
+import random
+import threading
+
+import pytest
+
+import benchmark
+from explanation_engine import ExplanationEngine, make_server, request_explanations
+from scene_context import release_scene_caches
+from synthetic_scenes import generate_scene
+
+engine = ExplanationEngine()
+
+
+def make_questions(num_scenes=2, family="zero_hop.json"):
+    random.seed(43)
+    scenes, questions = [], []
+    for scene_idx in range(num_scenes):
+        scene_struct = generate_scene(engine.metadata, 6, scene_idx)
+        scenes.append(scene_struct)
+        for family_index, (key, template) in enumerate(engine.template_items):
+            if key[0] != family or key[1] > 3:
+                continue
+            question = benchmark.synthesize_question(
+                scene_struct,
+                template,
+                key,
+                family_index,
+                engine.metadata,
+                engine.synonyms,
+            )
+            if question is not None:
+                questions.append(question)
+        release_scene_caches(scene_struct)
+    return scenes, questions
+
+
+def test_explain_batch_matches_explain():
+    scenes, questions = make_questions()
+    assert len(questions) > 0
+    keys = [set(scene.keys()) for scene in scenes]
+
+    random.seed(1)
+    expected = [engine.explain(q, scenes[q["image_index"]]) for q in questions]
+    random.seed(1)
+    assert engine.explain_batch(questions, scenes) == expected
+    assert all(len(e) > 0 for e in expected)
+    # the caches of the scenes are released
+    assert [set(scene.keys()) for scene in scenes] == keys
+
+
+def test_explain_batch_without_scene():
+    scenes, questions = make_questions(num_scenes=1)
+    assert engine.explain_batch(questions, []) == [None] * len(questions)
+
+
+@pytest.fixture
+def server():
+    server = make_server(engine, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://%s:%d" % server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_server(server):
+    scenes, questions = make_questions(num_scenes=1)
+
+    random.seed(1)
+    expected = engine.explain_batch(questions, scenes)
+    random.seed(1)
+    payload = {"questions": questions, "scenes": scenes}
+    assert request_explanations(server, "/explain_batch", payload) == expected
+
+    random.seed(1)
+    expected = engine.explain(questions[0], scenes[0])
+    random.seed(1)
+    payload = {"question": questions[0], "scene": scenes[0]}
+    assert request_explanations(server, "/explain", payload) == expected
+
+
+def test_server_rejects_malformed_requests(server):
+    from urllib.error import HTTPError
+
+    with pytest.raises(HTTPError) as error:
+        request_explanations(server, "/explain", {"question": {}})
+    assert error.value.code == 400
@@ -0,0 +1,84 @@
+import json
+import os
+import pickle
+
+import explanations_reader
+from explanations_reader import ExplanationsReader, load_image_ids
+
+
+def make_samples(num_images, questions_per_image):
+    return [
+        {
+            "image_index": image,
+            "image_filename": f"CLEVR_train_{image:06d}.png",
+            "question": f"Is there a thing on image {image}?",
+            "question_index": image * questions_per_image + q,
+            "factual_explanation": ["There is a large cube."] * (q + 1),
+        }
+        for image in [3, 1, 2, 0][:num_images]
+        for q in range(questions_per_image)
+    ]
+
+
+def write_explanations(path, samples, info={"split": "train"}, **kwargs):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"info": info, "questions": samples}, f, **kwargs)
+
+
+def test_random_access(tmp_path, monkeypatch):
+    # samples span several windows
+    monkeypatch.setattr(explanations_reader, "WINDOW_SIZE", 64)
+    path = str(tmp_path / "CLEVR_train_explanations.json")
+    samples = make_samples(4, 3)
+    write_explanations(path, samples)
+    with ExplanationsReader(path) as reader:
+        assert reader.info == {"split": "train"}
+        assert len(reader) == len(samples)
+        assert reader[4] == samples[4] and reader[-1] == samples[-1]
+        assert list(reader) == samples
+        assert reader.image(1) == [s for s in samples if s["image_index"] == 1]
+        assert reader.question(7) == [s for s in samples if s["question_index"] == 7]
+        assert reader.image(42) == []
+
+    # the lookups above keep views of the index, close has to release them
+    assert reader._buffer.closed and reader._index_buffer.closed
+
+
+def test_non_ascii_and_indented_files(tmp_path):
+    path = str(tmp_path / "explanations.json")
+    samples = make_samples(2, 2)
+    samples[0]["question"] = "Is there a größer cube?"
+    info = {"split": "train", "note": "Tübingen"}
+    write_explanations(path, samples, info, indent=2, ensure_ascii=False)
+
+    with ExplanationsReader(path) as reader:
+        assert list(reader) == samples
+        assert reader.info == info
+
+
+def test_subset_of_split(tmp_path):
+    path = str(tmp_path / "explanations.json")
+    samples = make_samples(4, 2)
+    write_explanations(path, samples)
+    with open(tmp_path / "dev_images_ids.pkl", "wb") as f:
+        pickle.dump({0, 3}, f)
+
+    dev_ids = load_image_ids(str(tmp_path / "dev_images_ids.pkl"))
+    with ExplanationsReader(path) as reader:
+        assert list(reader.subset(dev_ids)) == [
+            s for s in samples if s["image_index"] in [0, 3]
+        ]
+
+
+def test_index_is_rebuilt_after_changes(tmp_path):
+    path = str(tmp_path / "explanations.json")
+    write_explanations(path, make_samples(2, 2))
+    with ExplanationsReader(path) as reader:
+        assert len(reader) == 4
+    assert os.path.exists(path + ".index")
+    with ExplanationsReader(path) as reader:
+        assert len(reader) == 4
+
+    write_explanations(path, make_samples(3, 3))
+    with ExplanationsReader(path) as reader:
+        assert len(reader) == 9
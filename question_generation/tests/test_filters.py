@@ -116,3 +116,33 @@ def test_derive_cf_relations():
         ("right", ('', '', '', '')),
         ("left", ('', '', '', ''))
         ], "attribute filters with a spatial relation must yield all attribute variants and empty variants combined with all other spatial relations."
+
+
+def test_iter_cf_attributes_order():
+    from itertools import chain, combinations
+
+    filters = ("large", "red", "metal", "thing")
+    used = [f for f in filters if f not in ["", "thing"]]
+    powerset = chain.from_iterable(combinations(used, r) for r in range(len(used) + 1))
+    expected = [tuple(f if f in s else "" for f in filters) for s in powerset][::-1]
+
+    assert list(iter_cf_attributes(filters)) == expected
+    assert list(iter_cf_attributes(filters, general_first=True)) == expected[::-1]
+    assert list(iter_cf_relations(("left",) + filters, general_first=True)) == derive_cf_relations(("left",) + filters)[::-1]
+
+
+def test_prune_cf_variants():
+    objects = [("large", "red", "cube"), ("small", "red", "sphere"), ("small", "blue", "cylinder")]
+    matches = lambda variant: [i for i, obj in enumerate(objects) if all(v in ["", o] for v, o in zip(variant, obj))]
+    factual = ("large", "red", "cube")
+    variants = list(prune_cf_variants(iter_cf_attributes(factual, general_first=True), factual, matches))
+
+    # "large" and "cube" alone only match the factual object 0, so all their more specific variants
+    # are skipped, except the factual filter itself
+    assert variants == [
+        ("", "", ""),
+        ("large", "", ""),
+        ("", "red", ""),
+        ("", "", "cube"),
+        ("large", "red", "cube"),
+    ]
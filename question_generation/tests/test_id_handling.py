@@ -0,0 +1,33 @@
+import pytest
+
+from id_handling import (
+    Placeholder,
+    get_id,
+    group_by_id,
+    keep_attr_items_with_id,
+    lookup,
+    remove_id,
+    replace_id,
+)
+
+
+def test_placeholder_records():
+    assert lookup("<S3i0>") == Placeholder("<S>", "3i0", "3", "i0")
+    assert lookup("<Ccf>") == Placeholder("<C>", "cf", "", "cf")
+    assert lookup("<Z>") is lookup("<Z>")
+    assert get_id("<Z2>") == "2" and remove_id("<Z2>") == "<Z>"
+    with pytest.raises(AssertionError):
+        lookup("Z2")
+
+
+def test_replace_id():
+    assert replace_id("<Z2>") == "<Z>"
+    assert replace_id("<C2>", "cf") == "<Ccf>"
+    assert replace_id("<M>", 3) == "<M3>"
+    assert replace_id("<M>", 1) == "<M>"
+
+
+def test_queries_by_id():
+    filters = {"<Z2>": "", "<C>": "red", "<R2>": "left", "<S2>": "cube"}
+    assert keep_attr_items_with_id(filters, "2") == {"<Z2>": "", "<S2>": "cube"}
+    assert group_by_id(filters) == {"2": ["<Z2>", "<R2>", "<S2>"], "": ["<C>"]}
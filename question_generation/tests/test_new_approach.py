@@ -0,0 +1,36 @@
+import json
+
+from new_approach import synonym_index, understand_question
+
+with open("synonyms.json") as f:
+    synonyms = json.load(f)
+
+
+def test_synonym_index():
+    index = synonym_index(synonyms)
+    assert synonym_index(synonyms) is index
+    assert "thing" not in index.attributes and "left" not in index.attributes
+    assert index.relations["left"] == synonyms["left"]
+    assert index.canonical["ball"] == ["sphere"] and index.canonical["shiny"] == [
+        "metal"
+    ]
+
+
+def test_understand_question_uses_the_question_synonyms():
+    filter_evidence = [
+        ([("large", "red", "metal", "sphere")], ["<Z>", "<C>", "<M>", "<S>"])
+    ]
+    final_filters = {"<Z>": "large", "<C>": "", "<M>": "", "<S>": "sphere"}
+    question_synonyms = {"<S>": ["ball"], "<Z>": ["big"], "<S2>": ["block"]}
+
+    objects, relations = understand_question(
+        filter_evidence, final_filters, synonyms, question_synonyms
+    )
+    assert relations == {}
+    assert objects[""].objects[0].synonyms == {
+        "sphere": ["ball"],
+        "large": ["big"],
+        "metal": synonyms["metal"],
+    }
+    # the shared index is not changed
+    assert synonym_index(synonyms).attributes["sphere"] == ["sphere", "ball"]
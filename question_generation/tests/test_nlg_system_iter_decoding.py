@@ -0,0 +1,35 @@
+from itertools import permutations, product
+
+import pytest
+from nlg_system.iter_decoding import (
+    count_permutations,
+    nth_permutation,
+    nth_product_indices,
+)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 5])
+def test_nth_permutation_matches_itertools(n):
+    items = list("abcde")[:n]
+    all_permutations = list(permutations(items))
+    assert count_permutations(items) == len(all_permutations)
+    for i, permutation in enumerate(all_permutations):
+        assert nth_permutation(items, i) == permutation
+
+
+@pytest.mark.parametrize("radices", [[], [1], [3], [2, 3], [3, 1, 2, 2]])
+def test_nth_product_indices_matches_itertools(radices):
+    all_products = list(product(*[range(r) for r in radices]))
+    for i, indices in enumerate(all_products):
+        assert nth_product_indices(radices, i) == indices
+
+
+def test_nth_permutation_large_index():
+    items = list(range(40))
+    last = nth_permutation(items, count_permutations(items) - 1)
+    assert last == tuple(reversed(items))
+
+
+def test_nth_permutation_out_of_range():
+    with pytest.raises(AssertionError):
+        nth_permutation([1, 2, 3], 6)
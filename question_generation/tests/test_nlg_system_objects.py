@@ -1,5 +1,12 @@
 import pytest
-from nlg_system.objects import CLEVRObject, Objects
+from nlg_system.clauses import Relation
+from nlg_system.objects import (
+    CLEVRObject,
+    Objects,
+    describe,
+    share_synonyms,
+    synonym_table,
+)
 
 
 def test_object_creation():
@@ -132,3 +139,58 @@ def test_objects_variations_invalid_iter():
     with pytest.raises(AssertionError) as e_info:
         # there are only two possible iters
         objs.realize(iter=2)
+
+
+def test_objects_many_different_objects():
+    # 12! permutations, these must not be enumerated
+    shapes = ["cube", "sphere", "cylinder"]
+    colors = ["red", "green", "blue", "yellow"]
+    objs = Objects(
+        [
+            CLEVRObject("small", color, "rubber", shape)
+            for color in colors
+            for shape in shapes
+        ]
+    )
+    assert objs.max_iter == 479001600
+    realized = objs.realize(iter=objs.max_iter - 1)
+    assert realized.count(" and ") == 1
+    assert realized.count(", ") == 10
+
+
+def test_objects_many_objects_with_synonyms_beyond_maxsize():
+    import sys
+
+    synonyms = {"small": ["small", "tiny"], "cube": ["cube", "block"]}
+    colors = ["gray", "red", "blue", "green", "brown", "purple", "cyan", "yellow"]
+    objs = Objects(
+        [
+            CLEVRObject("small", color, "rubber", shape)
+            for color in colors
+            for shape in ["cube", "sphere", "cylinder"]
+        ],
+        synonyms=synonyms,
+    )
+    assert objs.max_iter > sys.maxsize
+    first, last = objs.realize(iter=0), objs.realize(iter=objs.max_iter - 1)
+    assert first.startswith("a small gray rubber cube")
+    assert last.startswith("a tiny yellow rubber cylinder")
+
+
+def test_objects_share_descriptions_and_synonym_tables():
+    synonyms = share_synonyms({"small": ["small", "tiny"], "cube": ["cube", "block"]})
+    objs_a = Objects.from_iterable([("small", "red", "metal", "cube")], synonyms)
+    objs_b = Objects.from_iterable([("small", "red", "metal", "cube")], synonyms)
+    obj_a, obj_b = objs_a.objects[0], objs_b.objects[0]
+    assert obj_a is not obj_b
+    assert obj_a.attrs is obj_b.attrs
+    assert obj_a.synonym_table is obj_b.synonym_table
+    assert Relation("left", synonyms).synonym_table is synonym_table(
+        ("left",), synonyms
+    )
+
+    # muting the attrs of one question does not change the shared description
+    objs_a.set_scene_settings({"objects": []}, ["color"], unique_descriptions=False)
+    assert obj_a.attrs["size"] == "EMPTY"
+    assert obj_b.attrs["size"] == "small"
+    assert describe("small", "red", "metal", "cube").attrs["size"] == "small"
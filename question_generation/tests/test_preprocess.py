@@ -0,0 +1,90 @@
+import json
+import random
+
+from preprocess import PreprocessedDataset, preprocess
+from synthetic_scenes import generate_scenes
+
+with open("metadata.json") as f:
+    metadata = json.load(f)
+
+
+def make_question(scene, idx, program):
+    return {
+        "split": scene["split"],
+        "image_index": scene["image_index"],
+        "image_filename": scene["image_filename"],
+        "question": f"Question {idx} about the thing?",
+        "answer": "yes" if idx % 2 == 0 else 3,
+        "program": program,
+        "question_family_index": idx % 5,
+        "question_index": idx,
+    }
+
+
+def write_dataset(tmp_path, questions, scenes):
+    path = str(tmp_path / "dataset.bin")
+    preprocess(
+        path,
+        {"info": {"split": "synthetic"}, "scenes": scenes},
+        {"info": {"version": "1.0"}, "questions": questions},
+        metadata,
+    )
+    return PreprocessedDataset(path)
+
+
+program = [
+    {"function": "scene", "inputs": [], "value_inputs": []},
+    {"function": "filter_color", "inputs": [0], "value_inputs": ["red"]},
+    {"function": "relate", "inputs": [1], "value_inputs": ["left"]},
+    {"function": "count", "inputs": [2], "value_inputs": []},
+]
+
+
+def test_questions_round_trip(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 3)
+    questions = [
+        make_question(scenes[i % 3], i, program[: 1 + i % len(program)])
+        for i in range(10)
+    ]
+    dataset = write_dataset(tmp_path, questions, scenes)
+
+    assert dataset.questions.header["columns"]["program"]["kind"] == "program"
+    assert dataset.questions.info == {"version": "1.0"}
+    assert len(dataset.questions) == len(questions)
+    # the key order matters for the output of generate_explanations.py
+    assert [json.dumps(q) for q in dataset.questions] == [
+        json.dumps(q) for q in questions
+    ]
+    assert dataset.scenes.scene_struct(1)["objects"][0]["color"] == (
+        scenes[1]["objects"][0]["color"]
+    )
+    dataset.close()
+
+
+def test_slices_are_views(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 2)
+    questions = [make_question(scenes[i % 2], i, program) for i in range(6)]
+    dataset = write_dataset(tmp_path, questions, scenes)
+
+    view = dataset.questions[2:5]
+    assert len(view) == 3
+    assert view[0] == questions[2] and view[-1] == questions[4]
+    assert list(view[1:]) == questions[3:5]
+    assert len(dataset.questions[4:100]) == 2
+    # the views have to be released before the file can be closed
+    del view
+    dataset.close()
+
+
+def test_irregular_programs_are_stored_as_json(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 1)
+    irregular = [{"type": "scene", "inputs": []}] + program[1:]
+    questions = [make_question(scenes[0], 0, irregular)]
+    dataset = write_dataset(tmp_path, questions, scenes)
+
+    assert dataset.questions.header["columns"]["program"]["kind"] == "json"
+    assert dataset.questions[0] == questions[0]
+    dataset.close()
@@ -0,0 +1,59 @@
+import random
+
+from nlg_system.objects import Objects
+from nlg_templates.same_relate import same_relate
+from realization_cache import RealizationCache, RealizedPlan, plan_signature
+
+synonyms = {"small": ["small", "tiny"], "sphere": ["sphere", "ball"]}
+id_to_attrs = {"s": {"required": ["color"], "extra": ["size"]}}
+
+
+def build():
+    filter_to_objects = {
+        "s": Objects.from_iterable([("small", "red", "rubber", "sphere")], synonyms),
+        "": Objects.from_iterable([("small", "blue", "metal", "cube")], synonyms),
+    }
+    plan = same_relate(0, filter_to_objects, {}, id_to_attrs)
+    return plan, filter_to_objects
+
+
+def realize_fresh(iters):
+    plan, _ = build()
+    return [plan.component.realize(plan.neg_evidence, iter=i) for i in iters]
+
+
+def test_realized_plan_matches_fresh_plans():
+    plan, filter_to_objects = build()
+    realized = RealizedPlan(plan, list(filter_to_objects.values()))
+    last = plan.component.max_iter - 1
+    # realizing the second sentence changes the determiner of the shared objects
+    for iters in [[0, last, 0], [last, 0, 0], [0, 0, last]]:
+        assert realized.realize(iters) == realize_fresh(iters)
+    assert realize_fresh([0])[0] != realize_fresh([last, 0])[1]
+
+
+def test_realized_plan_keeps_at_most_max_texts():
+    plan, filter_to_objects = build()
+    realized = RealizedPlan(plan, list(filter_to_objects.values()), max_texts=2)
+    iters = [0, 1, 2, 3, 1, 0]
+    for _ in range(2):
+        assert realized.realize(iters) == realize_fresh(iters)
+    assert len(realized.texts) == 2
+
+
+def test_cache_hits_keep_the_random_state():
+    cache = RealizationCache(4)
+    texts = []
+    for _ in range(2):
+        plan, filter_to_objects = build()
+        key = plan_signature(
+            ("same_relate.json", 0), filter_to_objects, {}, id_to_attrs
+        )
+        realized = cache.get(key)
+        if realized is None:
+            realized = RealizedPlan(plan, list(filter_to_objects.values()))
+            cache.put(key, realized)
+        random.seed(0)
+        texts.append(realized.sample())
+        texts.append(random.random())
+    assert cache.hits == 1 and texts[:2] == texts[2:]
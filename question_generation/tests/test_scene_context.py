@@ -0,0 +1,72 @@
+import json
+import random
+
+from nlg_system.objects import CLEVRObject
+from question_engine import relate_handler
+from scene_context import (group_questions_by_image, index_scenes,
+                           release_scene_caches, scene_context)
+from synthetic_scenes import generate_scene
+
+with open("metadata.json") as f:
+    metadata = json.load(f)
+
+
+def test_group_questions_by_image_keeps_order():
+    questions = [{"image_filename": fn} for fn in ["a", "a", "b", "b", "b", "a"]]
+    groups = list(group_questions_by_image(questions))
+
+    assert [fn for fn, _ in groups] == ["a", "b", "a"]
+    assert [[i for i, _ in group] for _, group in groups] == [[0, 1], [2, 3, 4], [5]]
+    assert list(group_questions_by_image([])) == []
+
+
+def test_index_scenes():
+    scenes = [{"image_filename": "a"}, {"image_filename": "b"}, {"image_filename": "a"}]
+    scenes_by_filename = index_scenes(scenes)
+    assert len(scenes_by_filename["a"]) == 2
+    assert scenes_by_filename["b"] == [scenes[1]]
+
+
+def test_scene_context_releases_caches():
+    random.seed(43)
+    scene_struct = generate_scene(metadata, 8)
+    keys = set(scene_struct.keys())
+
+    with scene_context(scene_struct, metadata):
+        assert "_filter_options" in scene_struct
+        assert "_same_color" in scene_struct
+        assert "_relationship_sets" in scene_struct
+
+    assert set(scene_struct.keys()) == keys
+
+
+def test_relate_handler_with_cached_sets():
+    random.seed(43)
+    scene_struct = generate_scene(metadata, 8)
+    inputs = [[0, 1]]
+    expected = list(
+        set(scene_struct["relationships"]["left"][0])
+        & set(scene_struct["relationships"]["left"][1])
+    )
+
+    with scene_context(scene_struct, metadata):
+        assert relate_handler(scene_struct, inputs, ["left"]) == expected
+        # the cached sets must not be modified by the handler
+        assert relate_handler(scene_struct, inputs, ["left"]) == expected
+
+
+def test_unique_descriptions_are_shared_within_scene():
+    random.seed(43)
+    scene_struct = generate_scene(metadata, 8)
+    obj = scene_struct["objects"][0]
+    attrs = [obj["size"], obj["color"], obj["material"], obj["shape"]]
+
+    first, second = CLEVRObject(*attrs), CLEVRObject(*attrs)
+    first.set_scene_settings(scene_struct, ["color"], unique=True)
+    second.set_scene_settings(scene_struct, ["color"], unique=True)
+
+    assert len(scene_struct["_unique_descriptions"]) == 1
+    assert second.describing_attrs == first.describing_attrs
+
+    release_scene_caches(scene_struct)
+    assert "_unique_descriptions" not in scene_struct
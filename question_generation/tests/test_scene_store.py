@@ -0,0 +1,96 @@
+import json
+import random
+
+import question_engine as qeng
+from filters import precompute_filter_options
+from scene_store import ATTRIBUTES, SceneStore
+from synthetic_scenes import generate_scenes
+
+with open("metadata.json") as f:
+    metadata = json.load(f)
+
+
+def write_store(tmp_path, scenes):
+    path = str(tmp_path / "scenes.bin")
+    SceneStore.write(path, scenes, metadata, {"split": "synthetic"})
+    return SceneStore.open(path)
+
+
+def test_round_trip(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 5, min_objects=1, max_objects=10)
+    store = write_store(tmp_path, scenes)
+
+    assert len(store) == 5
+    assert store.info == {"split": "synthetic"}
+    for i, scene in enumerate(scenes):
+        stored = store.scene_struct(i)
+        assert stored["image_filename"] == scene["image_filename"]
+        assert stored["image_index"] == scene["image_index"]
+        assert stored["relationships"] == scene["relationships"]
+        assert stored["objects"] == [
+            {attr: obj[attr] for attr in ATTRIBUTES} for obj in scene["objects"]
+        ]
+        assert store.num_objects(i) == len(scene["objects"])
+    store.close()
+
+
+def test_filter_options_are_identical(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 3)
+    store = write_store(tmp_path, scenes)
+
+    for i, scene in enumerate(scenes):
+        stored = store.scene_struct(i)
+        precompute_filter_options(scene, metadata)
+        precompute_filter_options(stored, metadata)
+        assert stored["_filter_options"] == scene["_filter_options"]
+        for attr in ATTRIBUTES:
+            # the stored scene is read through its columns
+            assert stored.columns[attr] == [obj[attr] for obj in scene["objects"]]
+            assert qeng.get_same_attr_cache(stored, attr) == qeng.get_same_attr_cache(
+                scene, attr
+            )
+            nodes = [
+                {"type": "scene", "inputs": []},
+                {
+                    "type": f"filter_{attr}",
+                    "inputs": [0],
+                    "side_inputs": [scene["objects"][0][attr]],
+                },
+            ]
+            assert qeng.answer_question(
+                {"nodes": nodes}, metadata, stored, cache_outputs=False
+            ) == qeng.answer_question({"nodes": nodes}, metadata, scene)
+    store.close()
+
+
+def test_shared_memory(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 3)
+    store = write_store(tmp_path, scenes)
+
+    shm = store.to_shared_memory()
+    try:
+        attached = SceneStore.attach(shm.name)
+        assert attached.scene_struct(2) == store.scene_struct(2)
+        attached.close()
+    finally:
+        shm.close()
+        shm.unlink()
+    store.close()
+
+
+def test_index_scenes(tmp_path):
+    random.seed(43)
+    scenes = generate_scenes(metadata, 4)
+    store = write_store(tmp_path, scenes)
+
+    scenes_by_filename = store.index_scenes(1, 3)
+    assert list(scenes_by_filename) == [s["image_filename"] for s in scenes[1:3]]
+    assert scenes_by_filename.get(scenes[0]["image_filename"], []) == []
+    (stored,) = scenes_by_filename[scenes[2]["image_filename"]]
+    assert stored["relationships"] == scenes[2]["relationships"]
+    # the scene is decoded once for all of its lookups
+    assert scenes_by_filename[scenes[2]["image_filename"]][0] is stored
+    store.close()
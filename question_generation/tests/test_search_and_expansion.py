@@ -0,0 +1,49 @@
+import random
+
+import benchmark
+import question_engine as qeng
+from search_and_expansion import compile_constraints, do_dfs
+from synthetic_scenes import generate_scene
+
+metadata, synonyms, templates = benchmark.load_resources(
+    "metadata.json", "synonyms.json", "CLEVR_1.0_templates"
+)
+
+
+def violates(constraint, state, outputs):
+    """all constraints evaluated on the whole state"""
+    if constraint["type"] == "NULL":
+        v = state["vals"].get(constraint["params"][0])
+        return v is not None and v not in ["", "thing"]
+    i, j = (state["input_map"].get(p) for p in constraint["params"])
+    return i is not None and j is not None and outputs[i] == outputs[j]
+
+
+def test_compiled_constraints_are_attached_to_their_nodes():
+    template = templates[("same_relate.json", 0)]
+    checkers = compile_constraints(template, verbose=False)
+    # the only constraint is NULL on <Z>, which is checked when its node is added
+    (z_node,) = [
+        i for i, n in enumerate(template["nodes"]) if "<Z>" in n.get("side_inputs", [])
+    ]
+    assert [len(c) for c in checkers] == [
+        int(i == z_node) for i in range(len(template["nodes"]))
+    ]
+
+
+def test_final_states_satisfy_all_constraints():
+    random.seed(43)
+    scene_struct = generate_scene(metadata, 8)
+    for key, template in templates.items():
+        if len(template["constraints"]) == 0 or key[1] > 2:
+            continue
+        answer_counts = benchmark.empty_answer_counts(template, metadata)
+        _, final_states = do_dfs(
+            template, metadata, scene_struct, False, answer_counts, max_instances=20
+        )
+        for state in final_states:
+            outputs = qeng.answer_question(
+                {"nodes": state["nodes"]}, metadata, scene_struct, all_outputs=True
+            )
+            for constraint in template["constraints"]:
+                assert not violates(constraint, state, outputs), (key, constraint)
@@ -0,0 +1,79 @@
+import random
+
+from generate_explanations import realize_searches
+from scene_context import scene_context
+from search_results import (
+    RecordingRandom,
+    ReplayedRandom,
+    SearchWriter,
+    read_header,
+    read_searches,
+)
+from tests.test_explanation_engine import engine, make_questions
+
+
+def test_replayed_searches_reproduce_the_explanations(tmp_path):
+    scenes, questions = make_questions(family="one_hop.json")
+    assert len(questions) > 0
+    path = str(tmp_path / "search.jsonl.gz")
+    header = {"num_questions": len(questions)}
+
+    random.seed(1)
+    expected = [engine.explain(q, scenes[q["image_index"]]) for q in questions]
+    after = random.random()
+
+    random.seed(1)
+    with SearchWriter(path, header) as writer:
+        for i, question in enumerate(questions):
+            scene_struct = scenes[question["image_index"]]
+            with scene_context(scene_struct, engine.metadata):
+                search = engine.search_in_context(question, scene_struct)
+                rng = RecordingRandom()
+                ef = engine.realize_in_context(question, scene_struct, search, rng=rng)
+            assert ef == expected[i]
+            writer.write(i, search, rng.values)
+    # recording does not change the global random state
+    assert random.random() == after
+
+    assert read_header(path) == header
+    replayed = []
+    for i, search, randoms in read_searches(path):
+        scene_struct = scenes[questions[i]["image_index"]]
+        with scene_context(scene_struct, engine.metadata):
+            replayed.append(
+                engine.realize_in_context(
+                    questions[i], scene_struct, search, rng=ReplayedRandom(randoms)
+                )
+            )
+    assert replayed == expected
+
+
+def test_replayed_random_falls_back_to_its_seed():
+    rng = ReplayedRandom([0.5, 0.25], seed=3)
+    assert [rng.random(), rng.random()] == [0.5, 0.25]
+    assert rng.random() == random.Random(3).random()
+
+
+def test_realize_searches_skips_missing_scenes(tmp_path, capsys):
+    scenes, questions = make_questions(family="one_hop.json")
+    path = str(tmp_path / "search.jsonl")
+    with SearchWriter(path, {}) as writer:
+        for i, question in enumerate(questions):
+            scene_struct = scenes[question["image_index"]]
+            with scene_context(scene_struct, engine.metadata):
+                search = engine.search_in_context(question, scene_struct)
+                rng = RecordingRandom()
+                engine.realize_in_context(question, scene_struct, search, rng=rng)
+            writer.write(i, search, rng.values)
+
+    # the first scene is missing, the second one is loaded twice
+    scenes_by_filename = {scenes[1]["image_filename"]: [scenes[1], scenes[1]]}
+    assert realize_searches(engine, path, questions, scenes_by_filename) == []
+    assert capsys.readouterr().out.count("no matching scene graph loaded") == len(
+        questions
+    )
+
+    scenes_by_filename = {scenes[1]["image_filename"]: [scenes[1]]}
+    realized = realize_searches(engine, path, questions, scenes_by_filename)
+    assert len(realized) > 0
+    assert all(item["image_index"] == 1 for item in realized)
@@ -0,0 +1,67 @@
+import pytest
+
+import question_engine as qeng
+from explanation_engine import load_metadata
+from search_types import NodeCode, ProgramNode, SearchState, node_code
+from synthetic_scenes import generate_scene
+
+metadata = load_metadata("metadata.json")
+
+
+def test_program_node_reads_like_a_dict():
+    node = ProgramNode("filter_color", [0], ["red"])
+    assert node["type"] == "filter_color" and node["inputs"] == [0]
+    assert node.get("side_inputs", []) == ["red"]
+    assert "_output" not in node and node.get("_output") is None
+    with pytest.raises(KeyError):
+        node["_output"]
+    node["_output"] = [1, 2]
+    assert node.to_dict() == {
+        "type": "filter_color",
+        "inputs": [0],
+        "side_inputs": ["red"],
+        "_output": [1, 2],
+    }
+    assert node == node.to_dict()
+    assert "side_inputs" not in ProgramNode("scene", [])
+
+
+def test_node_codes_are_parsed_once():
+    assert node_code("amputated_intersect;3;5") == NodeCode(
+        "amputated_intersect", (3, 5)
+    )
+    assert node_code("count") is node_code("count")
+    node = ProgramNode("same_color", [0])
+    assert node.code == NodeCode("same_color", ())
+    node["type"] = "different_color"
+    assert node.code.type == "different_color" and "code" not in node.to_dict()
+
+    scene_struct = generate_scene(metadata, 5)
+    nodes = [
+        ProgramNode("scene", []),
+        ProgramNode("amputated_intersect;1;3", [0]),
+        ProgramNode("count", [1]),
+    ]
+    assert qeng.answer_question({"nodes": nodes}, metadata, scene_struct) == 2
+
+
+def test_answer_question_with_program_nodes():
+    scene_struct = generate_scene(metadata, 5)
+    color = scene_struct["objects"][0]["color"]
+    nodes = [
+        {"type": "scene", "inputs": []},
+        {"type": "filter_color", "inputs": [0], "side_inputs": [color]},
+        {"type": "count", "inputs": [1]},
+    ]
+    expected = qeng.answer_question({"nodes": nodes}, metadata, scene_struct)
+    program_nodes = [ProgramNode.from_dict(node) for node in nodes]
+    assert (
+        qeng.answer_question({"nodes": program_nodes}, metadata, scene_struct)
+        == expected
+    )
+    assert program_nodes[-1]["_output"] == expected
+
+    state = SearchState(program_nodes, {"<C>": color}, {0: 0, 1: 1, 2: 2}, 3)
+    assert "answer" not in state and state["vals"] == {"<C>": color}
+    state.answer = expected
+    assert state.to_dict()["nodes"] == [n.to_dict() for n in program_nodes]
@@ -0,0 +1,61 @@
+import json
+import pickle
+
+from explanations_reader import ExplanationsReader
+from split_engine import (
+    assign_folds,
+    assign_splits,
+    cross_validation,
+    split_paths,
+    write_splits,
+)
+
+image_indices = [i // 3 for i in range(3 * 50)]
+
+
+def test_assign_splits():
+    sizes = {"train": 0.8, "dev": 0.1, "test": 0.1}
+    assignment = assign_splits(image_indices, sizes, 1)
+
+    assert [len(images) for images in assignment.values()] == [40, 5, 5]
+    assert set().union(*assignment.values()) == set(range(50))
+    # the splits only depend on the set of images and the seed
+    assert assign_splits(image_indices, sizes, 1) == assignment
+    assert assign_splits(reversed(image_indices), sizes, 1) == assignment
+    assert assign_splits(image_indices, sizes, 2) != assignment
+
+
+def test_k_fold_cross_validation():
+    folds = assign_folds(image_indices, 3, 1)
+
+    assert list(folds) == ["fold0", "fold1", "fold2"]
+    assert sorted(len(images) for images in folds.values()) == [16, 17, 17]
+    rounds = cross_validation(folds)
+    assert len(rounds) == 3
+    for (train, dev), fold in zip(rounds, folds.values()):
+        assert dev == fold
+        assert train.isdisjoint(dev) and train | dev == set(range(50))
+
+
+def test_write_splits(tmp_path):
+    samples = [
+        {"image_index": i, "question": f"Question {n}?"}
+        for n, i in enumerate(image_indices)
+    ]
+    source = tmp_path / "CLEVR_train_explanations_v1.json"
+    with open(source, "w") as f:
+        json.dump({"info": {"split": "train"}, "questions": samples}, f)
+
+    folds = assign_folds(image_indices, 3, 1)
+    explanations_path, image_ids_path = split_paths(str(tmp_path), "", "v1-3fold")
+    with ExplanationsReader(str(source)) as reader:
+        num_samples = write_splits(reader, folds, explanations_path, image_ids_path)
+
+    assert sum(num_samples.values()) == len(samples)
+    for name, images in folds.items():
+        with open(explanations_path(name)) as f:
+            data = json.load(f)
+        assert data["info"] == {"split": "train"}
+        assert data["questions"] == [s for s in samples if s["image_index"] in images]
+        with open(image_ids_path(name), "rb") as f:
+            assert pickle.load(f) == images
@@ -0,0 +1,7 @@
+from startup_benchmark import benchmark_module
+
+
+def test_optional_dependencies_are_not_imported_on_startup():
+    result = benchmark_module("generate_explanations", repeats=1)
+    assert result["loaded_optional_dependencies"] == []
+    assert result["median_import_ms"] > 0
@@ -0,0 +1,81 @@
+import random
+
+import benchmark
+from explanations import run_explanation_filters
+from scene_context import release_scene_caches
+from search_and_expansion import do_dfs
+from sub_program_cache import SubProgramCache, cache_key, scene_id
+from synthetic_scenes import generate_scene
+
+metadata, synonyms, templates = benchmark.load_resources(
+    "metadata.json", "synonyms.json", "CLEVR_1.0_templates"
+)
+
+filter_nodes = [
+    {"type": "scene", "inputs": []},
+    {"type": "filter_color", "inputs": [0], "side_inputs": ["<C>"]},
+    {"type": "query_attributes", "inputs": [1]},
+]
+template = {"params": [{"name": "<C>", "type": "Color"}]}
+
+
+def test_lru_eviction():
+    cache = SubProgramCache(maxsize=2)
+    cache.put(("a",), 1)
+    cache.put(("b",), 2)
+    assert cache.get(("a",)) == 1
+    cache.put(("c",), 3)
+
+    assert cache.get(("b",)) is None, "b was the least recently used entry"
+    assert cache.get(("a",)) == 1 and cache.get(("c",)) == 3
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_cache_key_only_uses_values_of_the_sub_program():
+    scene_struct = generate_scene(metadata, 3)
+    key = cache_key(scene_struct, filter_nodes, template, {"<C>": "red", "<S>": "cube"})
+    other_shape = cache_key(scene_struct, filter_nodes, template, {"<C>": "red"})
+    other_color = cache_key(scene_struct, filter_nodes, template, {"<C>": "blue"})
+
+    assert key == other_shape
+    assert key != other_color
+
+
+def test_cache_key_contains_frozen_outputs():
+    scene_struct = generate_scene(metadata, 3)
+    frozen = lambda output: [
+        {"type": "frozen", "inputs": [], "_output": output},
+        {"type": "query_attributes", "inputs": [0]},
+    ]
+    assert cache_key(scene_struct, frozen([0, 1]), template, {}) != cache_key(
+        scene_struct, frozen([1]), template, {}
+    )
+
+
+def test_scene_id_changes_after_release():
+    scene_struct = generate_scene(metadata, 3)
+    first_id = scene_id(scene_struct)
+    assert scene_id(scene_struct) == first_id
+    release_scene_caches(scene_struct)
+    assert scene_id(scene_struct) != first_id
+
+
+def test_cached_explanation_filters_are_identical():
+    random.seed(43)
+    template = templates[("zero_hop.json", 0)]
+    scene_struct = generate_scene(metadata, 8)
+    answer_counts = benchmark.empty_answer_counts(template, metadata)
+    _, final_states = do_dfs(
+        template, metadata, scene_struct, False, answer_counts, max_instances=1
+    )
+
+    run = lambda cache: run_explanation_filters(
+        template, final_states, metadata, scene_struct, answer_counts, None, cache=cache
+    )
+    expected = run(None)
+
+    cache = SubProgramCache()
+    assert run(cache) == expected
+    assert run(cache) == expected
+    assert cache.hits > 0 and cache.hits == cache.misses
@@ -0,0 +1,41 @@
+import random
+
+from explanation_engine import load_metadata
+from synthesize import synthesize
+from synthetic_scenes import generate_scene
+
+metadata = load_metadata("metadata.json")
+
+
+def make_scenes(num_scenes):
+    random.seed(0)
+    return [generate_scene(metadata, 6, i) for i in range(num_scenes)]
+
+
+def test_synthesized_samples():
+    scenes = make_scenes(3)
+    random.seed(5)
+    samples = synthesize(scenes, families=["zero_hop.json"], templates_per_image=2)
+    # the random state of the caller is kept
+    assert random.random() == random.Random(5).random()
+    assert len(samples) == 6
+    assert [s["question_index"] for s in samples] == list(range(6))
+    for sample in samples:
+        assert sample["template_filename"] == "zero_hop.json"
+        assert len(sample["factual_explanation"]) > 0
+        assert sample["program"][0]["function"] == "scene"
+    # the caches of the scenes are released
+    assert all(not k.startswith("_") for scene in scenes for k in scene)
+
+
+def test_synthesis_does_not_depend_on_the_workers():
+    scenes = make_scenes(4)
+    run = lambda num_workers: synthesize(
+        scenes,
+        families=["zero_hop.json", "one_hop.json"],
+        templates_per_image=2,
+        num_workers=num_workers,
+        chunk_size=2,
+        seed=3,
+    )
+    assert run(1) == run(2)
@@ -0,0 +1,71 @@
+import json
+import random
+
+import pytest
+
+from filters import find_relate_filter_options
+from question_engine import relate_handler
+from synthetic_scenes import compute_all_relationships, generate_scene, generate_scenes
+
+with open("metadata.json") as f:
+    metadata = json.load(f)
+
+
+def test_generate_scene_objects():
+    scene_struct = generate_scene(metadata, 5)
+    assert len(scene_struct["objects"]) == 5
+    for obj in scene_struct["objects"]:
+        assert obj["size"] in metadata["types"]["Size"]
+        assert obj["color"] in metadata["types"]["Color"]
+        assert obj["material"] in metadata["types"]["Material"]
+        assert obj["shape"] in metadata["types"]["Shape"]
+        assert len(obj["3d_coords"]) == 3
+        assert len(obj["pixel_coords"]) == 3
+
+
+@pytest.mark.parametrize("num_objects", [3, 10, 50])
+def test_generate_scene_relationships_format(num_objects):
+    scene_struct = generate_scene(metadata, num_objects)
+    relationships = scene_struct["relationships"]
+    assert set(relationships.keys()) == {"left", "right", "front", "behind"}
+    for relation, related in relationships.items():
+        assert len(related) == num_objects
+        for i, idxs in enumerate(related):
+            assert i not in idxs, "objects must not be related to themselves"
+            assert idxs == sorted(idxs)
+
+
+def test_relationships_are_opposites():
+    scene_struct = generate_scene(metadata, 20)
+    relationships = scene_struct["relationships"]
+    for relation, opposite in [("left", "right"), ("front", "behind")]:
+        for i, idxs in enumerate(relationships[relation]):
+            for j in idxs:
+                assert i in relationships[opposite][j]
+
+
+def test_compute_all_relationships():
+    objects = [{"3d_coords": [0, 0, 0]}, {"3d_coords": [-1, -1, 0]}]
+    relationships = compute_all_relationships(objects)
+    assert relationships["left"] == [[1], []], "object 1 is left of object 0"
+    assert relationships["right"] == [[], [0]], "object 0 is right of object 1"
+
+
+def test_generate_scenes_object_counts():
+    random.seed(43)
+    scenes = generate_scenes(metadata, 20, min_objects=3, max_objects=50)
+    assert len(scenes) == 20
+    assert all(3 <= len(s["objects"]) <= 50 for s in scenes)
+    assert len(set(s["image_filename"] for s in scenes)) == 20
+
+
+def test_generated_scene_works_with_engine():
+    scene_struct = generate_scene(metadata, 15)
+    for relation in ["left", "right", "front", "behind"]:
+        assert relate_handler(scene_struct, [0], [relation]) == scene_struct[
+            "relationships"
+        ][relation][0]
+
+    options = find_relate_filter_options(0, scene_struct, metadata)
+    for (relation, _), idxs in options.items():
+        assert set(idxs) <= set(scene_struct["relationships"][relation][0])
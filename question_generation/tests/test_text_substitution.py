@@ -0,0 +1,39 @@
+import re
+
+from text_substitution import compile_text
+from text_templating import Q_PLACEHOLDER, fill_values_in_f_text_template
+
+PLACEHOLDER = re.compile(r"<[A-Z]\d*>")
+
+
+def test_render_replaces_every_placeholder_once():
+    calls = []
+
+    def fill_in(placeholder):
+        calls.append(placeholder)
+        return {"<C>": "red", "<S>": "cube"}.get(placeholder, "")
+
+    template = compile_text("Is there a <Z> <C>  <S>? The <C> one.", PLACEHOLDER)
+    assert template.placeholders == ["<Z>", "<C>", "<S>", "<C>"]
+    assert template.render(fill_in) == "Is there a red cube? The red one."
+    assert calls == ["<Z>", "<C>", "<S>"]
+    assert (
+        compile_text("Is there a <Z> <C>  <S>? The <C> one.", PLACEHOLDER) is template
+    )
+
+
+def test_render_keeps_texts_without_placeholders():
+    assert (
+        compile_text("no  placeholders", Q_PLACEHOLDER).render(str)
+        == "no  placeholders"
+    )
+
+
+def test_fill_values_in_f_text_template():
+    text = "There is a <Z2> <C2> <M2> <S2> and <V2> <A>."
+    replacements = {"<C2>": "red", "<S2>": "cube", "<V2>": "is", "<A>": "yes"}
+    synonyms = {"cube": ["block"]}
+    assert (
+        fill_values_in_f_text_template(text, synonyms, replacements, None)
+        == "There is a red block and is yes."
+    )
@@ -0,0 +1,54 @@
+# fills the placeholders of the text templates in a single pass
+
+import re
+from typing import Callable, Dict, List, Pattern, Tuple
+
+"""
+The text templates are filled in for every question, explanation and variant. Replacing one
+placeholder after the other (and normalizing the whitespace after each of them) rescans the whole
+text for every placeholder. Instead, a text is split once into its literal parts and placeholders
+(c.f. TextTemplate) and rendered with a single join, after which the whitespace is normalized once.
+
+The split texts are kept in a registry, so the texts of the templates (and the texts derived from
+them, e.g. the repeated brackets of the factual explanations) are only split on their first use.
+"""
+
+
+class TextTemplate:
+    """a text split into literal parts (at the even positions) and placeholders (at the odd positions)"""
+
+    __slots__ = ("text", "segments")
+
+    def __init__(self, text: str, pattern: Pattern) -> None:
+        self.text = text
+        # the pattern has no groups of its own, so splitting at the group keeps the placeholders
+        self.segments: List[str] = re.split(f"({pattern.pattern})", text)
+
+    @property
+    def placeholders(self) -> List[str]:
+        return self.segments[1::2]
+
+    def render(self, replacement: Callable[[str], str]) -> str:
+        """replaces every placeholder with replacement(placeholder) and normalizes the whitespace"""
+        if len(self.segments) == 1:
+            return self.text
+        replacements: Dict[str, str] = {}
+        parts = self.segments[:]
+        for i in range(1, len(parts), 2):
+            placeholder = parts[i]
+            value = replacements.get(placeholder)
+            if value is None:
+                value = replacements[placeholder] = replacement(placeholder)
+            parts[i] = value
+        return " ".join("".join(parts).split())
+
+
+_templates: Dict[Tuple[Pattern, str], TextTemplate] = {}
+
+
+def compile_text(text: str, pattern: Pattern) -> TextTemplate:
+    key = (pattern, text)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates[key] = TextTemplate(text, pattern)
+    return template
@@ -5,12 +5,23 @@ import re
 from typing import List
 
 from custom_types import State, Synonyms, Template
-from id_handling import get_id, replace_id
+from id_handling import get_id, lookup, replace_id
+from text_substitution import compile_text
 from text_template_handling import (other_heuristic,
                                     recursive_replace_optionals,
                                     remove_punctuation, replace_optionals)
 from utils import create_AST
 
+# the placeholders of the questions, factual and counter factual explanations
+Q_PLACEHOLDER = re.compile(r"<[AZCMSRV]\d*[cf|r|m|i]*\d*>")
+F_PLACEHOLDER = re.compile(r"<[AZCMSRVH]\d*[cf|r|m|i|si]*\d*>")
+CF_PLACEHOLDER = re.compile(r"<[ZCMSR][cf|r|m]*>")
+CF_BRACKET = re.compile(r"\([^)]*?<[ZCMSR][cf|r|m]*>.*?\)")
+F_BRACKET = re.compile(r"{(.*?<[ZCMSR]\d*[cf|r|m|i|s]*>.*?)}")
+WORD_PLACEHOLDER = re.compile(r"<[ZCMSR]\d*>")
+RELATIONS = ["left", "right", "behind", "front"]
+_relation_patterns = {}
+
 
 def get_synonym(attr, synonyms):
     return synonyms.get(attr, [attr])[0]
@@ -22,7 +33,7 @@ def zip_compare(orig_q, new_t):
     # iterate over the zipped words
     for orig_q_word, new_t_word in zip(orig_q.split(), new_t.split()):
         # check for a placeholder in the candidate word
-        placeholder_in_new_t_word = re.match("<[ZCMSR]\d*>", new_t_word)
+        placeholder_in_new_t_word = WORD_PLACEHOLDER.match(new_t_word)
         # and if it is, save the question word to the candidate dictionary
         if placeholder_in_new_t_word is not None:
             # hack a way plural version of spheres
@@ -85,8 +96,8 @@ def compute_question_synonyms(
         orig_q = remove_punctuation(question["question"])
 
         # condense relations to a single word
-        for relation in ["left", "right", "behind", "front"]:
-            orig_q = re.sub(f"({'|'.join(synonyms[relation])})", relation, orig_q)
+        for relation in RELATIONS:
+            orig_q = relation_pattern(synonyms, relation).sub(relation, orig_q)
 
         optional_other_templates = [
             [t.replace(" other", " [other]") for t in template["text"]]
@@ -99,6 +110,15 @@ def compute_question_synonyms(
     return q_synonyms, current_synonyms
 
 
+def relation_pattern(synonyms: Synonyms, relation: str):
+    """the (compiled) alternatives of the synonyms of a relation"""
+    key = (relation, tuple(synonyms[relation]))
+    pattern = _relation_patterns.get(key)
+    if pattern is None:
+        pattern = _relation_patterns[key] = re.compile(f"({'|'.join(key[1])})")
+    return pattern
+
+
 def get_relevant_nodes(template):
     filtered_template = [
         node
@@ -231,9 +251,9 @@ def fill_in_cf_templates(
 
                     # 2. Use contents of replacements dict to determine which {() and ()} to drop
                     cf_text = random.choice(template["text_cfexpl"])
-                    matches = re.findall("\([^)]*?<[ZCMSR][cf|r|m]*>.*?\)", cf_text)
+                    matches = CF_BRACKET.findall(cf_text)
                     for match in matches:
-                        placeholders = re.findall("<[ZCMSR][cf|r|m]*>", match)
+                        placeholders = CF_PLACEHOLDER.findall(match)
                         current_repl = [replacements.get(p, "") for p in placeholders]
                         if "".join(current_repl) == "":
                             cf_text = cf_text.replace(match, "")
@@ -241,15 +261,11 @@ def fill_in_cf_templates(
                     cf_text = replace_any_brackets(cf_text)
 
                     # 3. Replace the placeholders with the dict contents
-                    synonym = lambda word: get_synonym(word, synonyms)
-
-                    # iteration over all placeholders
-                    placeholders = re.findall("<[ZCMSR][cf|r|m]*>", cf_text)
-                    for placeholder in placeholders:
+                    def fill_in(placeholder):
                         none_value = "thing" if replace_id(placeholder) == "<S>" else ""
-                        replacement = synonym(replacements.get(placeholder, none_value))
-                        cf_text = cf_text.replace(placeholder, replacement)
-                        cf_text = " ".join(cf_text.split())
+                        return get_synonym(replacements.get(placeholder, none_value), synonyms)
+
+                    cf_text = compile_text(cf_text, CF_PLACEHOLDER).render(fill_in)
 
                     # 4. replace optionals
                     cf_text = replace_optionals(cf_text).capitalize()
@@ -349,7 +365,7 @@ def create_factual_explanation(
     variants = []
     for text in random.sample(text_templates, k=5):
         # find all { } brackets and iterate over them
-        matches = re.findall("{(.*?<[ZCMSR]\d*[cf|r|m|i|s]*>.*?)}", text)
+        matches = F_BRACKET.findall(text)
         for match in matches:
             text = handle_match(text, match, objs, fn, replacements)
 
@@ -371,20 +387,14 @@ def create_factual_explanation(
 def fill_values_in_f_text_template(text, synonyms, replacements, q_synonyms):
     # 3. Replace the placeholders with the dict contents
     # TODO: Create a joint method with cf explanations code, this is a duplicate / c.f.fill_values_in_q_text_template
-    synonym = lambda word: get_synonym(word, synonyms)
-
-    # iteration over all placeholders
-    placeholders = re.findall("<[AZCMSRVH]\d*[cf|r|m|i|si]*\d*>", text)
-    for placeholder in placeholders:
+    def fill_in(placeholder):
         none_value = "thing" if replace_id(placeholder) == "<S>" else ""
-        replacement = synonym(replacements.get(placeholder, none_value))
+        replacement = get_synonym(replacements.get(placeholder, none_value), synonyms)
 
         # if there is something to replace, check whether we know a better synonym from the questions
         if replacement != "" and q_synonyms is not None and not "s" in placeholder:
             # clean the placeholder
-            cleaned_placeholder = replace_id(
-                placeholder, re.match("(\d*)(s)*(i0)*", get_id(placeholder)).group(1)
-            )
+            cleaned_placeholder = replace_id(placeholder, lookup(placeholder).number)
 
             # check if we know a question specific synonym
             if q_synonyms.get(cleaned_placeholder, False):
@@ -395,10 +405,10 @@ def fill_values_in_f_text_template(text, synonyms, replacements, q_synonyms):
                     q_syn[0] in ["object", "thing"]
                 ):
                     replacement = q_syn[0]
+        return replacement
 
-        text = text.replace(placeholder, replacement)
-        text = " ".join(text.split())
-    return text
+    # all placeholders are replaced in a single pass
+    return compile_text(text, F_PLACEHOLDER).render(fill_in)
 
 
 def fill_values_in_q_text_template(state, synonyms, text):
@@ -406,17 +416,15 @@ def fill_values_in_q_text_template(state, synonyms, text):
   This function uses the values from a state to fill them into a text_template
   """
     # TODO: This is duplicate from the cf explanations code, also use synonyms for thing
-    synonym = lambda word: get_synonym(word, synonyms)
     values = state["vals"]
     replacements = {k: v for k, v in values.items() if v != ""}
 
-    # iteration over all placeholders
-    placeholders = re.findall("<[AZCMSRV]\d*[cf|r|m|i]*\d*>", text)
-    for placeholder in placeholders:
+    def fill_in(placeholder):
         none_value = "thing" if replace_id(placeholder) == "<S>" else ""
-        replacement = synonym(replacements.get(placeholder, none_value))
-        text = text.replace(placeholder, replacement)
-        text = " ".join(text.split())
+        return get_synonym(replacements.get(placeholder, none_value), synonyms)
+
+    # all placeholders are replaced in a single pass
+    text = compile_text(text, Q_PLACEHOLDER).render(fill_in)
 
     text = replace_optionals(text)
     text = other_heuristic(text, values)